@@ -1,124 +1,204 @@
-# Perceptron Algorithm 
-from random import seed
-from random import randrange
+# Perceptron Algorithm
+import argparse
+import random
+from concurrent.futures import ProcessPoolExecutor
 from csv import reader
 
-# Load a CSV file
+import numpy as np
+
+
+# Features as a float matrix, classes as integer labels and the class lookup
+class Dataset:
+
+    def __init__(self, X, y, lookup):
+        self.X = X
+        self.y = y
+        self.lookup = lookup
+
+    def __len__(self):
+        return len(self.y)
+
+    def take(self, index):
+        return Dataset(self.X[index], self.y[index], self.lookup)
+
+
+# Load a CSV file, all columns but the last are float features, the last one is the class
 def load_csv(filename):
-    dataset = list()
     with open(filename, 'r') as file:
-        csv_reader = reader(file)
-        for row in csv_reader:
-            if not row:
-                continue
-            dataset.append(row)
-    return dataset
-
-# Convert string column to float
-def str_column_to_float(dataset, column):
-    for row in dataset:
-        row[column] = float(row[column].strip())
-
-# Convert string column to integer
-def str_column_to_int(dataset, column):
-    class_values = [row[column] for row in dataset]
-    unique = set(class_values)
+        rows = [row for row in reader(file) if row]
+    features = np.array([[float(value.strip()) for value in row[:-1]] for row in rows])
+    y, lookup = str_column_to_int([row[-1] for row in rows])
+    return Dataset(features, y, lookup)
+
+
+# Convert string class values to integers. Classes are numbered in sorted order so
+# the mapping (and therefore training) does not change with string hashing.
+def str_column_to_int(class_values):
     lookup = dict()
-    for i, value in enumerate(unique):
+    for i, value in enumerate(sorted(set(class_values))):
         lookup[value] = i
-    for row in dataset:
-        row[column] = lookup[row[column]]
-    return lookup
-
-# Split a dataset into k folds
-def cross_validation_split(dataset, n_folds):
-    dataset_split = list()
-    dataset_copy = list(dataset)
-    fold_size = int(len(dataset) / n_folds)
-    for i in range(n_folds):
-        fold = list()
-        while len(fold) < fold_size:
-            index = randrange(len(dataset_copy))
-            fold.append(dataset_copy.pop(index))
-        dataset_split.append(fold)
-    return dataset_split
+    return np.array([lookup[value] for value in class_values], dtype=np.int64), lookup
+
+
+# Split row indices into k folds of equal size with one shuffle, O(n)
+def cross_validation_split(n_rows, n_folds, rng=None):
+    rng = np.random.default_rng() if rng is None else rng
+    fold_size = int(n_rows / n_folds)
+    order = rng.permutation(n_rows)
+    return [order[i * fold_size:(i + 1) * fold_size] for i in range(n_folds)]
+
+
+# Split row indices into k folds exactly like the original list.pop based split:
+# the same randrange draws pick the same rows, but the remaining rows live in a
+# Fenwick tree so every pick costs O(log n) instead of an O(n) list copy.
+def legacy_cross_validation_split(n_rows, n_folds, rand=random):
+    tree = [0] * (n_rows + 1)
+    for i in range(1, n_rows + 1):
+        tree[i] += 1
+        j = i + (i & -i)
+        if j <= n_rows:
+            tree[j] += tree[i]
+
+    top = 1
+    while top * 2 <= n_rows:
+        top *= 2
+
+    fold_size = int(n_rows / n_folds)
+    remaining = n_rows
+    folds = list()
+    for _ in range(n_folds):
+        fold = np.empty(fold_size, dtype=np.int64)
+        for f in range(fold_size):
+            # find the rank-th row that has not been picked yet
+            rank = rand.randrange(remaining)
+            pos = 0
+            step = top
+            while step:
+                if pos + step <= n_rows and tree[pos + step] <= rank:
+                    pos += step
+                    rank -= tree[pos]
+                step //= 2
+            fold[f] = pos
+
+            i = pos + 1
+            while i <= n_rows:
+                tree[i] -= 1
+                i += i & -i
+            remaining -= 1
+        folds.append(fold)
+    return folds
+
 
 # Calculate accuracy percentage
 def accuracy_metric(actual, predicted):
-    correct = 0
-    for i in range(len(actual)):
-        if actual[i] == predicted[i]:
-            correct += 1
-    return correct / float(len(actual)) * 100.0
-
-# Evaluate an algorithm using a cross validation split
-def evaluate_algorithm(dataset, algorithm, n_folds, *args):
-    folds = cross_validation_split(dataset, n_folds)
-    scores = list()
-    for fold in folds:
-        train_set = list(folds)
-        train_set.remove(fold)
-        train_set = sum(train_set, [])
-        test_set = list()
-        for row in fold:
-            row_copy = list(row)
-            test_set.append(row_copy)
-            row_copy[-1] = None
-        predicted = algorithm(train_set, test_set, *args)
-        actual = [row[-1] for row in fold]
-        accuracy = accuracy_metric(actual, predicted)
-        scores.append(accuracy)
-    return scores
-
-# Make a prediction with weights
-def predict(row, weights):
-    activation = weights[0]
-    for i in range(len(row)-1):
-        #print i
-        activation += weights[i + 1] * row[i]
-    return 1.0 if activation >= 0.0 else 0.0
-
-# Estimate Perceptron weights using stochastic gradient descent
-def train_weights(train, l_rate, n_epoch):
-    #print(train[0])
-    weights = [0.0 for i in range(len(train[0]))]
+    return np.count_nonzero(actual == predicted) / float(len(actual)) * 100.0
+
+
+# Bias plus weighted features, summed left to right like the original row loop so
+# results are bit for bit the same, but for all rows at once
+def activation(X, weights):
+    X = np.atleast_2d(X)
+    terms = np.empty((X.shape[0], X.shape[1] + 1))
+    terms[:, 0] = weights[0]
+    np.multiply(X, weights[1:], out=terms[:, 1:])
+    return np.add.accumulate(terms, axis=1)[:, -1]
+
+
+# Make predictions for every row with weights
+def predict(X, weights):
+    return np.where(activation(X, weights) >= 0.0, 1.0, 0.0)
+
+
+# Estimate Perceptron weights. With batch_size=1 this is the original stochastic
+# gradient descent, one update per row in order; larger batches (or None for the
+# whole training set) predict a batch with the same weights and apply the summed
+# update once per batch.
+def train_weights(train, l_rate, n_epoch, batch_size=1, verbose=False):
+    X, y = train.X, train.y
+    weights = np.zeros(X.shape[1] + 1)
+    batch_size = len(y) if batch_size is None else batch_size
+
+    terms = np.empty(X.shape[1] + 1)
     for epoch in range(n_epoch):
         sum_err = 0.0
-        for row in train:
-            prediction = predict(row, weights)
-            error = row[-1] - prediction
-            sum_err += error**2
-            weights[0] = weights[0] + l_rate * error
-            #print(weights[0])
-            for i in range(len(row)-1):
-                #print(i)
-                weights[i + 1] = weights[i + 1] + l_rate * error * row[i]
-
-        print(">epoch: %s, weights: %s, lrate: %s, err: %s" % (epoch, weights, l_rate, sum_err))
+        if batch_size == 1:
+            for row, target in zip(X, y):
+                # activation() for a single row, reusing one buffer
+                terms[0] = weights[0]
+                np.multiply(row, weights[1:], out=terms[1:])
+                prediction = 1.0 if np.add.accumulate(terms)[-1] >= 0.0 else 0.0
+                error = target - prediction
+                if error == 0:
+                    continue
+                sum_err += error**2
+                step = l_rate * error
+                weights[0] = weights[0] + step
+                weights[1:] += step * row
+        else:
+            for start in range(0, len(y), batch_size):
+                Xb = X[start:start + batch_size]
+                error = y[start:start + batch_size] - predict(Xb, weights)
+                sum_err += float(error @ error)
+                weights[0] += l_rate * error.sum()
+                weights[1:] += l_rate * (error @ Xb)
+
+        if verbose:
+            print(">epoch: %s, weights: %s, lrate: %s, err: %s" % (epoch, list(weights), l_rate, sum_err))
     return weights
 
+
 # Perceptron Algorithm With Stochastic Gradient Descent
-def perceptron(train, test, l_rate, n_epoch):
-    predictions = list()
-    weights = train_weights(train, l_rate, n_epoch)
-    for row in test:
-        prediction = predict(row, weights)
-        predictions.append(prediction)
-    return(predictions)
+def perceptron(train, test, l_rate, n_epoch, batch_size=1):
+    weights = train_weights(train, l_rate, n_epoch, batch_size)
+    return predict(test.X, weights)
+
+
+def _evaluate_fold(dataset, folds, i, algorithm, args):
+    train_index = np.concatenate([fold for j, fold in enumerate(folds) if j != i])
+    test_set = dataset.take(folds[i])
+    predicted = algorithm(dataset.take(train_index), test_set, *args)
+    return float(accuracy_metric(test_set.y, predicted))
+
+
+# Evaluate an algorithm using a cross validation split, one process per fold
+def evaluate_algorithm(dataset, algorithm, n_folds, *args, folds=None, workers=None):
+    folds = cross_validation_split(len(dataset), n_folds) if folds is None else folds
+    if workers == 1:
+        return [_evaluate_fold(dataset, folds, i, algorithm, args) for i in range(len(folds))]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_evaluate_fold, dataset, folds, i, algorithm, args) for i in range(len(folds))]
+        return [future.result() for future in futures]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Evaluate the Perceptron algorithm with k-fold cross validation')
+    parser.add_argument('filename', nargs='?', default='../sonar.all-data.csv')
+    parser.add_argument('--folds', type=int, default=3)
+    parser.add_argument('--l-rate', type=float, default=0.01)
+    parser.add_argument('--epochs', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=1, help='rows per weight update, 0 for the whole set')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--shuffle', action='store_true', help='use the O(n) shuffled split instead of the original one')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    # load and prepare data
+    dataset = load_csv(args.filename)
+    if args.shuffle:
+        folds = cross_validation_split(len(dataset), args.folds, np.random.default_rng(args.seed))
+    else:
+        random.seed(args.seed)
+        folds = legacy_cross_validation_split(len(dataset), args.folds)
+
+    # evaluate algorithm
+    batch_size = None if args.batch_size == 0 else args.batch_size
+    scores = evaluate_algorithm(dataset, perceptron, args.folds, args.l_rate, args.epochs, batch_size, folds=folds,
+                                workers=args.workers)
+    print('Scores: %s' % scores)
+    print('Mean Accuracy: %.3f%%' % (sum(scores)/float(len(scores))))
+
 
 # Test the Perceptron algorithm on the sonar dataset
-seed(1)
-# load and prepare data
-filename = '../sonar.all-data.csv'
-dataset = load_csv(filename)
-for i in range(len(dataset[0])-1):
-    str_column_to_float(dataset, i)
-# convert string class to integers
-str_column_to_int(dataset, len(dataset[0])-1)
-# evaluate algorithm
-n_folds = 3
-l_rate = 0.01
-n_epoch = 500
-scores = evaluate_algorithm(dataset, perceptron, n_folds, l_rate, n_epoch)
-print('Scores: %s' % scores)
-print('Mean Accuracy: %.3f%%' % (sum(scores)/float(len(scores))))
+if __name__ == '__main__':
+    main()
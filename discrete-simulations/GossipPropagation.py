@@ -0,0 +1,236 @@
+import argparse
+import csv
+import heapq
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from statistics import mean
+
+import numpy as np
+
+from NetworkPropagation import (MAX_LATENCY, MIN_LATENCY, barabasi_albert_edges, check_header, trial_rng,
+                                truncate_partial_row)
+
+PERCENTILES = [50, 90, 99]
+
+# a trial is identified by everything that went into it, so results of several
+# parameter sets can share one file
+SETUP_FIELDS = ["n", "m", "seed", "message_size", "bandwidth", "validation_delay", "fanout", "trial"]
+METRIC_FIELDS = ["p50", "p90", "p99", "full", "coverage"]
+RESULT_FIELDS = SETUP_FIELDS + METRIC_FIELDS
+
+
+class GossipParams:
+
+    def __init__(self, message_size=1e6, bandwidth=12.5e6, validation_delay=0.05, fanout=None):
+        # message size in bytes, upload bandwidth of every node in bytes per second,
+        # time a node spends validating a message before forwarding it (seconds),
+        # and how many neighbours it forwards to (None forwards to all of them)
+        self.message_size = message_size
+        self.bandwidth = bandwidth
+        self.validation_delay = validation_delay
+        self.fanout = fanout
+
+    def transmission_time(self):
+        return self.message_size / self.bandwidth
+
+    def as_row(self):
+        return {"message_size": self.message_size, "bandwidth": self.bandwidth,
+                "validation_delay": self.validation_delay, "fanout": self.fanout}
+
+    @classmethod
+    def from_row(cls, row):
+        fanout = None if row["fanout"] in (None, "") else int(row["fanout"])
+        return cls(float(row["message_size"]), float(row["bandwidth"]), float(row["validation_delay"]), fanout)
+
+
+def adjacency(n, src, dst, latency):
+    # undirected CSR adjacency: the neighbours of v are indices[indptr[v]:indptr[v + 1]]
+    # and the latency of those links sits at the same positions of link_latency
+    heads = np.concatenate([src, dst])
+    tails = np.concatenate([dst, src])
+    latencies = np.concatenate([latency, latency])
+
+    order = np.argsort(heads, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(heads, minlength=n), out=indptr[1:])
+    return indptr, tails[order], latencies[order]
+
+
+def simulate_gossip(indptr, indices, link_latency, params, rng, origin=0):
+    # Event-driven push gossip. Every event is a message arriving at a node. The
+    # first arrival is delivered: the node validates the message, then pushes it
+    # to its chosen neighbours one after another over its upload link, so later
+    # pushes queue behind earlier ones. Later arrivals are duplicates and dropped.
+    n = len(indptr) - 1
+    received = np.full(n, np.inf)
+    uplink_free = np.zeros(n)
+    tx = params.transmission_time()
+
+    events = [(0.0, origin, -1)]
+    while events:
+        t, node, sender = heapq.heappop(events)
+        if received[node] <= t:
+            continue
+        received[node] = t
+
+        start, end = indptr[node], indptr[node + 1]
+        positions = np.arange(start, end)
+        positions = positions[indices[positions] != sender]
+        if params.fanout is not None and len(positions) > params.fanout:
+            positions = rng.choice(positions, size=params.fanout, replace=False)
+
+        # link i finishes sending at ready + (i + 1) * tx on a free uplink
+        ready = max(t + params.validation_delay, uplink_free[node])
+        finished = ready + tx * np.arange(1, len(positions) + 1)
+        if len(positions) > 0:
+            uplink_free[node] = finished[-1]
+
+        arrivals = finished + link_latency[positions]
+        targets = indices[positions]
+        for arrival, target in zip(arrivals.tolist(), targets.tolist()):
+            # a neighbour that already has the message still costs upload time but
+            # needs no event
+            if received[target] > arrival:
+                heapq.heappush(events, (arrival, target, node))
+
+    return received
+
+
+def coverage_times(received, percentiles=PERCENTILES):
+    # time by which p percent of the nodes had the message; inf when gossip never
+    # reached that many nodes
+    times = np.sort(received)
+    n = len(times)
+    result = {}
+    for p in percentiles:
+        result["p%d" % p] = float(times[max(int(np.ceil(n * p / 100.0)) - 1, 0)])
+    result["full"] = float(times[-1])
+    result["coverage"] = float(np.isfinite(times).sum()) / n
+    return result
+
+
+def run_trial(n, m, trial, seed, params):
+    rng = trial_rng(seed, n, trial)
+    src, dst = barabasi_albert_edges(n, m, rng)
+    latency = rng.uniform(MIN_LATENCY, MAX_LATENCY, size=len(src))
+    indptr, indices, link_latency = adjacency(n, src, dst, latency)
+
+    received = simulate_gossip(indptr, indices, link_latency, params, rng)
+    row = coverage_times(received)
+    row.update({"n": n, "m": m, "seed": seed, "trial": trial})
+    row.update(params.as_row())
+    return row
+
+
+def run_trials(n, m, trials, seed, params):
+    return [run_trial(n, m, trial, seed, params) for trial in trials]
+
+
+def load_results(filename):
+    results = []
+    if not os.path.exists(filename):
+        return results
+    with open(filename, newline="") as file:
+        for row in csv.DictReader(file):
+            try:
+                result = {k: int(row[k]) for k in ("n", "m", "seed", "trial")}
+                result.update(GossipParams.from_row(row).as_row())
+                result.update({k: float(row[k]) for k in METRIC_FIELDS})
+                results.append(result)
+            except (TypeError, ValueError):
+                # a row cut short by an interrupted run, the trial is simply redone
+                continue
+    return results
+
+
+def same_setup(result, m, seed, params):
+    return (result["m"] == m and result["seed"] == seed
+            and all(result[k] == v for k, v in params.as_row().items()))
+
+
+def run_experiments(sizes, m, k, seed, params, output, workers=None, trials_per_task=10):
+    # trials of the same setup already in the output file are skipped, so an
+    # interrupted sweep can be resumed by running the same command again
+    truncate_partial_row(output)
+    check_header(output, RESULT_FIELDS)
+    done = set((r["n"], r["trial"]) for r in load_results(output) if same_setup(r, m, seed, params))
+
+    # large committees are split into several tasks so the pool stays busy
+    pending = []
+    for n in sizes:
+        trials = [trial for trial in range(k) if (n, trial) not in done]
+        for i in range(0, len(trials), trials_per_task):
+            pending.append((n, trials[i:i + trials_per_task]))
+
+    new_file = not os.path.exists(output) or os.path.getsize(output) == 0
+    with open(output, "a", newline="") as file, ProcessPoolExecutor(max_workers=workers) as pool:
+        writer = csv.DictWriter(file, fieldnames=RESULT_FIELDS)
+        if new_file:
+            writer.writeheader()
+
+        futures = [pool.submit(run_trials, n, m, trials, seed, params) for n, trials in pending]
+        for future in as_completed(futures):
+            writer.writerows(future.result())
+            file.flush()
+
+
+def summarize(results, m, seed, params):
+    by_size = defaultdict(list)
+    for r in results:
+        if same_setup(r, m, seed, params):
+            by_size[r["n"]].append(r)
+
+    summary = []
+    for n in sorted(by_size):
+        rows = by_size[n]
+        line = {"n": n, "trials": len(rows)}
+        for field in METRIC_FIELDS:
+            line[field] = mean(r[field] for r in rows)
+        summary.append(line)
+    return summary
+
+
+def plot(summary):
+    import matplotlib.pyplot as plt
+
+    xdata = [s["n"] for s in summary]
+    for p in PERCENTILES:
+        plt.plot(xdata, [s["p%d" % p] for s in summary], label="p%d" % p)
+    plt.legend()
+    plt.ylabel("Coverage Time, Seconds")
+    plt.xlabel("Committee Size")
+    plt.show()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Event-driven gossip propagation over random committee graphs")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000], help="committee sizes")
+    parser.add_argument("-m", type=int, default=3, help="connections per committee member")
+    parser.add_argument("-k", type=int, default=100, help="trials per committee size")
+    parser.add_argument("--message-size", type=float, default=1e6, help="message size in bytes")
+    parser.add_argument("--bandwidth", type=float, default=12.5e6, help="upload bandwidth in bytes per second")
+    parser.add_argument("--validation-delay", type=float, default=0.05, help="per-hop validation delay in seconds")
+    parser.add_argument("--fanout", type=int, default=None, help="neighbours each node forwards to (default: all)")
+    parser.add_argument("--seed", type=int, default=1, help="base seed of the per-trial random streams")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--output", default="gossip.csv",
+                        help="results file, appended to and resumed from")
+    parser.add_argument("--plot", action="store_true", help="plot coverage percentiles per committee size")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    params = GossipParams(args.message_size, args.bandwidth, args.validation_delay, args.fanout)
+    run_experiments(args.sizes, args.m, args.k, args.seed, params, args.output, args.workers)
+
+    summary = summarize([r for r in load_results(args.output) if r["n"] in args.sizes], args.m, args.seed, params)
+    for s in summary:
+        print(s["n"], s["trials"], " ".join("%s=%.3f" % (f, s[f]) for f in METRIC_FIELDS))
+    if args.plot:
+        plot(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,197 @@
-import operator
-import random
+import argparse
+import csv
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from statistics import mean
 
-import matplotlib.pyplot as plt
-import networkx as nx
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+# link latency range in seconds
+MIN_LATENCY = 0.08
+MAX_LATENCY = 16
+
+RESULT_FIELDS = ["n", "m", "seed", "trial", "propagation_time"]
+
+
+def trial_rng(seed, n, trial):
+    # every (n, trial) pair gets its own stream derived from the base seed, so a
+    # result does not depend on which worker ran it or in what order
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(n, trial)))
+
+
+def barabasi_albert_edges(n, m, rng):
+    # Same growth process as nx.barabasi_albert_graph: node m attaches to the m
+    # initial nodes, then every new node attaches to m distinct nodes picked with
+    # probability proportional to their degree. The degree-weighted pool is a
+    # preallocated array instead of a growing python list.
+    if m < 1 or m >= n:
+        raise ValueError("Barabasi-Albert network must have m >= 1 and m < n, m = %d, n = %d" % (m, n))
+
+    n_edges = (n - m) * m
+    src = np.empty(n_edges, dtype=np.int64)
+    dst = np.empty(n_edges, dtype=np.int64)
+    repeated = np.empty(2 * n_edges, dtype=np.int64)
+
+    targets = np.arange(m)
+    filled = 0
+    for i, source in enumerate(range(m, n)):
+        src[i * m:(i + 1) * m] = source
+        dst[i * m:(i + 1) * m] = targets
+        repeated[filled:filled + m] = targets
+        repeated[filled + m:filled + 2 * m] = source
+        filled += 2 * m
+
+        if source + 1 == n:
+            break
+
+        chosen = set()
+        while len(chosen) < m:
+            picks = repeated[rng.integers(0, filled, size=m)]
+            for p in picks.tolist():
+                chosen.add(p)
+                if len(chosen) == m:
+                    break
+        targets = np.fromiter(chosen, dtype=np.int64, count=m)
+
+    return src, dst
+
+
+def weighted_graph(n, m, rng):
+    src, dst = barabasi_albert_edges(n, m, rng)
+    weights = rng.uniform(MIN_LATENCY, MAX_LATENCY, size=len(src))
+    return csr_matrix((weights, (src, dst)), shape=(n, n))
+
 
 # run single experiment estimating block propagation time
+def estimate_block_propagation_time(n, m, rng=None):
+    rng = np.random.default_rng() if rng is None else rng
+    # generate graph and compute shortest paths lengths from node 0 to others
+    graph = weighted_graph(n, m, rng)
+    shortest_paths = dijkstra(graph, directed=False, indices=0)
+    return float(shortest_paths[np.isfinite(shortest_paths)].max())
+
+
+def run_trials(n, m, trials, seed):
+    return [(n, m, seed, trial, estimate_block_propagation_time(n, m, trial_rng(seed, n, trial))) for trial in trials]
+
+
+def load_results(filename):
+    results = []
+    if not os.path.exists(filename):
+        return results
+    with open(filename, newline="") as file:
+        for row in csv.DictReader(file):
+            try:
+                results.append((int(row["n"]), int(row["m"]), int(row["seed"]), int(row["trial"]),
+                                float(row["propagation_time"])))
+            except (TypeError, ValueError):
+                # a row cut short by an interrupted run, the trial is simply redone
+                continue
+    return results
+
+
+def truncate_partial_row(filename, chunk_size=1 << 16):
+    # cut the file back to its last newline, so rows appended on resume do not
+    # get glued onto a row an interrupted run left unfinished
+    if not os.path.exists(filename):
+        return
+    with open(filename, "rb+") as file:
+        end = file.seek(0, os.SEEK_END)
+        while end > 0:
+            start = max(0, end - chunk_size)
+            file.seek(start)
+            newline = file.read(end - start).rfind(b"\n")
+            if newline >= 0:
+                file.truncate(start + newline + 1)
+                return
+            end = start
+        file.truncate(0)
+
+
+def check_header(filename, fields):
+    # rows appended on resume must line up with the columns the file was started
+    # with, a file written by an older version has no seed column
+    if not os.path.exists(filename) or os.path.getsize(filename) == 0:
+        return
+    with open(filename, newline="") as file:
+        header = next(csv.reader(file), [])
+    if header != list(fields):
+        raise ValueError("%s has columns %s, expected %s, write the results to a new file"
+                         % (filename, ",".join(header), ",".join(fields)))
+
+
+def run_experiments(sizes, m, k, seed, output, workers=None):
+    # trials of the same m and seed already in the output file are skipped, so an
+    # interrupted sweep can be resumed by running the same command again
+    truncate_partial_row(output)
+    check_header(output, RESULT_FIELDS)
+    done = set((n, trial) for n, mm, s, trial, _ in load_results(output) if mm == m and s == seed)
+    pending = []
+    for n in sizes:
+        trials = [trial for trial in range(k) if (n, trial) not in done]
+        if trials:
+            pending.append((n, trials))
+
+    new_file = not os.path.exists(output) or os.path.getsize(output) == 0
+    with open(output, "a", newline="") as file, ProcessPoolExecutor(max_workers=workers) as pool:
+        writer = csv.writer(file)
+        if new_file:
+            writer.writerow(RESULT_FIELDS)
+
+        futures = [pool.submit(run_trials, n, m, trials, seed) for n, trials in pending]
+        for future in as_completed(futures):
+            writer.writerows(future.result())
+            file.flush()
+
+
+def mean_by_size(results, m, seed):
+    by_size = defaultdict(list)
+    for n, mm, s, _, value in results:
+        if mm == m and s == seed:
+            by_size[n].append(value)
+    xdata = sorted(by_size)
+    return xdata, [mean(by_size[n]) for n in xdata]
+
+
+def plot(xdata, ydata):
+    import matplotlib.pyplot as plt
+
+    plt.plot(xdata, ydata)
+    plt.ylabel("Propagation Time, Seconds")
+    plt.xlabel("Committee Size")
+    plt.show()
 
 
-def estimate_block_propagation_time(n, m):
-    # generate graph and compute shortest paths lenghts from node 0 to others
-    graph = nx.barabasi_albert_graph(n, m)
-    for (u, v, w) in graph.edges(data=True):
-        w["weight"] = random.uniform(0.08, 16)
-        # print(graph.edges[u,v]['weight'])
-    shortest_paths = nx.single_source_dijkstra_path_length(graph, 0)
-    return max(shortest_paths.items(), key=operator.itemgetter(1))[1]
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Estimate block propagation time over random committee graphs")
+    parser.add_argument("--min-size", type=int, default=20, help="smallest committee size")
+    parser.add_argument("--max-size", type=int, default=200, help="largest committee size (exclusive)")
+    parser.add_argument("--step", type=int, default=1, help="committee size step")
+    # parameter m is how much connection committee member has
+    parser.add_argument("-m", type=int, default=3, help="connections per committee member")
+    # k is amount of experiments for averaging
+    parser.add_argument("-k", type=int, default=100, help="experiments per committee size")
+    parser.add_argument("--seed", type=int, default=1, help="base seed of the per-experiment random streams")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--output", default="propagation.csv", help="results file, appended to and resumed from")
+    parser.add_argument("--plot", action="store_true", help="plot mean propagation time per committee size")
+    return parser.parse_args(argv)
 
 
-# parameter m is how much connection committee member has
-m = 3
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = range(args.min_size, args.max_size, args.step)
+    run_experiments(sizes, args.m, args.k, args.seed, args.output, args.workers)
 
-# k is amount of experiments for averaging
-k = 100
+    xdata, ydata = mean_by_size([r for r in load_results(args.output) if r[0] in sizes], args.m, args.seed)
+    for n, y in zip(xdata, ydata):
+        print(n, y)
+    if args.plot:
+        plot(xdata, ydata)
 
-ydata = []
-xdata = range(20, 200)
-for n in xdata:
-    data = [estimate_block_propagation_time(n, m) for _ in range(k)]
-    # print(n, mean(data))
-    ydata.append(mean(data))
 
-plt.plot(xdata, ydata)
-plt.ylabel("Propagation Time, Seconds")
-plt.xlabel("Committee Size")
-plt.show()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+# Tested on python3.6
+
+import networkx as nx
+
+# The services load this module as services.dynamic_graph, with only the
+# parent of the repository on the path.
+try:
+    from services import power_iteration
+except ImportError:
+    import power_iteration
+
+
+class DynamicGraph:
+
+    # A stored graph that accepts edge/node deltas. Degree comes straight from the
+    # networkx adjacency, connected components are kept up to date on every delta
+    # and the last pagerank / eigenvector centrality vectors are kept so the next
+    # computation can be warm-started from them instead of from a uniform vector.
+
+    def __init__(self, graph, directed=False):
+        self.directed = directed
+        self.G = nx.DiGraph() if directed else nx.Graph()
+        self.G.add_nodes_from(graph['nodes'])
+        self.G.add_edges_from(graph['edges'])
+
+        if 'weights' in graph and len(graph['weights']) > 0:
+            for i in range(len(graph['edges'])):
+                self.G[graph['edges'][i][0]][graph['edges'][i][1]]['weight'] = graph['weights'][i]
+
+        self.version = 0
+
+        self.pagerank = None
+        self.eigenvector_centrality = None
+
+        self.component_of = {}
+        self.components = {}
+        self.next_component = 0
+
+        for nodes in (nx.weakly_connected_components(self.G) if directed else nx.connected_components(self.G)):
+            self._new_component(nodes)
+
+    def _new_component(self, nodes):
+        cid = self.next_component
+        self.next_component += 1
+        self.components[cid] = set(nodes)
+        for n in nodes:
+            self.component_of[n] = cid
+        return cid
+
+    def _neighbors(self, node):
+        # components of a directed graph are the weakly connected ones
+        return nx.all_neighbors(self.G, node) if self.directed else self.G.neighbors(node)
+
+    def _still_connected(self, u, v):
+        # Search from both endpoints at the same time. Either the two searches meet
+        # (no split) or the smaller side runs out first, so the cost is bounded by
+        # the size of the piece that got cut off rather than the whole component.
+        seen = [{u}, {v}]
+        frontier = [[u], [v]]
+
+        while frontier[0] and frontier[1]:
+            side = 0 if len(frontier[0]) <= len(frontier[1]) else 1
+            next_frontier = []
+            for node in frontier[side]:
+                for nbr in self._neighbors(node):
+                    if nbr in seen[1 - side]:
+                        return True, None
+                    if nbr not in seen[side]:
+                        seen[side].add(nbr)
+                        next_frontier.append(nbr)
+            frontier[side] = next_frontier
+
+        side = 0 if not frontier[0] else 1
+        return False, seen[side]
+
+    def _add_node(self, node):
+        if node not in self.G:
+            self.G.add_node(node)
+            self._new_component([node])
+
+    def _add_edge(self, u, v, weight=None):
+        self.G.add_edge(u, v)
+        if weight is not None:
+            self.G[u][v]['weight'] = weight
+
+        cu = self.component_of[u]
+        cv = self.component_of[v]
+        if cu == cv:
+            return
+
+        # relabel the smaller component into the larger one
+        if len(self.components[cu]) < len(self.components[cv]):
+            cu, cv = cv, cu
+        for n in self.components[cv]:
+            self.component_of[n] = cu
+        self.components[cu] |= self.components.pop(cv)
+
+    def _remove_edge(self, u, v):
+        self.G.remove_edge(u, v)
+        if u == v:
+            return
+
+        connected, split = self._still_connected(u, v)
+        if connected:
+            return
+
+        old = self.component_of[u]
+        self.components[old] -= split
+        self._new_component(split)
+
+    def _remove_node(self, node):
+        for nbr in list(self._neighbors(node)):
+            if self.G.has_edge(node, nbr):
+                self._remove_edge(node, nbr)
+            if self.G.has_edge(nbr, node):
+                self._remove_edge(nbr, node)
+
+        cid = self.component_of.pop(node)
+        del self.components[cid]
+        self.G.remove_node(node)
+
+        if self.pagerank is not None:
+            self.pagerank.pop(node, None)
+        if self.eigenvector_centrality is not None:
+            self.eigenvector_centrality.pop(node, None)
+
+    def apply_delta(self, add_nodes=None, add_edges=None, remove_edges=None, remove_nodes=None, add_weights=None):
+        add_nodes = [] if add_nodes is None else add_nodes
+        add_edges = [] if add_edges is None else add_edges
+        remove_edges = [] if remove_edges is None else remove_edges
+        remove_nodes = [] if remove_nodes is None else remove_nodes
+
+        for n in add_nodes:
+            self._add_node(n)
+
+        for i in range(len(add_edges)):
+            weight = add_weights[i] if add_weights else None
+            self._add_edge(add_edges[i][0], add_edges[i][1], weight)
+
+        for e in remove_edges:
+            self._remove_edge(e[0], e[1])
+
+        for n in remove_nodes:
+            self._remove_node(n)
+
+        self.version += 1
+
+        return self.version
+
+    def degree(self):
+        return dict(self.G.degree())
+
+    def degree_centrality(self):
+        if len(self.G) <= 1:
+            return {n: 1 for n in self.G}
+
+        s = 1.0 / (len(self.G) - 1.0)
+        return {n: d * s for n, d in self.G.degree()}
+
+    def connected_components(self):
+        return [sorted(nodes, key=str) for nodes in self.components.values()]
+
+    def find_pagerank(self, alpha=0.85, personalization=None, max_iter=100, tol=1e-06, weight=None,
+                      dangling=None, acceleration=False):
+        nstart = power_iteration.warm_start_vector(self.pagerank, self.G)
+        self.pagerank, convergence = power_iteration.pagerank(self.G, alpha=alpha, personalization=personalization,
+                                                              max_iter=max_iter, tol=tol, nstart=nstart,
+                                                              weight=weight, dangling=dangling,
+                                                              acceleration=acceleration)
+        return self.pagerank, convergence
+
+    def find_eigenvector_centrality(self, max_iter=100, tol=1e-06, weight=None, acceleration=False):
+        nstart = power_iteration.warm_start_vector(self.eigenvector_centrality, self.G)
+        self.eigenvector_centrality, convergence = power_iteration.eigenvector_centrality(
+            self.G, max_iter=max_iter, tol=tol, nstart=nstart, weight=weight, acceleration=acceleration)
+        return self.eigenvector_centrality, convergence
+
+
+class DynamicGraphs:
+
+    def __init__(self):
+        self.graphs = {}
+
+    def is_valid_delta(self, graph_id, add_nodes=None, add_edges=None, remove_edges=None, remove_nodes=None,
+                       add_weights=None):
+
+        if graph_id not in self.graphs:
+            return [False, 'graph {} has not been stored'.format(graph_id)]
+
+        G = self.graphs[graph_id].G
+
+        add_nodes = [] if add_nodes is None else add_nodes
+        add_edges = [] if add_edges is None else add_edges
+        remove_edges = [] if remove_edges is None else remove_edges
+        remove_nodes = [] if remove_nodes is None else remove_nodes
+
+        for name, value in [('add_nodes', add_nodes), ('add_edges', add_edges), ('remove_edges', remove_edges),
+                            ('remove_nodes', remove_nodes)]:
+            if not isinstance(value, list):
+                return [False, 'the supplied {} is not type array'.format(name)]
+
+        for i in range(len(add_nodes)):
+            if add_nodes[i] == '' or add_nodes[i] is None:
+                return [False, 'add_nodes at zero-indexed position {} is an empty node'.format(i)]
+
+        known = set(add_nodes)
+
+        for name, edges in [('add_edges', add_edges), ('remove_edges', remove_edges)]:
+            for i in range(len(edges)):
+                if not isinstance(edges[i], list):
+                    return [False, 'Element of the input array {} at zero-indexed poistion {} is not an array'.format(
+                        name, i)]
+                if len(edges[i]) != 2:
+                    return [False,
+                            'Element of the input array {} at zero-indexed poistion {} does not contain two nodes'.format(
+                                name, i)]
+                for j in range(2):
+                    if edges[i][j] not in G and edges[i][j] not in known:
+                        return [False, '{} value at [{}][{}] is not a node'.format(name, i, j)]
+
+        if add_weights is not None and len(add_weights) != 0 and len(add_weights) != len(add_edges):
+            return [False, 'the length of supplied add_edges and add_weights does not match']
+
+        # Removals are checked against the graph as the earlier changes of the delta
+        # leave it, so removing the same edge or node twice is rejected up front
+        # instead of failing halfway through apply_delta.
+        directed = self.graphs[graph_id].directed
+
+        def edge_key(u, v):
+            return (u, v) if directed else frozenset((u, v))
+
+        added = set(edge_key(e[0], e[1]) for e in add_edges)
+        removed = set()
+        for i in range(len(remove_edges)):
+            u, v = remove_edges[i]
+            key = edge_key(u, v)
+            if key in removed or (not G.has_edge(u, v) and key not in added):
+                return [False, 'remove_edges at zero-indexed position {} is not an edge of the graph'.format(i)]
+            removed.add(key)
+
+        removed = set()
+        for i in range(len(remove_nodes)):
+            node = remove_nodes[i]
+            if node in removed or (node not in G and node not in known):
+                return [False, 'remove_nodes at zero-indexed position {} is not a node of the graph'.format(i)]
+            removed.add(node)
+
+        return [True]
+
+    def store(self, graph_id, graph, directed=False):
+        self.graphs[graph_id] = DynamicGraph(graph, directed)
+        return self.graphs[graph_id]
+
+    def update(self, graph_id, add_nodes=None, add_edges=None, remove_edges=None, remove_nodes=None,
+               add_weights=None):
+
+        ret = self.is_valid_delta(graph_id, add_nodes, add_edges, remove_edges, remove_nodes, add_weights)
+        if not ret[0]:
+            ret.append({})
+            return ret
+
+        dg = self.graphs[graph_id]
+        version = dg.apply_delta(add_nodes, add_edges, remove_edges, remove_nodes, add_weights)
+
+        output = {'graph_id': graph_id, 'version': version, 'nodes': dg.G.number_of_nodes(),
+                  'edges': dg.G.number_of_edges(), 'components': len(dg.components)}
+        return [True, 'success', output]
+
+    def get(self, graph_id):
+        return self.graphs.get(graph_id)
+
+    def drop(self, graph_id):
+        return self.graphs.pop(graph_id, None) is not None
+
+
+# Graphs are kept for the lifetime of the service process so that the per-request
+# NodeImportance / Robustness instances created by the gRPC wrappers share them.
+graph_store = DynamicGraphs()
+
+
+__end__ = '__end__'
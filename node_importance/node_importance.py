@@ -12,12 +12,16 @@ SCRIPT_DIR = os.path.dirname(os.path.realpath(os.path.join(os.getcwd(), os.path.
 sys.path.append(os.path.normpath(os.path.join(SCRIPT_DIR, PACKAGE_PARENT)))
 
 import check_graph_validity
+import dynamic_graph
+import power_iteration
 
 
 class NodeImportance:
 
-    def __init__(self):
+    def __init__(self, graph_store=None, vector_store=None):
         self.cv = check_graph_validity.Graphs()
+        self.graphs = dynamic_graph.graph_store if graph_store is None else graph_store
+        self.vectors = power_iteration.converged_vectors if vector_store is None else vector_store
 
     def construct_graph(self, graph, directed=False):
         try:
@@ -141,7 +145,7 @@ class NodeImportance:
         return True, 'success', output
 
     def find_pagerank(self, graph, alpha=0.85, personalization=None, max_iter=100, tol=1e-06, nstart=None,
-                      weight=False, dangling=None, directed=False):
+                      weight=False, dangling=None, directed=False, lineage=None, warm_start=True, acceleration=False):
         ret = self.cv.is_valid_graph(graph)
         if not ret[0]:
             return ret
@@ -164,14 +168,20 @@ class NodeImportance:
         if not ret[0]:
             return ret
 
-        result = nx.algorithms.link_analysis.pagerank_alg.pagerank(G, alpha=alpha, personalization=personalization,
-                                                                   max_iter=max_iter,
-                                                                   tol=tol, nstart=nstart, weight=weight,
-                                                                   dangling=dangling)
-        output = {"pagerank": result}
+        # start from the last converged vector of this lineage unless told otherwise
+        if nstart is None and warm_start:
+            nstart = self.vectors.get(lineage, 'pagerank', G)
+
+        result, convergence = power_iteration.pagerank(G, alpha=alpha, personalization=personalization,
+                                                       max_iter=max_iter, tol=tol, nstart=nstart, weight=weight,
+                                                       dangling=dangling, acceleration=acceleration)
+        self.vectors.put(lineage, 'pagerank', result)
+
+        output = {"pagerank": result, "convergence": convergence}
         return True, 'success', output
 
-    def find_eigenvector_centrality(self, graph, max_iter=100, tol=1e-06, nstart=None, weight=False, directed=False, in_out=True):
+    def find_eigenvector_centrality(self, graph, max_iter=100, tol=1e-06, nstart=None, weight=False, directed=False, in_out=True,
+                                    lineage=None, warm_start=True, acceleration=False):
         ret = self.cv.is_valid_graph(graph)
         if not ret[0]:
             return ret
@@ -196,12 +206,18 @@ class NodeImportance:
             return ret
 
 
-        result = nx.algorithms.centrality.eigenvector_centrality(G, max_iter=max_iter, tol=tol, nstart=nstart,
-                                                                 weight=weight)
-        output = {"eigenvector_centrality": result}
+        if nstart is None and warm_start:
+            nstart = self.vectors.get(lineage, 'eigenvector_centrality', G)
+
+        result, convergence = power_iteration.eigenvector_centrality(G, max_iter=max_iter, tol=tol, nstart=nstart,
+                                                                     weight=weight, acceleration=acceleration)
+        self.vectors.put(lineage, 'eigenvector_centrality', result)
+
+        output = {"eigenvector_centrality": result, "convergence": convergence}
         return True, 'success', output
 
-    def find_hits(self, graph, max_iter=100, tol=1e-08, nstart=None, normalized=True, directed=False):
+    def find_hits(self, graph, max_iter=100, tol=1e-08, nstart=None, normalized=True, directed=False, lineage=None,
+                  warm_start=True, acceleration=False):
         ret = self.cv.is_valid_graph(graph)
         if not ret[0]:
             return ret
@@ -218,6 +234,72 @@ class NodeImportance:
         if not ret[0]:
             return ret
 
-        result = nx.algorithms.link_analysis.hits_alg.hits(G, max_iter=max_iter, tol=tol, nstart=nstart, normalized=normalized)
-        output = {"hubs": result[0],"authorities":result[1]}
+        if nstart is None and warm_start:
+            nstart = self.vectors.get(lineage, 'hits', G)
+
+        hubs, authorities, convergence = power_iteration.hits(G, max_iter=max_iter, tol=tol, nstart=nstart,
+                                                              normalized=normalized, acceleration=acceleration)
+        self.vectors.put(lineage, 'hits', hubs)
+
+        output = {"hubs": hubs, "authorities": authorities, "convergence": convergence}
+        return True, 'success', output
+
+    def store_graph(self, graph_id, graph, directed=False):
+        ret = self.cv.is_valid_graph(graph)
+        if not ret[0]:
+            return ret
+
+        dg = self.graphs.store(graph_id, graph, directed)
+
+        output = {'graph_id': graph_id, 'version': dg.version}
+        return True, 'success', output
+
+    def update_graph(self, graph_id, add_nodes=None, add_edges=None, remove_edges=None, remove_nodes=None,
+                     add_weights=None):
+        return self.graphs.update(graph_id, add_nodes=add_nodes, add_edges=add_edges, remove_edges=remove_edges,
+                                  remove_nodes=remove_nodes, add_weights=add_weights)
+
+    def find_dynamic_degree_centrality(self, graph_id):
+        dg = self.graphs.get(graph_id)
+        if dg is None:
+            return False, 'graph {} has not been stored'.format(graph_id), {}
+
+        output = {"degree_centrality": dg.degree_centrality(), "version": dg.version}
+        return True, 'success', output
+
+    def find_dynamic_pagerank(self, graph_id, alpha=0.85, personalization=None, max_iter=100, tol=1e-06,
+                              weight=False, dangling=None, acceleration=False):
+        dg = self.graphs.get(graph_id)
+        if dg is None:
+            return False, 'graph {} has not been stored'.format(graph_id), {}
+
+        alpha = 0.85 if alpha == 0.0 else alpha
+        max_iter = 100 if max_iter == 0 else max_iter
+        tol = 1e-06 if tol == 0.0 else tol
+        weight = None if weight == False else 'weights'
+
+        graph = {'nodes': list(dg.G.nodes)}
+        ret = self.cv.is_valid_pagerank(graph, personalization, dangling, None)
+        if not ret[0]:
+            return ret
+
+        # warm-started from the vector of the previous call on this graph
+        result, convergence = dg.find_pagerank(alpha=alpha, personalization=personalization, max_iter=max_iter,
+                                               tol=tol, weight=weight, dangling=dangling, acceleration=acceleration)
+        output = {"pagerank": result, "convergence": convergence, "version": dg.version}
+        return True, 'success', output
+
+    def find_dynamic_eigenvector_centrality(self, graph_id, max_iter=100, tol=1e-06, weight=False, acceleration=False):
+        dg = self.graphs.get(graph_id)
+        if dg is None:
+            return False, 'graph {} has not been stored'.format(graph_id), {}
+
+        max_iter = 100 if max_iter == 0 else max_iter
+        tol = 1e-06 if tol == 0.0 else tol
+        weight = None if weight == False else 'weights'
+
+        # warm-started from the vector of the previous call on this graph
+        result, convergence = dg.find_eigenvector_centrality(max_iter=max_iter, tol=tol, weight=weight,
+                                                             acceleration=acceleration)
+        output = {"eigenvector_centrality": result, "convergence": convergence, "version": dg.version}
         return True, 'success', output
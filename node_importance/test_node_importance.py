@@ -8,6 +8,8 @@ SCRIPT_DIR = os.path.dirname(os.path.realpath(os.path.join(os.getcwd(), os.path.
 sys.path.append(os.path.normpath(os.path.join(SCRIPT_DIR, PACKAGE_PARENT)))
 
 import check_graph_validity
+import dynamic_graph
+import power_iteration
 
 
 class TestNodeImportance(unittest.TestCase):
@@ -253,10 +255,9 @@ class TestNodeImportance(unittest.TestCase):
         result = self.N.find_pagerank(self.graph)
         self.assertEqual(result[0], True)
         self.assertEqual(result[1], 'success')
-        self.assertEqual(result[2], {
-            'pagerank': {'1': 0.12113884655309373, '2': 0.23955113566709454, '3': 0.23955113566709454,
+        self.assertEqual(result[2]['pagerank'], {'1': 0.12113884655309373, '2': 0.23955113566709454, '3': 0.23955113566709454,
                          '4': 0.12113884655309375, '5': 0.06965500888990583, '6': 0.06965500888990583,
-                         '7': 0.06965500888990583, '8': 0.06965500888990583}})
+                         '7': 0.06965500888990583, '8': 0.06965500888990583})
 
         # Non Default Test, all default values used expect directed
         result = self.N.find_pagerank(self.graph, alpha=0.95,
@@ -269,10 +270,10 @@ class TestNodeImportance(unittest.TestCase):
                                                 '6': 0.125, '7': 0.125, '8': 0.125})
         self.assertEqual(result[0], True)
         self.assertEqual(result[1], 'success')
-        self.assertEqual(result[2],
-                         {'pagerank': {'1': 0.12353302891578935, '2': 0.24675733134387767, '3': 0.2467573313438777,
+        self.assertEqual(result[2]['pagerank'],
+                         {'1': 0.12353302891578935, '2': 0.24675733134387767, '3': 0.2467573313438777,
                                        '4': 0.12353302891578932, '5': 0.06485481987016649, '6': 0.06485481987016647,
-                                       '7': 0.06485481987016649, '8': 0.06485481987016647}})
+                                       '7': 0.06485481987016649, '8': 0.06485481987016647})
 
         # Non weighted Test
         result = self.N.find_pagerank(self.graph_03, alpha=0.95,
@@ -285,10 +286,10 @@ class TestNodeImportance(unittest.TestCase):
                                                 '6': 0.125, '7': 0.125, '8': 0.125})
         self.assertEqual(result[0], True)
         self.assertEqual(result[1], 'success')
-        self.assertEqual(result[2],
-                         {'pagerank': {'1': 0.12353302891578935, '2': 0.24675733134387767, '3': 0.2467573313438777,
+        self.assertEqual(result[2]['pagerank'],
+                         {'1': 0.12353302891578935, '2': 0.24675733134387767, '3': 0.2467573313438777,
                                        '4': 0.12353302891578932, '5': 0.06485481987016649, '6': 0.06485481987016647,
-                                       '7': 0.06485481987016649, '8': 0.06485481987016647}})
+                                       '7': 0.06485481987016649, '8': 0.06485481987016647})
 
         # Non default Test 2
         result = self.N.find_pagerank(self.graph_03, alpha=0.95,
@@ -301,10 +302,10 @@ class TestNodeImportance(unittest.TestCase):
                                                 '6': 0.125, '7': 0.125, '8': 0.125}, directed=True)
         self.assertEqual(result[0], True)
         self.assertEqual(result[1], 'success')
-        self.assertEqual(result[2],
-                         {'pagerank': {'1': 0.08514279383409741, '2': 0.1255854995423924, '3': 0.12491155064890427,
+        self.assertEqual(result[2]['pagerank'],
+                         {'1': 0.08514279383409741, '2': 0.1255854995423924, '3': 0.12491155064890427,
                                        '4': 0.16514082203112918, '5': 0.12491155064890427, '6': 0.12469811632283417,
-                                       '7': 0.12491155064890427, '8': 0.12469811632283417}})
+                                       '7': 0.12491155064890427, '8': 0.12469811632283417})
 
         result = self.N.find_pagerank(self.graph,personalization={'1': 0.125, '112': 0.125, '3': 0.125, '4': 0.125, '5': 0.125,
                                                        '6': 0.125, '7': 0.125, '8': 0.125})
@@ -382,10 +383,10 @@ class TestNodeImportance(unittest.TestCase):
         result = self.N.find_eigenvector_centrality(self.graph)
         self.assertEqual(result[0], True)
         self.assertEqual(result[1], 'success')
-        self.assertEqual(result[2], {'eigenvector_centrality': {'1': 0.35775018836999806, '2': 0.5298994260311778,
+        self.assertEqual(result[2]['eigenvector_centrality'], {'1': 0.35775018836999806, '2': 0.5298994260311778,
                                                                 '3': 0.5298994260311778, '4': 0.35775018836999806,
                                                                 '5': 0.2135666184274351, '6': 0.2135666184274351,
-                                                                '7': 0.2135666184274351, '8': 0.2135666184274351}})
+                                                                '7': 0.2135666184274351, '8': 0.2135666184274351})
 
         # Weight parameter fallacy
         result = self.N.find_eigenvector_centrality(self.graph_06, weight=True)
@@ -398,10 +399,9 @@ class TestNodeImportance(unittest.TestCase):
                                                             '8': 1}, weight=True, directed=False)
         self.assertEqual(result[0], True)
         self.assertEqual(result[1], 'success')
-        self.assertEqual(result[2], {
-            'eigenvector_centrality': {'1': 0.35774203080090017, '2': 0.5299019638339402, '3': 0.5299019638339402,
+        self.assertEqual(result[2]['eigenvector_centrality'], {'1': 0.35774203080090017, '2': 0.5299019638339402, '3': 0.5299019638339402,
                                        '4': 0.3577420308009002, '5': 0.21357030238703748, '6': 0.21357030238703748,
-                                       '7': 0.21357030238703748, '8': 0.21357030238703748}})
+                                       '7': 0.21357030238703748, '8': 0.21357030238703748})
 
         # Non weighted Test ... directed graph ... in_out=False
         result = self.N.find_eigenvector_centrality(self.graph, max_iter=500, tol=1e-05,
@@ -409,10 +409,10 @@ class TestNodeImportance(unittest.TestCase):
                                                             '8': 1}, weight=True, directed=True)
         self.assertEqual(result[0], True)
         self.assertEqual(result[1], 'success')
-        self.assertEqual(result[2], {'eigenvector_centrality': {'1': 1.9935012399077745e-07, '2': 5.183103223760218e-05,
+        self.assertEqual(result[2]['eigenvector_centrality'], {'1': 1.9935012399077745e-07, '2': 5.183103223760218e-05,
                                                                 '3': 0.0067123180248934745, '4': 0.5773456687445266,
                                                                 '5': 0.0067123180248934745, '6': 0.5772940370624132,
-                                                                '7': 0.0067123180248934745, '8': 0.5772940370624132}})
+                                                                '7': 0.0067123180248934745, '8': 0.5772940370624132})
 
         # Non weighted Test ... undirected graph ... in_out=True
         result = self.N.find_eigenvector_centrality(self.graph, max_iter=500, tol=1e-05,
@@ -420,9 +420,9 @@ class TestNodeImportance(unittest.TestCase):
                                                             '8': 1}, weight=True, directed=True,in_out=True)
         self.assertEqual(result[0], True)
         self.assertEqual(result[1], 'success')
-        self.assertEqual(result[2], {'eigenvector_centrality': {'1': 1.9935012399077745e-07, '2': 5.183103223760218e-05,
+        self.assertEqual(result[2]['eigenvector_centrality'], {'1': 1.9935012399077745e-07, '2': 5.183103223760218e-05,
                                                                 '3': 0.0067123180248934745, '4': 0.5773456687445266,
-                                                                '5': 0.0067123180248934745, '6': 0.5772940370624132, '7': 0.0067123180248934745, '8': 0.5772940370624132}})
+                                                                '5': 0.0067123180248934745, '6': 0.5772940370624132, '7': 0.0067123180248934745, '8': 0.5772940370624132})
 
     def test_find_hits(self):
         # Invalid graph
@@ -453,6 +453,48 @@ class TestNodeImportance(unittest.TestCase):
 
 
 
+    def test_warm_start_lineage(self):
+        N = NodeImportance(vector_store=power_iteration.ConvergedVectors())
+
+        # First run of a lineage starts from the uniform vector
+        first = N.find_pagerank(self.graph_03, lineage='daily', tol=1e-10)
+        self.assertEqual(first[0], True)
+        self.assertEqual(first[2]['convergence']['warm_start'], False)
+        self.assertEqual(len(first[2]['convergence']['iteration_times']), first[2]['convergence']['iterations'])
+        self.assertLess(first[2]['convergence']['residual'], 8 * 1e-10)
+
+        # Next day's graph starts from the previous converged vector
+        second = N.find_pagerank(self.graph, lineage='daily', tol=1e-10)
+        self.assertEqual(second[2]['convergence']['warm_start'], True)
+        self.assertLess(second[2]['convergence']['iterations'], first[2]['convergence']['iterations'])
+
+        # Warm start can be switched off, results stay the same
+        cold = N.find_pagerank(self.graph, lineage='daily', tol=1e-10, warm_start=False)
+        self.assertEqual(cold[2]['convergence']['warm_start'], False)
+        for node in cold[2]['pagerank']:
+            self.assertAlmostEqual(second[2]['pagerank'][node], cold[2]['pagerank'][node], places=8)
+
+        result = N.find_hits(self.graph_no_weights, lineage='daily')
+        self.assertEqual(result[2]['convergence']['warm_start'], False)
+        result = N.find_hits(self.graph_no_weights, lineage='daily')
+        self.assertEqual(result[2]['convergence']['warm_start'], True)
+
+    def test_acceleration(self):
+        plain = self.N.find_eigenvector_centrality(self.graph_03, tol=1e-12, max_iter=1000)
+        accelerated = self.N.find_eigenvector_centrality(self.graph_03, tol=1e-12, max_iter=1000, acceleration=True)
+        self.assertEqual(plain[2]['convergence']['extrapolations'], 0)
+        self.assertGreater(accelerated[2]['convergence']['extrapolations'], 0)
+        self.assertLess(accelerated[2]['convergence']['iterations'], plain[2]['convergence']['iterations'])
+        for node in plain[2]['eigenvector_centrality']:
+            self.assertAlmostEqual(plain[2]['eigenvector_centrality'][node],
+                                   accelerated[2]['eigenvector_centrality'][node], places=8)
+
+        plain = self.N.find_pagerank(self.graph_03, alpha=0.99, tol=1e-12, max_iter=1000)
+        accelerated = self.N.find_pagerank(self.graph_03, alpha=0.99, tol=1e-12, max_iter=1000, acceleration=True)
+        self.assertLessEqual(accelerated[2]['convergence']['iterations'], plain[2]['convergence']['iterations'])
+        for node in plain[2]['pagerank']:
+            self.assertAlmostEqual(plain[2]['pagerank'][node], accelerated[2]['pagerank'][node], places=8)
+
     def test_construct_graph(self):
         # Default Test
         result = self.N.construct_graph(self.graph)
@@ -473,6 +515,56 @@ class TestNodeImportance(unittest.TestCase):
         self.assertEqual(result[1], "'edges'")
         self.assertEqual(result[2], {})
 
+    def test_dynamic_graph(self):
+        N = NodeImportance(graph_store=dynamic_graph.DynamicGraphs())
+
+        # Unknown graph
+        result = N.update_graph('g', add_edges=[['1', '5']])
+        self.assertEqual(result[0], False)
+        self.assertEqual(result[1], 'graph g has not been stored')
+
+        result = N.store_graph('g', self.graph_03)
+        self.assertEqual(result[0], True)
+        self.assertEqual(result[2], {'graph_id': 'g', 'version': 0})
+
+        # Invalid deltas
+        result = N.update_graph('g', add_edges=[['1', '9']])
+        self.assertEqual(result[0], False)
+        self.assertEqual(result[1], 'add_edges value at [0][1] is not a node')
+
+        result = N.update_graph('g', remove_edges=[['1', '5']])
+        self.assertEqual(result[0], False)
+        self.assertEqual(result[1], 'remove_edges at zero-indexed position 0 is not an edge of the graph')
+
+        # Warm-started results match a full recompute on the updated graph
+        first = N.find_dynamic_pagerank('g')
+        self.assertEqual(first[0], True)
+
+        result = N.update_graph('g', add_nodes=['9'], add_edges=[['8', '9'], ['5', '6']], remove_edges=[['1', '2']])
+        self.assertEqual(result[0], True)
+        self.assertEqual(result[2], {'graph_id': 'g', 'version': 1, 'nodes': 9, 'edges': 9, 'components': 1})
+
+        updated = {
+            "nodes": ['1', '2', '3', '4', '5', '6', '7', '8', '9'],
+            "edges": [['1', '4'], ['2', '3'], ['2', '5'], ['3', '4'], ['3', '6'], ['2', '7'], ['3', '8'], ['8', '9'],
+                      ['5', '6']]
+        }
+
+        result = N.find_dynamic_pagerank('g')
+        expected = self.N.find_pagerank(updated)[2]['pagerank']
+        self.assertEqual(result[2]['version'], 1)
+        for node in expected:
+            self.assertAlmostEqual(result[2]['pagerank'][node], expected[node], places=5)
+
+        result = N.find_dynamic_eigenvector_centrality('g')
+        expected = self.N.find_eigenvector_centrality(updated)[2]['eigenvector_centrality']
+        for node in expected:
+            self.assertAlmostEqual(result[2]['eigenvector_centrality'][node], expected[node], places=4)
+
+        result = N.find_dynamic_degree_centrality('g')
+        self.assertEqual(result[2]['degree_centrality'],
+                         self.N.find_degree_centrality(updated)[2]['degree_centrality'])
+
     def test_check_graph_validity(self):
         # Graph without wrong number of weights
         result = self.cv.is_valid_graph(self.graph_04)
@@ -0,0 +1,310 @@
+# Tested on python3.6
+
+import time
+from math import sqrt
+
+import networkx as nx
+
+
+# The iterations below follow the pure python pagerank, eigenvector_centrality and
+# hits of networkx 2.2 step for step (same summation order, same convergence
+# tests), so they return the same vectors as the library calls they replace. On
+# top of that every call reports how it converged and can optionally apply Aitken
+# extrapolation every few iterations to cut the number of iterations needed.
+
+
+def warm_start_vector(previous, nodes):
+    if previous is None:
+        return None
+
+    # nodes that were not in the previous vector start at its mean
+    mean = sum(previous.values()) / len(previous) if len(previous) > 0 else 1.0
+    nstart = {n: previous.get(n, mean) for n in nodes}
+    if not any(v != 0 for v in nstart.values()):
+        return None
+
+    return nstart
+
+
+def aitken(x0, x1, x2):
+    # componentwise Aitken delta-squared extrapolation from three consecutive iterates
+    x = {}
+    for n in x2:
+        d = x2[n] - 2 * x1[n] + x0[n]
+        if abs(d) < 1e-15:
+            x[n] = x2[n]
+            continue
+
+        v = x2[n] - (x2[n] - x1[n]) ** 2 / d
+        x[n] = v if v >= 0 else x2[n]
+
+    return x
+
+
+class Extrapolation:
+
+    # Aitken extrapolation is only applied once the residuals shrink at a steady
+    # rate (the regime where it is valid), and an extrapolated vector that makes
+    # the next residual worse is thrown away and acceleration is switched off for
+    # the rest of the run, so an unlucky jump costs at most one iteration.
+
+    def __init__(self, enabled, every, normalize, convergence):
+        self.enabled = enabled
+        self.every = every
+        self.normalize = normalize
+        self.convergence = convergence
+        self.history = []
+        self.residuals = []
+        self.pending = False
+        self.fallback = None
+        self.fallback_residual = None
+
+    def step(self, x, err):
+        if not self.enabled:
+            return x
+
+        if self.pending:
+            self.pending = False
+            if err > self.fallback_residual:
+                self.enabled = False
+                return self.fallback
+
+        self.history = (self.history + [x])[-3:]
+        self.residuals = (self.residuals + [err])[-3:]
+        if len(self.history) < 3 or self.convergence.iterations % self.every != 0:
+            return x
+
+        e0, e1, e2 = self.residuals
+        if e0 == 0 or e1 == 0:
+            return x
+        r1 = e1 / e0
+        r2 = e2 / e1
+        if r2 >= 1 or abs(r1 - r2) > 0.05 * r2:
+            return x
+
+        self.pending = True
+        self.fallback = x
+        self.fallback_residual = err
+        self.convergence.extrapolations += 1
+
+        x = self.normalize(aitken(*self.history))
+        self.history = []
+        self.residuals = []
+        return x
+
+
+class Convergence:
+
+    def __init__(self, warm_start, acceleration):
+        self.warm_start = warm_start
+        self.acceleration = acceleration
+        self.iterations = 0
+        self.residual = None
+        self.extrapolations = 0
+        self.iteration_times = []
+        self.started = time.perf_counter()
+
+    def step(self, residual):
+        now = time.perf_counter()
+        self.iteration_times.append(now - self.started)
+        self.started = now
+        self.iterations += 1
+        self.residual = residual
+
+    def output(self):
+        return {
+            "iterations": self.iterations,
+            "residual": self.residual,
+            "iteration_times": self.iteration_times,
+            "warm_start": self.warm_start,
+            "acceleration": self.acceleration,
+            "extrapolations": self.extrapolations,
+        }
+
+
+def pagerank(G, alpha=0.85, personalization=None, max_iter=100, tol=1.0e-6, nstart=None, weight='weight',
+             dangling=None, acceleration=False, accelerate_every=10):
+    convergence = Convergence(nstart is not None, acceleration)
+    if len(G) == 0:
+        return {}, convergence.output()
+
+    # the stochastic form of G.to_directed(), kept as adjacency lists
+    out_edges = {}
+    for n in G:
+        nbrs = G[n]
+        degree = sum(d.get(weight, 1) for d in nbrs.values())
+        out_edges[n] = [(nbr, 0 if degree == 0 else d.get(weight, 1) / degree) for nbr, d in nbrs.items()]
+    N = len(out_edges)
+
+    if nstart is None:
+        x = dict.fromkeys(G, 1.0 / N)
+    else:
+        s = float(sum(nstart.values()))
+        x = dict((k, v / s) for k, v in nstart.items())
+
+    if personalization is None:
+        p = dict.fromkeys(G, 1.0 / N)
+    else:
+        s = float(sum(personalization.values()))
+        p = dict((k, v / s) for k, v in personalization.items())
+
+    if dangling is None:
+        dangling_weights = p
+    else:
+        s = float(sum(dangling.values()))
+        dangling_weights = dict((k, v / s) for k, v in dangling.items())
+
+    dangling_nodes = [n for n in G if sum(w for _, w in out_edges[n]) == 0.0]
+
+    def normalize(x):
+        s = float(sum(x.values()))
+        return dict((k, v / s) for k, v in x.items())
+
+    extrapolation = Extrapolation(acceleration, accelerate_every, normalize, convergence)
+
+    for _ in range(max_iter):
+        xlast = x
+        x = dict.fromkeys(xlast.keys(), 0)
+        danglesum = alpha * sum(xlast[n] for n in dangling_nodes)
+        for n in x:
+            for nbr, w in out_edges[n]:
+                x[nbr] += alpha * xlast[n] * w
+            x[n] += danglesum * dangling_weights.get(n, 0) + (1.0 - alpha) * p.get(n, 0)
+
+        err = sum([abs(x[n] - xlast[n]) for n in x])
+        convergence.step(err)
+        if err < N * tol:
+            return x, convergence.output()
+
+        x = extrapolation.step(x, err)
+
+    raise nx.PowerIterationFailedConvergence(max_iter)
+
+
+def eigenvector_centrality(G, max_iter=100, tol=1.0e-6, nstart=None, weight=None, acceleration=False,
+                           accelerate_every=10):
+    if len(G) == 0:
+        raise nx.NetworkXPointlessConcept('cannot compute centrality for the null graph')
+
+    convergence = Convergence(nstart is not None, acceleration)
+
+    if nstart is None:
+        nstart = {v: 1 for v in G}
+    if all(v == 0 for v in nstart.values()):
+        raise nx.NetworkXError('initial vector cannot have all zero values')
+
+    nstart_sum = sum(nstart.values())
+    x = {k: v / nstart_sum for k, v in nstart.items()}
+    nnodes = G.number_of_nodes()
+
+    def normalize(x):
+        norm = sqrt(sum(z ** 2 for z in x.values())) or 1
+        return {k: v / norm for k, v in x.items()}
+
+    extrapolation = Extrapolation(acceleration, accelerate_every, normalize, convergence)
+
+    for _ in range(max_iter):
+        xlast = x
+        # start with xlast times I to iterate with (A+I)
+        x = xlast.copy()
+        for n in x:
+            for nbr in G[n]:
+                x[nbr] += xlast[n] * G[n][nbr].get(weight, 1)
+
+        norm = sqrt(sum(z ** 2 for z in x.values())) or 1
+        x = {k: v / norm for k, v in x.items()}
+
+        err = sum(abs(x[n] - xlast[n]) for n in x)
+        convergence.step(err)
+        if err < nnodes * tol:
+            return x, convergence.output()
+
+        x = extrapolation.step(x, err)
+
+    raise nx.PowerIterationFailedConvergence(max_iter)
+
+
+def hits(G, max_iter=100, tol=1.0e-8, nstart=None, normalized=True, acceleration=False, accelerate_every=10):
+    convergence = Convergence(nstart is not None, acceleration)
+    if len(G) == 0:
+        return {}, {}, convergence.output()
+
+    if nstart is None:
+        h = dict.fromkeys(G, 1.0 / G.number_of_nodes())
+    else:
+        h = dict(nstart)
+        s = 1.0 / sum(h.values())
+        for k in h:
+            h[k] *= s
+
+    def normalize(h):
+        s = 1.0 / max(h.values())
+        return {k: v * s for k, v in h.items()}
+
+    extrapolation = Extrapolation(acceleration, accelerate_every, normalize, convergence)
+
+    i = 0
+    while True:
+        hlast = h
+        h = dict.fromkeys(hlast.keys(), 0)
+        a = dict.fromkeys(hlast.keys(), 0)
+
+        # a^T = hlast^T * G, then h = G * a
+        for n in h:
+            for nbr in G[n]:
+                a[nbr] += hlast[n] * G[n][nbr].get('weight', 1)
+        for n in h:
+            for nbr in G[n]:
+                h[n] += a[nbr] * G[n][nbr].get('weight', 1)
+
+        s = 1.0 / max(h.values())
+        for n in h:
+            h[n] *= s
+        s = 1.0 / max(a.values())
+        for n in a:
+            a[n] *= s
+
+        err = sum([abs(h[n] - hlast[n]) for n in h])
+        convergence.step(err)
+        if err < tol:
+            break
+        if i > max_iter:
+            raise nx.PowerIterationFailedConvergence(max_iter)
+        i += 1
+
+        h = extrapolation.step(h, err)
+
+    if normalized:
+        s = 1.0 / sum(a.values())
+        for n in a:
+            a[n] *= s
+        s = 1.0 / sum(h.values())
+        for n in h:
+            h[n] *= s
+
+    return h, a, convergence.output()
+
+
+class ConvergedVectors:
+
+    # Last converged vector per (lineage, algorithm). A lineage is whatever id the
+    # caller uses for successive versions of the same graph (e.g. one per day), and
+    # the stored vector becomes the default start point of the next run.
+
+    def __init__(self):
+        self.vectors = {}
+
+    def get(self, lineage, algorithm, nodes):
+        if lineage is None:
+            return None
+        return warm_start_vector(self.vectors.get((lineage, algorithm)), nodes)
+
+    def put(self, lineage, algorithm, vector):
+        if lineage is not None:
+            self.vectors[(lineage, algorithm)] = dict(vector)
+
+
+converged_vectors = ConvergedVectors()
+
+
+__end__ = '__end__'
@@ -13,13 +13,13 @@ from networkx.algorithms.connectivity import minimum_st_node_cut
 from networkx.algorithms.connectivity import minimum_st_edge_cut
 
 from services import check_graph_validity
+from services import dynamic_graph
 
 class Robustness:
 
-    def __init__(self):
+    def __init__(self, graph_store=None):
 
-
-        pass
+        self.graphs = dynamic_graph.graph_store if graph_store is None else graph_store
 
     def min_nodes_to_remove(self,graph,source_node,target_node):
 
@@ -115,6 +115,37 @@ class Robustness:
         print (output)
 
 
+        return [True, 'success', output]
+
+    def store_graph(self, graph_id, graph, directed=False):
+
+        cv = check_graph_validity.Graphs()
+        ret = cv.is_valid_graph(graph)
+        if(not ret[0]):
+            ret.append({})
+            return ret
+
+        dg = self.graphs.store(graph_id, graph, directed)
+
+        return [True, 'success', {"graph_id": graph_id, "version": dg.version}]
+
+    def update_graph(self, graph_id, add_nodes=None, add_edges=None, remove_edges=None, remove_nodes=None):
+
+        return self.graphs.update(graph_id, add_nodes=add_nodes, add_edges=add_edges, remove_edges=remove_edges,
+                                  remove_nodes=remove_nodes)
+
+    def connected_components(self, graph_id):
+
+        dg = self.graphs.get(graph_id)
+        if dg is None:
+            return [False, 'graph {} has not been stored'.format(graph_id), {}]
+
+        # components are maintained on every update_graph call, nothing is recomputed here
+        output = {}
+        output["connected_components"] = dg.connected_components()
+        output["degree"] = dg.degree()
+        output["version"] = dg.version
+
         return [True, 'success', output]
 
 __end__ = '__end__'
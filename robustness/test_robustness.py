@@ -2,6 +2,7 @@
 
 import unittest
 import robustness
+from services import dynamic_graph
 
 import networkx as nx
 
@@ -307,6 +308,63 @@ class TestRobustness(unittest.TestCase):
         ret = b.most_important_nodes_edges_subset(graph, source_nodes, target_nodes, 1, False, True)
         self.assertEqual([True, 'success', {'betweenness_centrality': [[(9, 10), (10, 6)], 2.0]}],ret)
 
+    def test_connected_components(self):
+        b = robustness.Robustness(graph_store=dynamic_graph.DynamicGraphs())
+        graph = {
+            "nodes": [1, 2, 3, 4, 5, 6],
+            "edges": [[1, 2], [2, 3], [4, 5]]
+        }
+
+        ret = b.connected_components('g')
+        self.assertEqual([False, 'graph g has not been stored', {}], ret)
+
+        ret = b.store_graph('g', graph)
+        self.assertEqual([True, 'success', {'graph_id': 'g', 'version': 0}], ret)
+
+        ret = b.connected_components('g')
+        self.assertCountEqual([[1, 2, 3], [4, 5], [6]], ret[2]['connected_components'])
+
+        # joining two components and splitting one in the same delta
+        ret = b.update_graph('g', add_edges=[[3, 4]], remove_edges=[[1, 2]])
+        self.assertEqual([True, 'success', {'graph_id': 'g', 'version': 1, 'nodes': 6, 'edges': 3, 'components': 3}],
+                         ret)
+
+        ret = b.connected_components('g')
+        self.assertCountEqual([[1], [2, 3, 4, 5], [6]], ret[2]['connected_components'])
+        self.assertEqual({1: 0, 2: 1, 3: 2, 4: 2, 5: 1, 6: 0}, ret[2]['degree'])
+
+        ret = b.update_graph('g', remove_nodes=[3])
+        self.assertCountEqual([[1], [2], [4, 5], [6]], b.connected_components('g')[2]['connected_components'])
+
+        ret = b.update_graph('g', remove_edges=[[1, 6]])
+        self.assertEqual([False, 'remove_edges at zero-indexed position 0 is not an edge of the graph', {}], ret)
+
+    def test_duplicate_removals(self):
+        b = robustness.Robustness(graph_store=dynamic_graph.DynamicGraphs())
+        graph = {
+            "nodes": [1, 2, 3, 4],
+            "edges": [[1, 2], [2, 3], [3, 4]]
+        }
+        b.store_graph('g', graph)
+
+        # the second removal of an edge or node is checked against the graph the
+        # first one leaves, and the stored graph is not touched
+        ret = b.update_graph('g', remove_edges=[[1, 2], [1, 2]])
+        self.assertEqual([False, 'remove_edges at zero-indexed position 1 is not an edge of the graph', {}], ret)
+
+        ret = b.update_graph('g', remove_edges=[[1, 2], [2, 1]])
+        self.assertEqual([False, 'remove_edges at zero-indexed position 1 is not an edge of the graph', {}], ret)
+
+        ret = b.update_graph('g', remove_nodes=[3, 3])
+        self.assertEqual([False, 'remove_nodes at zero-indexed position 1 is not a node of the graph', {}], ret)
+
+        self.assertCountEqual([[1, 2, 3, 4]], b.connected_components('g')[2]['connected_components'])
+
+        # an edge added by the delta can still be removed by it once
+        ret = b.update_graph('g', add_edges=[[1, 4]], remove_edges=[[1, 4], [1, 2]])
+        self.assertEqual([True, 'success', {'graph_id': 'g', 'version': 1, 'nodes': 4, 'edges': 2, 'components': 2}],
+                         ret)
+
 
 
 
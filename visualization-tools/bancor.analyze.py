@@ -0,0 +1,413 @@
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from web3.main import to_checksum_address
+
+# not part of the repository, README.md lists what it has to define
+from analytics.bancor.config import (
+    web3,
+    BANCOR_REGISTRY,
+    BNT,
+    USDB,
+    HISTORY_BEGIN_BLOCK,
+    CURRENT_BLOCK,
+    HISTORY_CHUNK_SIZE,
+    LIQUIDITY_DATA,
+    PROVIDERS_DATA,
+    PROVIDERS_TOKEN_DATA,
+    TOKENS_DATA,
+    ROI_DATA,
+    TOTAL_VOLUME_DATA,
+    GRAPHQL_ENDPOINT,
+    GRAPHQL_LOGS_QUERY,
+    EXCLUDED_RELAYS,
+)
+from analytics.uniswap.batch_rpc import BatchRpc, EthCall, failed
+from analytics.uniswap.block_timestamps import TimestampCache, load_block_timestamps
+from analytics.uniswap.csv_output import (
+    save_files,
+    save_tokens,
+    ticker,
+    providers_csv,
+    roi_csv,
+    summary_csv,
+    token_json,
+    write_if_changed,
+)
+from analytics.uniswap.ingestion import (
+    Adapter,
+    Ingestion,
+    Job,
+    LogSource,
+    update_is_required,
+)
+from analytics.uniswap.log_fetcher import LogFetcher
+from analytics.uniswap.relay_events import (
+    CONVERTER_EVENTS,
+    RELAY_COLUMNS,
+    RELAY_EVENTS,
+    RelayDecoder,
+    topics,
+)
+from analytics.uniswap.relay_stages import (
+    HISTORY,
+    PROVIDERS,
+    STAGES,
+    process_relay,
+)
+from analytics.uniswap.state_store import RelayStateStore
+from analytics.uniswap.structs import HistorySeries, RelayInfo
+from analytics.uniswap.token_metadata import (
+    TokenMetadataCache,
+    load_cached_token_metadata,
+)
+from analytics.utils import timeit
+
+rpc = BatchRpc(web3.provider.endpoint_uri)
+metadata_cache = TokenMetadataCache()
+timestamp_cache = TimestampCache()
+log_fetcher = LogFetcher(GRAPHQL_ENDPOINT, GRAPHQL_LOGS_QUERY, "bancor_logs")
+relay_decoder = RelayDecoder()
+ingestion = Ingestion(log_fetcher)
+state_store = RelayStateStore()
+
+# worker processes of the per-relay stages, None for one per core
+WORKERS = None
+# worker processes rendering the per-ticker output files
+OUTPUT_WORKERS = 1
+
+# exact chart timestamps when None, otherwise only every n-th chart block is
+# loaded and the timestamps in between are interpolated
+TIMESTAMP_INTERPOLATION_STEP = None
+
+# connectors relays are valued in, BNT is preferred when a relay has both
+BASE_TOKENS = {BNT: "BNT", USDB: "USDB"}
+UNIT = 10**18
+
+
+@timeit
+def load_relay_tokens() -> List[str]:
+    relay_tokens = rpc.eth_call(
+        [EthCall(BANCOR_REGISTRY, "getSmartTokens()", [], ["address[]"])],
+        strict=True,
+    )[0]
+    logging.info("Found {} relay tokens".format(len(relay_tokens)))
+    return [to_checksum_address(t) for t in relay_tokens]
+
+
+@timeit
+def load_converters(relay_tokens: List[str]) -> List[Optional[str]]:
+    converters = rpc.eth_call(
+        [EthCall(t, "owner()", [], ["address"], CURRENT_BLOCK) for t in relay_tokens]
+    )
+    return [None if failed(c) else to_checksum_address(c) for c in converters]
+
+
+@timeit
+def load_connectors(converters: List[str]) -> List[Optional[Tuple[str, str]]]:
+    results = rpc.eth_call(
+        [
+            EthCall(c, "connectorTokens(uint256)", [i], ["address"], CURRENT_BLOCK)
+            for c in converters
+            for i in (0, 1)
+        ]
+    )
+    connectors = []
+    for first, second in zip(results[::2], results[1::2]):
+        if failed(first) or failed(second):
+            connectors.append(None)
+        else:
+            connectors.append((to_checksum_address(first), to_checksum_address(second)))
+    return connectors
+
+
+def split_connectors(connectors: Tuple[str, str]) -> Optional[Tuple[str, str]]:
+    """Base and other connector of a relay, None when it has no base."""
+    for base in BASE_TOKENS:
+        if base in connectors:
+            others = [c for c in connectors if c != base]
+            return base, others[0] if others else base
+    return None
+
+
+def load_relay_data(
+    relay_tokens: List[str],
+    converters: List[Optional[str]],
+    connectors: List[Optional[Tuple[str, str]]],
+) -> List[RelayInfo]:
+    relays = []
+    for relay_token, converter, pair in zip(relay_tokens, converters, connectors):
+        if relay_token in EXCLUDED_RELAYS or converter is None or pair is None:
+            continue
+        split = split_connectors(pair)
+        if split is None:
+            continue
+        relays.append((relay_token, converter) + split)
+
+    metadata = load_cached_token_metadata(
+        rpc,
+        metadata_cache,
+        sorted({r[0] for r in relays} | {r[3] for r in relays}),
+    )
+    balances = rpc.eth_call(
+        [
+            EthCall(
+                token, "balanceOf(address)", [converter], ["uint256"], CURRENT_BLOCK
+            )
+            for (_, converter, base, other) in relays
+            for token in (base, other)
+        ]
+    )
+
+    infos = []
+    for (relay_token, converter, base, other), bnt_balance, token_balance in zip(
+        relays, balances[::2], balances[1::2]
+    ):
+        if metadata[relay_token] is None or metadata[other] is None:
+            continue
+        if failed(bnt_balance) or failed(token_balance):
+            logging.error(
+                "FUCKED UP {}: {}".format(
+                    relay_token, bnt_balance if failed(bnt_balance) else token_balance
+                )
+            )
+            continue
+        _, token_symbol, _, _ = metadata[relay_token]
+        _, underlying_symbol, token_decimals, _ = metadata[other]
+        info = RelayInfo(relay_token, token_symbol.strip("\x00"), converter)
+        info.underlying_token_symbol = underlying_symbol.strip("\x00")
+        info.underlying_token_address = other
+        info.base_token_symbol = BASE_TOKENS[base]
+        info.base_token_address = base
+        info.bnt_balance = bnt_balance
+        info.token_decimals = token_decimals
+        info.token_balance = token_balance
+        infos.append(info)
+    return infos
+
+
+@timeit
+def load_relay_infos(infos: List[RelayInfo]) -> List[RelayInfo]:
+    relay_tokens = load_relay_tokens()
+    converters = load_converters(relay_tokens)
+    connectors = load_connectors([c for c in converters if c is not None])
+    connectors_by_converter = dict(zip([c for c in converters if c], connectors))
+    new_infos = load_relay_data(
+        relay_tokens, converters, [connectors_by_converter.get(c) for c in converters]
+    )
+
+    known_relays = dict((info.token_address, info) for info in infos)
+    for new_info in new_infos:
+        info = known_relays.get(new_info.token_address)
+        if info:
+            # a relay keeps its history when its converter is upgraded
+            new_info.providers = info.providers
+            new_info.history = info.history
+            infos[infos.index(info)] = new_info
+        else:
+            infos.append(new_info)
+
+    logging.info("Loaded info about {} relays".format(len(new_infos)))
+    return infos
+
+
+def get_chart_range(start: int = HISTORY_BEGIN_BLOCK) -> Iterable[int]:
+    return range(start, CURRENT_BLOCK, HISTORY_CHUNK_SIZE)
+
+
+@timeit
+def load_timestamps() -> List[int]:
+    return load_block_timestamps(
+        rpc, timestamp_cache, get_chart_range(), TIMESTAMP_INTERPOLATION_STEP
+    )
+
+
+def apply_results(info: RelayInfo, result: Dict):
+    if PROVIDERS in result:
+        info.providers = result[PROVIDERS]
+    if HISTORY in result:
+        info.history = HistorySeries.from_columns(**result[HISTORY])
+
+
+class BancorAdapter(Adapter):
+    name = "bancor"
+    events_dir = "bancor_events"
+    columns = RELAY_COLUMNS
+    sources = [
+        LogSource(
+            "converters",
+            lambda info: info.converter_address,
+            lambda _: [topics(CONVERTER_EVENTS)],
+        ),
+        LogSource(
+            "relays", lambda info: info.token_address, lambda _: [topics(RELAY_EVENTS)]
+        ),
+    ]
+    stages = STAGES
+    reduce = staticmethod(process_relay)
+
+    def discover(self, infos: List[RelayInfo]) -> List[RelayInfo]:
+        infos = sorted(
+            load_relay_infos(infos), key=lambda x: x.bnt_balance, reverse=True
+        )
+        return [info for info in infos if info.token_address not in EXCLUDED_RELAYS]
+
+    def key(self, info: RelayInfo) -> str:
+        return info.token_address
+
+    def decode(self, info: RelayInfo, logs: List[dict]) -> Dict:
+        return relay_decoder.decode(logs, info.token_address)
+
+    def task(self, info: RelayInfo) -> tuple:
+        return (
+            info.token_address,
+            info.base_token_address,
+            info.underlying_token_address,
+        )
+
+    def apply(self, info: RelayInfo, result: Dict):
+        apply_results(info, result)
+
+
+adapter = BancorAdapter()
+
+
+@timeit
+def populate(infos: List[RelayInfo]) -> List[RelayInfo]:
+    # the stages recompute every relay from all of its stored events
+    ingestion.reduce([(adapter, infos)], get_chart_range(), WORKERS)
+    logging.info("Loaded providers and history of {} relays".format(len(infos)))
+    return infos
+
+
+def is_valuable(info: RelayInfo) -> bool:
+    return info.bnt_balance >= 1000 * UNIT
+
+
+def is_empty(info: RelayInfo) -> bool:
+    return info.bnt_balance <= UNIT
+
+
+def by_base(infos: List[RelayInfo]) -> Dict[str, List[RelayInfo]]:
+    groups = {symbol: [] for symbol in BASE_TOKENS.values()}
+    for info in infos:
+        groups[info.base_token_symbol].append(info)
+    return groups
+
+
+def save_summary(infos: List[RelayInfo], timestamps: List[int], path: str, column: str):
+    for base, base_infos in by_base(infos).items():
+        valuable_infos = [info for info in base_infos if is_valuable(info)]
+        other_infos = [info for info in base_infos if not is_valuable(info)]
+        write_if_changed(
+            path.format(base.lower()),
+            summary_csv(
+                timestamps,
+                [i.token_symbol for i in valuable_infos],
+                [i.history.column(column) for i in valuable_infos],
+                [i.history.column(column) for i in other_infos],
+            ),
+        )
+
+
+def save_liquidity_data(infos: List[RelayInfo], timestamps: List[int]):
+    save_summary(infos, timestamps, LIQUIDITY_DATA, "bnt_balance")
+
+
+def save_total_volume_data(infos: List[RelayInfo], timestamps: List[int]):
+    save_summary(infos, timestamps, TOTAL_VOLUME_DATA, "trade_volume")
+
+
+def save_providers_data(
+    infos: List[RelayInfo], workers: Optional[int] = OUTPUT_WORKERS
+):
+    save_files(
+        [PROVIDERS_DATA.format(ticker(info)) for info in infos],
+        providers_csv,
+        [
+            (info.providers, info.bnt_balance, info.base_token_symbol.lower())
+            for info in infos
+        ],
+        workers,
+    )
+    for info in infos:
+        write_if_changed(
+            PROVIDERS_TOKEN_DATA.format(ticker(info)),
+            token_json(
+                info.underlying_token_symbol,
+                info.token_balance / 10**info.token_decimals,
+            ),
+        )
+
+
+def save_roi_data(
+    infos: List[RelayInfo],
+    timestamps: List[int],
+    workers: Optional[int] = OUTPUT_WORKERS,
+):
+    save_files(
+        [ROI_DATA.format(ticker(info)) for info in infos],
+        roi_csv,
+        [(timestamps, info.history, "bnt_balance") for info in infos],
+        workers,
+    )
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    saved_block = state_store.last_block()
+    if saved_block is None or update_is_required(
+        saved_block, HISTORY_BEGIN_BLOCK, CURRENT_BLOCK, HISTORY_CHUNK_SIZE
+    ):
+        if saved_block is None:
+            logging.info("Starting from scratch...")
+            infos = []
+        else:
+            logging.info(
+                "Last seen block: {}, current block: {}, loading data for {} blocks...".format(
+                    saved_block, CURRENT_BLOCK, CURRENT_BLOCK - saved_block
+                )
+            )
+            infos = state_store.load()
+        known_relays = set(info.token_address for info in infos)
+        infos = adapter.discover(infos)
+
+        # relays seen before only need the new blocks, new ones all of them
+        jobs = [
+            Job(
+                adapter,
+                [info for info in infos if info.token_address not in known_relays],
+                HISTORY_BEGIN_BLOCK,
+            )
+        ]
+        if saved_block is not None:
+            jobs.append(
+                Job(
+                    adapter,
+                    [info for info in infos if info.token_address in known_relays],
+                    saved_block + 1,
+                )
+            )
+        ingestion.ingest(jobs, CURRENT_BLOCK)
+        populate(infos)
+        state_store.save(infos, CURRENT_BLOCK)
+        ingestion.clear(jobs)
+        ingestion.compact(jobs, CURRENT_BLOCK)
+    else:
+        logging.info("Loaded data is up to date")
+        infos = state_store.load()
+
+    not_empty_infos = [info for info in infos if not is_empty(info)]
+    timestamps = load_timestamps()
+
+    save_liquidity_data(infos, timestamps)
+    save_total_volume_data(infos, timestamps)
+
+    save_tokens(not_empty_infos, TOKENS_DATA)
+    save_providers_data(not_empty_infos)
+    save_roi_data(not_empty_infos, timestamps)
+
+
+if __name__ == "__main__":
+    main()
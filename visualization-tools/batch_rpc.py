@@ -0,0 +1,183 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List, Sequence, Tuple, Union
+
+import requests
+from eth_abi import decode_abi, encode_abi
+from eth_utils import function_signature_to_4byte_selector
+from retrying import retry
+
+BATCH_SIZE = 200
+MAX_WORKERS = 8
+TIMEOUT = 60
+
+Block = Union[int, str]
+
+
+class RpcError(Exception):
+    pass
+
+
+def block_param(block: Block) -> str:
+    return hex(block) if isinstance(block, int) else block
+
+
+class EthCall:
+    """A single read-only contract call.
+
+    Args:
+        to: contract address
+        signature: function signature, e.g. ``"balanceOf(address)"``
+        args: function arguments
+        output_types: ABI types of the return values
+        block: block number or tag the call is made at
+    """
+
+    def __init__(
+        self,
+        to: str,
+        signature: str,
+        args: Sequence = (),
+        output_types: Sequence[str] = (),
+        block: Block = "latest",
+    ):
+        self.to = to
+        self.signature = signature
+        self.args = list(args)
+        self.output_types = list(output_types)
+        self.block = block
+
+    def arg_types(self) -> List[str]:
+        types = self.signature[self.signature.index("(") + 1 : -1]
+        return types.split(",") if types else []
+
+    def request(self) -> Tuple[str, list]:
+        data = function_signature_to_4byte_selector(self.signature) + encode_abi(
+            self.arg_types(), self.args
+        )
+        return (
+            "eth_call",
+            [{"to": self.to, "data": "0x" + data.hex()}, block_param(self.block)],
+        )
+
+    def decode(self, result: str) -> Any:
+        data = bytes.fromhex(result[2:] if result.startswith("0x") else result)
+        if not data and self.output_types:
+            # calling a function the contract does not have returns nothing
+            # instead of reverting when the contract has a fallback function
+            raise RpcError("{} returned no data".format(self.signature))
+        values = decode_abi(self.output_types, data)
+        return values[0] if len(values) == 1 else values
+
+
+class BatchRpc:
+    """JSON-RPC client that packs requests into batches.
+
+    Batches of up to ``batch_size`` requests are posted by at most
+    ``max_workers`` threads at a time. A failed request does not fail its
+    batch: its slot in the result list holds an ``RpcError`` instead.
+
+    Args:
+        endpoint: HTTP JSON-RPC endpoint of the node
+        batch_size: requests per HTTP POST
+        max_workers: batches in flight at the same time
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        batch_size: int = BATCH_SIZE,
+        max_workers: int = MAX_WORKERS,
+        timeout: int = TIMEOUT,
+    ):
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    @retry(stop_max_attempt_number=3, wait_fixed=1000)
+    def _post(self, payload: List[dict]) -> Any:
+        resp = self.session.post(self.endpoint, json=payload, timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    def _send(self, batch: Sequence[Tuple[str, list]]) -> List[Any]:
+        payload = [
+            {"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+            for i, (method, params) in enumerate(batch)
+        ]
+        try:
+            responses = self._post(payload)
+        except Exception as e:
+            logging.exception("Batch of {} requests failed".format(len(batch)))
+            return [RpcError(str(e))] * len(batch)
+
+        if not isinstance(responses, list):
+            # the node rejected the batch as a whole
+            return [RpcError(str(responses.get("error")))] * len(batch)
+
+        by_id = {r.get("id"): r for r in responses}
+        results = []
+        for i in range(len(batch)):
+            response = by_id.get(i)
+            if response is None:
+                results.append(RpcError("no response"))
+            elif response.get("error") is not None:
+                results.append(RpcError(str(response["error"].get("message"))))
+            else:
+                results.append(response.get("result"))
+        return results
+
+    def request(self, requests: Sequence[Tuple[str, list]]) -> List[Any]:
+        """Sends ``(method, params)`` requests, results come back in order."""
+        batches = [
+            requests[i : i + self.batch_size]
+            for i in range(0, len(requests), self.batch_size)
+        ]
+        if len(batches) <= 1:
+            return [r for batch in batches for r in self._send(batch)]
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return [r for batch in executor.map(self._send, batches) for r in batch]
+
+    def eth_call(self, calls: Sequence[EthCall], strict: bool = False) -> List[Any]:
+        """Runs contract calls and decodes their return values.
+
+        Args:
+            calls: calls to run
+            strict: raise the first failure instead of returning it in place
+
+        Returns:
+            decoded return values, or ``RpcError`` for calls that failed
+        """
+        results = []
+        for call, result in zip(calls, self.request([c.request() for c in calls])):
+            if not isinstance(result, RpcError):
+                try:
+                    result = call.decode(result)
+                except Exception as e:
+                    result = RpcError("{}: {}".format(call.signature, e))
+            if strict and isinstance(result, RpcError):
+                raise result
+            results.append(result)
+        return results
+
+    def get_balances(
+        self, addresses: Sequence[str], block: Block = "latest", strict: bool = False
+    ) -> List[Any]:
+        """Ether balances of ``addresses`` at ``block``."""
+        results = []
+        for result in self.request(
+            [("eth_getBalance", [a, block_param(block)]) for a in addresses]
+        ):
+            if not isinstance(result, RpcError):
+                result = int(result, 16)
+            elif strict:
+                raise result
+            results.append(result)
+        return results
+
+
+def failed(result: Any) -> bool:
+    return isinstance(result, RpcError)
@@ -0,0 +1,115 @@
+import logging
+import sqlite3
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from analytics.uniswap.batch_rpc import BatchRpc, RpcError, block_param, failed
+
+TIMESTAMPS_CACHE = "block_timestamps.sqlite"
+
+
+class TimestampCache:
+    """Block timestamps, kept in SQLite between runs.
+
+    Chart blocks are the same on every run, so only the blocks added since
+    the last run are asked from the node.
+
+    Args:
+        path: SQLite database file
+    """
+
+    def __init__(self, path: str = TIMESTAMPS_CACHE):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS block_timestamps ("
+            "block_number INTEGER PRIMARY KEY, timestamp INTEGER NOT NULL)"
+        )
+        self.connection.commit()
+
+    def get_many(self, block_numbers: Sequence[int]) -> Dict[int, int]:
+        """Returns the cached blocks among ``block_numbers``."""
+        if not len(block_numbers):
+            return dict()
+        rows = self.connection.execute(
+            "SELECT block_number, timestamp FROM block_timestamps "
+            "WHERE block_number BETWEEN ? AND ?",
+            (int(min(block_numbers)), int(max(block_numbers))),
+        )
+        wanted = set(block_numbers)
+        return {row[0]: row[1] for row in rows if row[0] in wanted}
+
+    def put_many(self, timestamps: Dict[int, int]):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO block_timestamps VALUES (?, ?)",
+            [(int(b), int(t)) for b, t in timestamps.items()],
+        )
+        self.connection.commit()
+
+
+def fetch_timestamps(rpc: BatchRpc, block_numbers: Sequence[int]) -> Dict[int, int]:
+    """Timestamps of ``block_numbers``, asked from the node in batches."""
+    results = rpc.request(
+        [("eth_getBlockByNumber", [block_param(int(n)), False]) for n in block_numbers]
+    )
+    timestamps = dict()
+    for block_number, result in zip(block_numbers, results):
+        if failed(result):
+            raise result
+        if result is None:
+            raise RpcError("block {} is not known".format(block_number))
+        timestamps[int(block_number)] = int(result["timestamp"], 16)
+    return timestamps
+
+
+def load_block_timestamps(
+    rpc: BatchRpc,
+    cache: TimestampCache,
+    block_numbers: Sequence[int],
+    interpolation_step: Optional[int] = None,
+) -> List[int]:
+    """Timestamps of ``block_numbers``, which are sorted.
+
+    Only blocks missing from ``cache`` are fetched. With ``interpolation_step``
+    just every n-th block and the last one are loaded exactly, the timestamps
+    in between are interpolated linearly by block number and not cached.
+
+    Args:
+        rpc: client of the node
+        cache: timestamps loaded by earlier runs
+        block_numbers: blocks to get the timestamps of
+        interpolation_step: exact timestamps when None
+
+    Returns:
+        timestamps in the order of ``block_numbers``
+    """
+    block_numbers = [int(n) for n in block_numbers]
+    if interpolation_step is None or len(block_numbers) <= 2:
+        exact = block_numbers
+    else:
+        exact = block_numbers[::interpolation_step]
+        if exact[-1] != block_numbers[-1]:
+            exact.append(block_numbers[-1])
+
+    timestamps = cache.get_many(block_numbers)
+    missing = [n for n in exact if n not in timestamps]
+    if missing:
+        loaded = fetch_timestamps(rpc, missing)
+        cache.put_many(loaded)
+        timestamps.update(loaded)
+    logging.info(
+        "Block timestamps: {} cached, {} loaded, {} interpolated".format(
+            len(timestamps) - len(missing),
+            len(missing),
+            len(block_numbers) - len(timestamps),
+        )
+    )
+    if len(timestamps) == len(block_numbers):
+        return [timestamps[n] for n in block_numbers]
+
+    known = sorted(timestamps)
+    interpolated = np.interp(block_numbers, known, [timestamps[n] for n in known])
+    return [
+        timestamps[n] if n in timestamps else int(round(t))
+        for n, t in zip(block_numbers, interpolated)
+    ]
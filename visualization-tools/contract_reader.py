@@ -1,29 +1,132 @@
 """Module that reads batch auction data from smart contract."""
-from typing import Dict, List
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Sequence, Tuple, Union
 from web3 import Web3
+from web3.exceptions import BadFunctionCallOutput
 from decimal import Decimal
 import logging
+import os
+import sqlite3
+import time
+import numpy as np
+
+from batch_rpc import BatchRpc, EthCall
 
 # Set smart contract info.
 abi = '[{"constant":true,"inputs":[],"name":"IMPROVEMENT_DENOMINATOR","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"getSecondsRemainingInBatch","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"getEncodedOrders","outputs":[{"name":"elements","type":"bytes"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"buyToken","type":"uint16"},{"name":"sellToken","type":"uint16"},{"name":"validUntil","type":"uint32"},{"name":"buyAmount","type":"uint128"},{"name":"sellAmount","type":"uint128"}],"name":"placeOrder","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":false,"inputs":[{"name":"batchId","type":"uint32"},{"name":"claimedObjectiveValue","type":"uint256"},{"name":"owners","type":"address[]"},{"name":"orderIds","type":"uint16[]"},{"name":"buyVolumes","type":"uint128[]"},{"name":"prices","type":"uint128[]"},{"name":"tokenIdsForPrice","type":"uint16[]"}],"name":"submitSolution","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[{"name":"id","type":"uint16"}],"name":"tokenIdToAddressMap","outputs":[{"name":"","type":"address"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"token","type":"address"},{"name":"amount","type":"uint256"}],"name":"requestWithdraw","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[],"name":"FEE_FOR_LISTING_TOKEN_IN_OWL","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"name":"previousPageUser","type":"address"},{"name":"pageSize","type":"uint16"}],"name":"getUsersPaginated","outputs":[{"name":"users","type":"bytes"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"token","type":"address"},{"name":"amount","type":"uint256"}],"name":"deposit","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":false,"inputs":[{"name":"orderIds","type":"uint16[]"}],"name":"cancelOrders","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[],"name":"AMOUNT_MINIMUM","outputs":[{"name":"","type":"uint128"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"feeToken","outputs":[{"name":"","type":"address"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"buyTokens","type":"uint16[]"},{"name":"sellTokens","type":"uint16[]"},{"name":"validFroms","type":"uint32[]"},{"name":"validUntils","type":"uint32[]"},{"name":"buyAmounts","type":"uint128[]"},{"name":"sellAmounts","type":"uint128[]"}],"name":"placeValidFromOrders","outputs":[{"name":"orderIds","type":"uint16[]"}],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[{"name":"","type":"uint16"}],"name":"currentPrices","outputs":[{"name":"","type":"uint128"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"name":"user","type":"address"}],"name":"getEncodedUserOrders","outputs":[{"name":"elements","type":"bytes"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"name":"","type":"address"},{"name":"","type":"uint256"}],"name":"orders","outputs":[{"name":"buyToken","type":"uint16"},{"name":"sellToken","type":"uint16"},{"name":"validFrom","type":"uint32"},{"name":"validUntil","type":"uint32"},{"name":"priceNumerator","type":"uint128"},{"name":"priceDenominator","type":"uint128"},{"name":"usedAmount","type":"uint128"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"UNLIMITED_ORDER_AMOUNT","outputs":[{"name":"","type":"uint128"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"numTokens","outputs":[{"name":"","type":"uint16"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"name":"","type":"address"},{"name":"","type":"address"}],"name":"lastCreditBatchId","outputs":[{"name":"","type":"uint32"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"name":"previousPageUser","type":"address"},{"name":"previousPageUserOffset","type":"uint16"},{"name":"pageSize","type":"uint16"}],"name":"getEncodedUsersPaginated","outputs":[{"name":"elements","type":"bytes"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"name":"addr","type":"address"}],"name":"hasToken","outputs":[{"name":"","type":"bool"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"latestSolution","outputs":[{"name":"batchId","type":"uint32"},{"name":"solutionSubmitter","type":"address"},{"name":"feeReward","type":"uint256"},{"name":"objectiveValue","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"name":"user","type":"address"},{"name":"token","type":"address"}],"name":"getPendingDeposit","outputs":[{"name":"","type":"uint256"},{"name":"","type":"uint32"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"cancellations","type":"uint16[]"},{"name":"buyTokens","type":"uint16[]"},{"name":"sellTokens","type":"uint16[]"},{"name":"validFroms","type":"uint32[]"},{"name":"validUntils","type":"uint32[]"},{"name":"buyAmounts","type":"uint128[]"},{"name":"sellAmounts","type":"uint128[]"}],"name":"replaceOrders","outputs":[{"name":"","type":"uint16[]"}],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[{"name":"user","type":"address"},{"name":"token","type":"address"}],"name":"getPendingWithdraw","outputs":[{"name":"","type":"uint256"},{"name":"","type":"uint32"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"name":"batchId","type":"uint32"}],"name":"acceptingSolutions","outputs":[{"name":"","type":"bool"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"token","type":"address"}],"name":"addToken","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[{"name":"user","type":"address"},{"name":"token","type":"address"}],"name":"getBalance","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"FEE_DENOMINATOR","outputs":[{"name":"","type":"uint128"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"ENCODED_AUCTION_ELEMENT_WIDTH","outputs":[{"name":"","type":"uint128"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"BATCH_TIME","outputs":[{"name":"","type":"uint32"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"getCurrentBatchId","outputs":[{"name":"","type":"uint32"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"name":"user","type":"address"},{"name":"offset","type":"uint16"},{"name":"pageSize","type":"uint16"}],"name":"getEncodedUserOrdersPaginated","outputs":[{"name":"elements","type":"bytes"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[{"name":"addr","type":"address"}],"name":"tokenAddressToIdMap","outputs":[{"name":"","type":"uint16"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"token","type":"address"},{"name":"amount","type":"uint256"},{"name":"batchId","type":"uint32"}],"name":"requestFutureWithdraw","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[{"name":"user","type":"address"},{"name":"token","type":"address"}],"name":"hasValidWithdrawRequest","outputs":[{"name":"","type":"bool"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"MAX_TOKENS","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":false,"inputs":[{"name":"user","type":"address"},{"name":"token","type":"address"}],"name":"withdraw","outputs":[],"payable":false,"stateMutability":"nonpayable","type":"function"},{"constant":true,"inputs":[],"name":"MAX_TOUCHED_ORDERS","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"constant":true,"inputs":[],"name":"getCurrentObjectiveValue","outputs":[{"name":"","type":"uint256"}],"payable":false,"stateMutability":"view","type":"function"},{"inputs":[{"name":"maxTokens","type":"uint256"},{"name":"_feeToken","type":"address"}],"payable":false,"stateMutability":"nonpayable","type":"constructor"},{"anonymous":false,"inputs":[{"indexed":true,"name":"owner","type":"address"},{"indexed":false,"name":"index","type":"uint16"},{"indexed":true,"name":"buyToken","type":"uint16"},{"indexed":true,"name":"sellToken","type":"uint16"},{"indexed":false,"name":"validFrom","type":"uint32"},{"indexed":false,"name":"validUntil","type":"uint32"},{"indexed":false,"name":"priceNumerator","type":"uint128"},{"indexed":false,"name":"priceDenominator","type":"uint128"}],"name":"OrderPlacement","type":"event"},{"anonymous":false,"inputs":[{"indexed":false,"name":"token","type":"address"},{"indexed":false,"name":"id","type":"uint16"}],"name":"TokenListing","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"name":"owner","type":"address"},{"indexed":false,"name":"id","type":"uint16"}],"name":"OrderCancellation","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"name":"owner","type":"address"},{"indexed":false,"name":"id","type":"uint16"}],"name":"OrderDeletion","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"name":"owner","type":"address"},{"indexed":true,"name":"orderId","type":"uint16"},{"indexed":true,"name":"sellToken","type":"uint16"},{"indexed":false,"name":"buyToken","type":"uint16"},{"indexed":false,"name":"executedSellAmount","type":"uint128"},{"indexed":false,"name":"executedBuyAmount","type":"uint128"}],"name":"Trade","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"name":"owner","type":"address"},{"indexed":true,"name":"orderId","type":"uint16"},{"indexed":true,"name":"sellToken","type":"uint16"},{"indexed":false,"name":"buyToken","type":"uint16"},{"indexed":false,"name":"executedSellAmount","type":"uint128"},{"indexed":false,"name":"executedBuyAmount","type":"uint128"}],"name":"TradeReversion","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"name":"submitter","type":"address"},{"indexed":false,"name":"utility","type":"uint256"},{"indexed":false,"name":"disregardedUtility","type":"uint256"},{"indexed":false,"name":"burntFees","type":"uint256"},{"indexed":false,"name":"lastAuctionBurntFees","type":"uint256"},{"indexed":false,"name":"prices","type":"uint128[]"},{"indexed":false,"name":"tokenIdsForPrice","type":"uint16[]"}],"name":"SolutionSubmission","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"name":"user","type":"address"},{"indexed":true,"name":"token","type":"address"},{"indexed":false,"name":"amount","type":"uint256"},{"indexed":false,"name":"batchId","type":"uint32"}],"name":"Deposit","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"name":"user","type":"address"},{"indexed":true,"name":"token","type":"address"},{"indexed":false,"name":"amount","type":"uint256"},{"indexed":false,"name":"batchId","type":"uint32"}],"name":"WithdrawRequest","type":"event"},{"anonymous":false,"inputs":[{"indexed":true,"name":"user","type":"address"},{"indexed":true,"name":"token","type":"address"},{"indexed":false,"name":"amount","type":"uint256"}],"name":"Withdraw","type":"event"}]'
 
+# Orders are encoded as 112 bytes each (see _read_order_from_bytes).
+ORDER_BYTES = 112
 
-class ContractReader:
-    def __init__(self, network="mainnet"):
-        # Specify Infura credentials
-        node_url = (
-            "https://" + network + ".infura.io/v3/9408f47dedf04716a03ef994182cf150"
+# Orderbook pages start at PAGE_SIZE orders. The size doubles while pages
+# come back within PAGE_SECONDS, up to MAX_PAGE_SIZE, and is halved when the
+# node fails a page (e.g. because the call runs out of gas).
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 5000
+PAGE_SECONDS = 2.0
+PAGE_ERRORS = ("out of gas", "gas required exceeds", "revert")
+
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+
+# Kept next to this module, so every working directory shares one cache.
+TOKEN_ID_CACHE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "token_ids.sqlite"
+)
+
+Block = Union[int, str]
+
+
+class TokenIdCache:
+    """Token addresses by token ID, kept in SQLite between runs.
+
+    A listed token keeps its ID, so a cached address never goes stale. IDs
+    that are not listed (yet) are not cached.
+
+    Args:
+        path: SQLite database file
+
+    """
+
+    def __init__(self, path: str = TOKEN_ID_CACHE):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS token_ids ("
+            "contract TEXT NOT NULL, token_id INTEGER NOT NULL, "
+            "token_address TEXT NOT NULL, PRIMARY KEY (contract, token_id))"
+        )
+        self.connection.commit()
+
+    def get_many(self, contract: str, token_ids: Sequence[int]) -> Dict[int, str]:
+        """Returns the cached tokens among token_ids."""
+        wanted = set(token_ids)
+        rows = self.connection.execute(
+            "SELECT token_id, token_address FROM token_ids WHERE contract = ?",
+            (contract,),
+        )
+        return {row[0]: row[1] for row in rows if row[0] in wanted}
+
+    def put_many(self, contract: str, token_addresses: Dict[int, str]):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO token_ids VALUES (?, ?, ?)",
+            [
+                (contract, token_id, address)
+                for token_id, address in token_addresses.items()
+                if int(address, 16) != 0
+            ],
         )
+        self.connection.commit()
+
+
+class ContractReader:
+    """Reads the batch auction contract.
+
+    Args:
+        network: 'mainnet' or 'rinkeby'
+        node_url: node to read from instead of Infura
+        snapshot: read everything at the block that is current on creation,
+            so orders, batch ID and balances are consistent with each other
+        token_id_cache: SQLite file of the token addresses by token ID
+
+    """
+
+    def __init__(
+        self,
+        network="mainnet",
+        node_url=None,
+        snapshot=False,
+        token_id_cache=TOKEN_ID_CACHE,
+    ):
+        # Specify Infura credentials, unless another node (e.g. the replay
+        # server) is given.
+        if node_url is None:
+            node_url = (
+                "https://" + network + ".infura.io/v3/9408f47dedf04716a03ef994182cf150"
+            )
         addresses = {
             "mainnet": "0x6F400810b62df8E13fded51bE75fF5393eaa841F",
             "rinkeby": "0xC576eA7bd102F7E476368a5E98FA455d1Ea34dE2",
         }
-        web3 = Web3(Web3.HTTPProvider(node_url))
-        self.contract = web3.eth.contract(address=addresses[network], abi=abi)
+        self.web3 = Web3(Web3.HTTPProvider(node_url))
+        self.contract = self.web3.eth.contract(address=addresses[network], abi=abi)
+        self.rpc = BatchRpc(node_url)
+        self.token_id_cache_path = token_id_cache
+        self.block_identifier: Block = "latest"
+        if snapshot:
+            self.pin()
+
+    def pin(self, block_identifier: Block = None):
+        """Pin all reads to a block, the current one by default."""
+        if block_identifier is None:
+            block_identifier = self.web3.eth.blockNumber
+        self.block_identifier = block_identifier
+        logging.info("Reading the contract at block %s" % block_identifier)
 
     def get_current_batch_id(self):
         """Get ID of current batch."""
-        return self.contract.functions.getCurrentBatchId().call()
+        return self.contract.functions.getCurrentBatchId().call(
+            block_identifier=self.block_identifier
+        )
 
     def get_current_orderbook(self):
         """Get all currently valid orders from smart contract.
@@ -52,76 +155,117 @@ class ContractReader:
             A list of all orders.
 
         """
-        orders_raw = []
+        orders = []
 
-        # Get orders via paginated approach.
-        page_size = 100
-        current_user = "0x0000000000000000000000000000000000000000"
+        # Get orders via paginated approach. The cursor of the next page only
+        # needs the account IDs of the current one, so the next page is
+        # requested before the current one is decoded.
+        current_user = ZERO_ADDRESS
         current_offset = 0
-        last_page_size = page_size
-
-        # Read unprocessed order data.
-        while last_page_size == page_size:
+        page_size = PAGE_SIZE
+        max_page_size = MAX_PAGE_SIZE
 
-            orders_decoded_raw = decode_orders(
-                self.contract.functions.getEncodedUsersPaginated(
-                    Web3.toChecksumAddress(current_user), current_offset, page_size
-                ).call()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            request = executor.submit(
+                self._read_page, current_user, current_offset, page_size
             )
+            while True:
+                page, read_size, seconds = request.result()
+                if read_size < page_size:
+                    # Do not grow back to a page size the node failed.
+                    max_page_size = read_size
+                page_size = read_size
+                full = len(page) == page_size * ORDER_BYTES
+                if full:
+                    current_user, current_offset = next_cursor(
+                        page, current_user, current_offset
+                    )
+                    if seconds < PAGE_SECONDS:
+                        page_size = min(2 * page_size, max_page_size)
+                    request = executor.submit(
+                        self._read_page, current_user, current_offset, page_size
+                    )
+
+                orders.extend(page_orders(page))
+                if not full:
+                    break
 
-            orders_raw += orders_decoded_raw
-            if len(orders_decoded_raw) > 0:
-                current_user = orders_decoded_raw[-1]["accountID"]
-                current_offset = len(
-                    [o for o in orders_raw if o["accountID"] == current_user]
-                )
+        return orders
 
-            last_page_size = len(orders_decoded_raw)
+    def _read_page(
+        self, user: str, offset: int, page_size: int
+    ) -> Tuple[bytes, int, float]:
+        """Read one page of encoded orders, halving the page size while the
+        call runs out of gas or reverts.
 
-        # Process order data.
-        orders = []
-        for o in orders_raw:
+        Returns:
+            The encoded orders, the page size they were read with and the
+            seconds the read took.
 
-            # Set token names.
-            sell_token = "T%04d" % o["sellToken"]
-            buy_token = "T%04d" % o["buyToken"]
+        """
+        while True:
+            start = time.monotonic()
+            try:
+                page = self.contract.functions.getEncodedUsersPaginated(
+                    Web3.toChecksumAddress(user), offset, page_size
+                ).call(block_identifier=self.block_identifier)
+                return page, page_size, time.monotonic() - start
+            except (ValueError, BadFunctionCallOutput) as e:
+                if page_size == 1 or not is_page_too_large(e):
+                    raise
+                page_size //= 2
+                logging.warning(
+                    "Reading orders failed, retrying with pages of %d" % page_size
+                )
 
-            # Get sell amount.
-            sell_amount = Decimal(min(o["remainingAmount"], o["sellTokenBalance"]))
-            if sell_amount == 0:
-                continue
+    def get_token_addresses(self, tokens: List[str]) -> Dict[str, str]:
+        """Get the addresses of tokens, from the cache where possible.
 
-            # Compute buy amount from sell amount and limit price.
-            limit_price = Decimal(o["priceNumerator"]) / Decimal(o["priceDenominator"])
-            if limit_price == 0:
-                buy_amount = 1
-            else:
-                buy_amount = (sell_amount * limit_price).to_integral_value()
+        Args:
+            tokens: List of tokens with their JSON name (i.e., 'T0001' etc.)
 
-            logging.debug(
-                "Read order: sellAmount %40d %7s -- buyAmount %40d %7s -- accountID %s"
-                % (sell_amount, sell_token, buy_amount, buy_token, o["accountID"])
-            )
+        Returns:
+            A dict of the token addresses.
 
-            orders.append(
-                {
-                    "accountID": o["accountID"],
-                    "sellToken": sell_token,
-                    "buyToken": buy_token,
-                    "sellAmount": str(int(sell_amount)),
-                    "buyAmount": str(int(buy_amount)),
-                    "validFrom": o["validFrom"],
-                    "validUntil": o["validUntil"],
-                }
+        """
+        token_ids = {t: int(t.replace("T", "")) for t in tokens}
+        cache = TokenIdCache(self.token_id_cache_path)
+        addresses = cache.get_many(self.contract.address, list(token_ids.values()))
+
+        missing = sorted(set(token_ids.values()) - set(addresses))
+        if missing:
+            loaded = dict(
+                zip(
+                    missing,
+                    self.rpc.eth_call(
+                        [
+                            EthCall(
+                                self.contract.address,
+                                "tokenIdToAddressMap(uint16)",
+                                [tID],
+                                ["address"],
+                                self.block_identifier,
+                            )
+                            for tID in missing
+                        ],
+                        strict=True,
+                    ),
+                )
             )
+            loaded = {tID: Web3.toChecksumAddress(a) for tID, a in loaded.items()}
+            cache.put_many(self.contract.address, loaded)
+            addresses.update(loaded)
 
-        return orders
+        return {t: addresses[tID] for t, tID in token_ids.items()}
 
     def get_account_balances(
         self, tokens: List[str], orders: List[Dict]
     ) -> Dict[str, Dict[str, str]]:
         """Get account balances of the sell tokens of all orders.
 
+        All balances are read in JSON-RPC batches at one block: the pinned
+        block, or the current one when no block is pinned.
+
         Args:
             tokens: List of tokens with their JSON name (i.e., 'token0' etc.)
             orders: List of extracted orders.
@@ -131,88 +275,219 @@ class ContractReader:
 
         """
         # Get token adresses first.
-        token_adresses = {}
-        for t in tokens:
-            tID = int(t.replace("T", ""))
-            token_adresses[t] = self.contract.functions.tokenIdToAddressMap(tID).call()
-
-        # Read account balances.
-        accounts = {}
+        token_adresses = self.get_token_addresses(tokens)
 
-        for o in orders:
-            tS = o["sellToken"]
-            aID = o["accountID"]
+        # Collect the (account, sell token) pairs to read.
+        pairs = list(dict.fromkeys((o["accountID"], o["sellToken"]) for o in orders))
 
-            if aID not in accounts:
-                accounts[aID] = {}
+        block = self.block_identifier
+        if block == "latest":
+            block = self.web3.eth.blockNumber
 
-            if tS not in accounts[aID]:
-                accounts[aID][tS] = str(
-                    self.contract.functions.getBalance(
-                        Web3.toChecksumAddress(aID), token_adresses[tS]
-                    ).call()
+        # Read account balances.
+        balances = self.rpc.eth_call(
+            [
+                EthCall(
+                    self.contract.address,
+                    "getBalance(address,address)",
+                    [Web3.toChecksumAddress(aID), token_adresses[tS]],
+                    ["uint256"],
+                    block,
                 )
+                for aID, tS in pairs
+            ],
+            strict=True,
+        )
 
-        return accounts
+        accounts = {}
+        for (aID, tS), balance in zip(pairs, balances):
+            accounts.setdefault(aID, {})[tS] = str(balance)
 
+        return accounts
 
-def decode_orders(orders_encoded):
-    """Decode order byte string into list of orders."""
-    orders_decoded = []
 
-    # Iterate over order byte strings (one order = 112 bytes).
-    for order_bytes in [
-        orders_encoded[k : k + 112] for k in range(0, len(orders_encoded), 112)
-    ]:
+def is_page_too_large(error: Exception) -> bool:
+    """Whether a failed page read ran out of gas or reverted.
 
-        orders_decoded.append(_read_order_from_bytes(order_bytes))
+    Nodes report both as an RPC error whose message says so. A revert
+    without a reason can also come back as empty output, which does not
+    decode.
 
-    return orders_decoded
+    """
+    if isinstance(error, BadFunctionCallOutput):
+        return True
+    message = str(error).lower()
+    return any(reason in message for reason in PAGE_ERRORS)
 
 
-def _read_order_from_bytes(order_bytes) -> Dict[str, str]:
-    """Decode order information from bytes.
+def next_cursor(page: bytes, user: str, offset: int) -> Tuple[str, int]:
+    """Pagination cursor after a page of encoded orders.
 
-    Each order is encoded as 112 bytes:
-    -- 20 bytes for accountID
-    -- 32 bytes for account balance of the sellToken
-    --  2 bytes for buyToken
-    --  2 bytes for sellToken
-    --  4 bytes for validFrom
-    --  4 bytes for validUntil
-    -- 16 bytes for priceNumerator
-    -- 16 bytes for priceDenominator
-    -- 16 bytes for remainingAmount (i.e., sellAmount)
+    The cursor is the last account read and the number of its orders read so
+    far. An account's orders are contiguous, so only the orders at the end
+    of the page that belong to the last account count.
 
-    Returns:
-        A dict containing the order information.
+    """
+    n = len(page) // ORDER_BYTES
+    if n == 0:
+        return user, offset
+    last = page[(n - 1) * ORDER_BYTES : (n - 1) * ORDER_BYTES + 20]
+    run = 1
+    while (
+        run < n
+        and page[(n - 1 - run) * ORDER_BYTES : (n - 1 - run) * ORDER_BYTES + 20] == last
+    ):
+        run += 1
+    last_user = "0x" + last.hex()
+    if run == n and last_user == user.lower():
+        return user, offset + n
+    return last_user, run
+
+
+# Each order is encoded as 112 bytes:
+# -- 20 bytes for accountID
+# -- 32 bytes for account balance of the sellToken
+# --  2 bytes for buyToken
+# --  2 bytes for sellToken
+# --  4 bytes for validFrom
+# --  4 bytes for validUntil
+# -- 16 bytes for priceNumerator
+# -- 16 bytes for priceDenominator
+# -- 16 bytes for remainingAmount (i.e., sellAmount)
+# Amounts are viewed as big-endian 64 bit limbs, so they stay exact.
+ORDER_DTYPE = np.dtype(
+    [
+        ("accountID", "V20"),
+        ("sellTokenBalance", ">u8", (4,)),
+        ("buyToken", ">u2"),
+        ("sellToken", ">u2"),
+        ("validFrom", ">u4"),
+        ("validUntil", ">u4"),
+        ("priceNumerator", ">u8", (2,)),
+        ("priceDenominator", ">u8", (2,)),
+        ("remainingAmount", ">u8", (2,)),
+    ]
+)
+assert ORDER_DTYPE.itemsize == ORDER_BYTES
+
+
+def limbs_to_int(limbs: np.ndarray) -> np.ndarray:
+    """Exact values of big-endian limbs, as an array of Python ints."""
+    values = limbs[:, 0].astype(object)
+    for i in range(1, limbs.shape[1]):
+        values = (values << 64) | limbs[:, i].astype(object)
+    return values
+
+
+class EncodedOrders:
+    """Orders in the contract's encoding, as a table of columns.
+
+    The table is a view of the encoded bytes, decoding is done per column
+    when a column is asked for. Amounts come back as exact Python ints,
+    everything else as NumPy integers.
 
     """
-    assert len(order_bytes) == 112
-
-    encoding_nr_bytes = {
-        "accountID": 20,
-        "sellTokenBalance": 32,
-        "buyToken": 2,
-        "sellToken": 2,
-        "validFrom": 4,
-        "validUntil": 4,
-        "priceNumerator": 16,
-        "priceDenominator": 16,
-        "remainingAmount": 16,
-    }
-
-    order = {}
-    i = 0
-    for attr, n in encoding_nr_bytes.items():
-
-        _bytes = order_bytes[i : i + n]
-
-        if attr == "accountID":
-            order[attr] = "0x" + _bytes.hex()
+
+    def __init__(self, data: np.ndarray):
+        self.data = data
+
+    @classmethod
+    def from_bytes(cls, orders_encoded: bytes) -> "EncodedOrders":
+        return cls(np.frombuffer(orders_encoded, dtype=ORDER_DTYPE))
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, index) -> "EncodedOrders":
+        """Orders selected by a slice, mask or index array."""
+        return EncodedOrders(self.data[index])
+
+    def account_ids(self) -> List[str]:
+        encoded = self.data["accountID"].tobytes().hex()
+        return ["0x" + encoded[k : k + 40] for k in range(0, len(encoded), 40)]
+
+    def column(self, name: str) -> np.ndarray:
+        if name == "accountID":
+            return np.array(self.account_ids(), dtype=object)
+        if self.data.dtype[name].shape:
+            return limbs_to_int(self.data[name])
+        return self.data[name].astype(np.int64)
+
+    def to_dicts(self) -> List[Dict]:
+        """The orders as a list of dicts, one key per field."""
+        columns = [(name, self.column(name).tolist()) for name in ORDER_DTYPE.names]
+        return [{name: values[i] for name, values in columns} for i in range(len(self))]
+
+
+def decode_orders(orders_encoded) -> EncodedOrders:
+    """Decode order byte string into a table of orders."""
+    return EncodedOrders.from_bytes(orders_encoded)
+
+
+def page_orders(page: bytes) -> List[Dict]:
+    """Orders of a page of encoded orders that have anything to sell."""
+    # Read unprocessed order data.
+    orders_raw = decode_orders(page)
+
+    # Get sell amounts, skip orders without any.
+    sell_amounts = np.minimum(
+        orders_raw.column("remainingAmount"), orders_raw.column("sellTokenBalance")
+    )
+    nonzero = sell_amounts != 0
+    orders_raw = orders_raw[nonzero]
+    sell_amounts = sell_amounts[nonzero]
+
+    # Process order data.
+    orders = []
+    debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+    for (
+        account_id,
+        sell_token,
+        buy_token,
+        sell,
+        num,
+        den,
+        valid_from,
+        valid_until,
+    ) in zip(
+        orders_raw.account_ids(),
+        orders_raw.column("sellToken").tolist(),
+        orders_raw.column("buyToken").tolist(),
+        sell_amounts.tolist(),
+        orders_raw.column("priceNumerator").tolist(),
+        orders_raw.column("priceDenominator").tolist(),
+        orders_raw.column("validFrom").tolist(),
+        orders_raw.column("validUntil").tolist(),
+    ):
+
+        # Set token names.
+        sell_token = "T%04d" % sell_token
+        buy_token = "T%04d" % buy_token
+
+        # Compute buy amount from sell amount and limit price.
+        sell_amount = Decimal(sell)
+        limit_price = Decimal(num) / Decimal(den)
+        if limit_price == 0:
+            buy_amount = 1
         else:
-            order[attr] = int.from_bytes(_bytes, "big")
+            buy_amount = (sell_amount * limit_price).to_integral_value()
 
-        i += n
+        if debug:
+            logging.debug(
+                "Read order: sellAmount %40d %7s -- buyAmount %40d %7s -- accountID %s"
+                % (sell_amount, sell_token, buy_amount, buy_token, account_id)
+            )
+
+        orders.append(
+            {
+                "accountID": account_id,
+                "sellToken": sell_token,
+                "buyToken": buy_token,
+                "sellAmount": str(int(sell_amount)),
+                "buyAmount": str(int(buy_amount)),
+                "validFrom": valid_from,
+                "validUntil": valid_until,
+            }
+        )
 
-    return order
+    return orders
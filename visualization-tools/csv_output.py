@@ -0,0 +1,197 @@
+import json
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Sequence, Union
+
+import numpy as np
+
+from analytics.uniswap.config import ETH
+from analytics.uniswap.structs import RoiInfo, RoiSeries, Series, VolumeMatrix
+
+# Output datasets are built column-wise: amounts are divided and formatted a
+# whole column at a time, "Other" aggregates are column sums computed once,
+# and every file is rendered to a single string before it is written.
+
+
+def object_array(values: Sequence) -> np.ndarray:
+    """1-d array of python numbers, which keeps big ints exact."""
+    array = np.empty(len(values), dtype=object)
+    array[:] = list(values)
+    return array
+
+
+def amounts(values: Sequence, unit: int = ETH) -> np.ndarray:
+    """``values / unit`` with python's exactly rounded division."""
+    return object_array(values) / unit
+
+
+def format_amounts(values: np.ndarray) -> np.ndarray:
+    return np.char.mod("%.2f", values.astype(np.float64))
+
+
+def format_timestamps(timestamps: Sequence[int]) -> np.ndarray:
+    return (np.asarray(timestamps, dtype=np.int64) * 1000).astype(str)
+
+
+def render(header: Sequence[str], columns: Sequence[np.ndarray]) -> str:
+    """CSV text of a header and equally long string columns."""
+    lines = [",".join(header)]
+    if columns and len(columns[0]):
+        table = np.column_stack(columns)
+        lines.extend(",".join(row) for row in table.tolist())
+    return "\n".join(lines) + "\n"
+
+
+def write_if_changed(path: str, content: str) -> bool:
+    """Replaces ``path`` with ``content`` unless it already holds it."""
+    if os.path.exists(path):
+        with open(path) as in_f:
+            if in_f.read() == content:
+                return False
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as out_f:
+        out_f.write(content)
+    os.replace(tmp_path, path)
+    return True
+
+
+def as_volume_matrix(
+    volume: Union[VolumeMatrix, Sequence[Dict[str, int]]],
+) -> VolumeMatrix:
+    if isinstance(volume, VolumeMatrix):
+        return volume
+    return VolumeMatrix.from_dicts(volume)
+
+
+def volume_totals(volume: Union[VolumeMatrix, Sequence[Dict[str, int]]]) -> np.ndarray:
+    """Volume of every chunk, summed over traders."""
+    return object_array(as_volume_matrix(volume).totals().tolist())
+
+
+def summary_csv(
+    timestamps: Sequence[int],
+    symbols: Sequence[str],
+    valuable: Sequence[Sequence[int]],
+    other: Sequence[Sequence[int]],
+) -> str:
+    """One column per valuable exchange and the sum of the others.
+
+    Args:
+        timestamps: chart timestamps
+        symbols: token symbols of the valuable exchanges
+        valuable: amounts of every valuable exchange per chunk
+        other: amounts of every other exchange per chunk
+    """
+    rows = len(timestamps)
+    other_total = np.zeros(rows, dtype=object)
+    if len(other):
+        other_total = np.stack([object_array(o[:rows]) for o in other]).sum(axis=0)
+    columns = [format_timestamps(timestamps)]
+    columns.extend(format_amounts(amounts(v[:rows])) for v in valuable)
+    columns.append(format_amounts(amounts(other_total)))
+    return render(["timestamp"] + list(symbols) + ["Other"], columns)
+
+
+def roi_csv(
+    timestamps: Sequence[int],
+    roi: Union[Series, Sequence[RoiInfo]],
+    base_balance: str = "eth_balance",
+) -> str:
+    """ROI, token price in base token and trade volume of every chunk with
+    a base balance, ``base_balance`` names the base balance column."""
+    if not isinstance(roi, Series):
+        roi = RoiSeries.from_records(roi)
+    rows = min(len(timestamps), len(roi))
+    roi = roi[:rows]
+    eth_balance = roi.column(base_balance)
+    kept = np.flatnonzero(eth_balance != 0)
+    token_price = roi.column("token_balance")[kept] / eth_balance[kept]
+    return render(
+        ["timestamp", "ROI", "Token Price", "Trade Volume"],
+        [
+            format_timestamps(np.asarray(timestamps)[kept]),
+            np.array([repr(r) for r in roi.column("dm_change")[kept].tolist()]),
+            np.array([repr(float(p)) for p in token_price]),
+            format_amounts(amounts(roi.column("trade_volume")[kept].tolist())),
+        ],
+    )
+
+
+def volume_csv(
+    timestamps: Sequence[int],
+    valuable_traders: List[str],
+    volume: Union[VolumeMatrix, Sequence[Dict[str, int]]],
+) -> str:
+    """Volume of the valuable traders and "Other", chunks without any volume
+    are left out and so are empty cells."""
+    volume = as_volume_matrix(volume)
+    rows = min(len(timestamps), len(volume))
+    kept = np.flatnonzero(volume.totals()[:rows] != 0)
+    columns = [format_timestamps(np.asarray(timestamps)[kept])]
+    for trader in valuable_traders + ["Other"]:
+        values = volume.column(trader)[kept]
+        cells = format_amounts(amounts(values.tolist())).astype(object)
+        cells[values == 0] = ""
+        columns.append(cells.astype(str))
+    return render(
+        ["timestamp"] + ["\u200b{}".format(t) for t in valuable_traders] + ["Other"],
+        columns,
+    )
+
+
+def providers_csv(
+    providers: Dict[str, int], eth_balance: int, base: str = "eth"
+) -> str:
+    lines = ["provider,{}".format(base)]
+    total_supply = sum(providers.values())
+    remaining_supply = total_supply
+    for p, v in sorted(providers.items(), key=lambda x: x[1], reverse=True):
+        s = v / total_supply
+        if s >= 0.01:
+            lines.append("\u200b{},{:.2f}".format(p, eth_balance * s / ETH))
+            remaining_supply -= v
+    if remaining_supply > 0:
+        lines.append(
+            "Other,{:.2f}".format(eth_balance * remaining_supply / total_supply / ETH)
+        )
+    return "\n".join(lines) + "\n"
+
+
+def token_json(token_name: str, total_tokens: float) -> str:
+    return '{{ "token_name": {}, "total_tokens": {} }}\n'.format(
+        json.dumps(token_name), repr(total_tokens)
+    )
+
+
+def ticker(info) -> str:
+    """File name part of an exchange or relay, from its token symbol."""
+    return re.sub("[\\s/]", "", info.token_symbol.lower())
+
+
+def save_tokens(infos: Sequence, path: str):
+    write_if_changed(
+        path,
+        json.dumps(
+            {
+                "results": [
+                    {"id": ticker(info), "text": info.token_symbol} for info in infos
+                ]
+            }
+        ),
+    )
+
+
+def save_files(
+    paths: List[str], render: Callable[..., str], args: List[tuple], workers: int
+):
+    """Renders one file per exchange or relay, in worker processes when there
+    is more than one worker, and writes those whose content changed."""
+    if workers == 1 or len(args) <= 1:
+        contents = [render(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            contents = list(executor.map(render, *zip(*args), chunksize=16))
+    changed = sum(write_if_changed(p, c) for p, c in zip(paths, contents))
+    logging.info("Wrote {} of {} files".format(changed, len(paths)))
@@ -0,0 +1,147 @@
+from functools import lru_cache
+from typing import Callable, Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+from eth_utils import event_abi_to_log_topic
+from web3.main import to_checksum_address
+
+from analytics.uniswap.event_store import (
+    ADD_LIQUIDITY,
+    ETH_PURCHASE,
+    LIQUIDITY_TRANSFER,
+    REMOVE_LIQUIDITY,
+    TOKEN_PURCHASE,
+    TOKEN_TRANSFER,
+    empty_columns,
+)
+
+ZERO_WORD = bytes(32)
+
+# event name -> (event type, account, recipient, eth amount, token amount)
+LAYOUTS = {
+    "AddLiquidity": (ADD_LIQUIDITY, "provider", None, "eth_amount", "token_amount"),
+    "RemoveLiquidity": (
+        REMOVE_LIQUIDITY,
+        "provider",
+        None,
+        "eth_amount",
+        "token_amount",
+    ),
+    "EthPurchase": (ETH_PURCHASE, "buyer", None, "eth_bought", "tokens_sold"),
+    "TokenPurchase": (TOKEN_PURCHASE, "buyer", None, "eth_sold", "tokens_bought"),
+    "Transfer": (TOKEN_TRANSFER, "from", "to", None, "value"),
+}
+
+Getter = Callable[[List[bytes], bytes], Union[str, bytes]]
+
+
+@lru_cache(maxsize=None)
+def checksum(word: bytes) -> str:
+    return to_checksum_address(word[12:])
+
+
+def to_bytes(value: Union[str, bytes]) -> bytes:
+    if isinstance(value, bytes):
+        return bytes(value)
+    return bytes.fromhex(value[2:] if value.startswith("0x") else value)
+
+
+def compile_getter(index: int, indexed: bool, abi_type: str) -> Getter:
+    # Uniswap events only have static arguments, so every argument is one 32
+    # byte word, either a topic or a word of the data. Amounts are kept as the
+    # raw big-endian word, which is exactly what the event store keeps.
+    if indexed:
+        if abi_type == "address":
+            return lambda topics, data: checksum(topics[index])
+        return lambda topics, data: topics[index]
+
+    start, end = 32 * index, 32 * (index + 1)
+    if abi_type == "address":
+        return lambda topics, data: checksum(data[start:end])
+    return lambda topics, data: data[start:end]
+
+
+def compile_event(event_abi: dict) -> Dict[str, Getter]:
+    getters = dict()
+    topic, word = 1, 0
+    for arg in event_abi["inputs"]:
+        if arg["indexed"]:
+            getters[arg["name"]] = compile_getter(topic, True, arg["type"])
+            topic += 1
+        else:
+            getters[arg["name"]] = compile_getter(word, False, arg["type"])
+            word += 1
+    return getters
+
+
+class EventDecoder:
+    """Decodes exchange logs straight into event store columns.
+
+    The decoders are compiled once from the exchange ABI and looked up by the
+    topic0 bytes of a log, so decoding a log costs a dict lookup and a few
+    slices instead of an ABI lookup and a full ``get_event_data`` call.
+
+    Args:
+        abi: exchange ABI
+    """
+
+    def __init__(self, abi: Sequence[dict]):
+        self.decoders: Dict[bytes, Tuple[tuple, Dict[str, Getter]]] = dict()
+        for item in abi:
+            if item.get("type") == "event" and item["name"] in LAYOUTS:
+                self.decoders[event_abi_to_log_topic(item)] = (
+                    LAYOUTS[item["name"]],
+                    compile_event(item),
+                )
+
+    def decode(
+        self, logs: Sequence[dict], exchange_address: str
+    ) -> Dict[str, np.ndarray]:
+        """Columns of the known events among ``logs``, which are sorted by
+        block and log index. Logs can come from the log fetcher (hex strings)
+        or from web3 (bytes)."""
+        block, log_index, event, account, recipient = [], [], [], [], []
+        eth_amount, token_amount, liquidity = [], [], []
+        for log in logs:
+            topics = [to_bytes(t) for t in log["topics"]]
+            decoder = self.decoders.get(topics[0])
+            if decoder is None:
+                continue
+            (kind, account_arg, recipient_arg, eth_arg, token_arg), getters = decoder
+            data = to_bytes(log["data"])
+
+            block.append(log["blockNumber"])
+            log_index.append(log["logIndex"])
+            account.append(getters[account_arg](topics, data))
+            recipient.append(
+                getters[recipient_arg](topics, data) if recipient_arg else ""
+            )
+            eth_amount.append(getters[eth_arg](topics, data) if eth_arg else ZERO_WORD)
+            token = getters[token_arg](topics, data)
+            if kind == TOKEN_TRANSFER and log["address"] == exchange_address:
+                event.append(LIQUIDITY_TRANSFER)
+                token_amount.append(ZERO_WORD)
+                liquidity.append(token)
+            else:
+                event.append(kind)
+                token_amount.append(token)
+                liquidity.append(ZERO_WORD)
+
+        columns = empty_columns(len(block))
+        if block:
+            columns["block"][:] = block
+            columns["log_index"][:] = log_index
+            columns["event"][:] = event
+            columns["account"][:] = account
+            columns["recipient"][:] = recipient
+            for name, words in (
+                ("eth_amount", eth_amount),
+                ("token_amount", token_amount),
+                ("liquidity", liquidity),
+            ):
+                columns[name] = (
+                    np.frombuffer(b"".join(words), dtype=">u8")
+                    .reshape(-1, 4)
+                    .astype(np.uint64)
+                )
+        return columns
@@ -0,0 +1,219 @@
+import os
+import shutil
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EVENTS_DIR = "events"
+
+# partitions of an exchange kept before compaction merges them
+MAX_PARTITIONS = 8
+
+# event types
+TOKEN_TRANSFER = 0  # token transfer to the exchange
+LIQUIDITY_TRANSFER = 1  # transfer of the exchange (liquidity) token
+ADD_LIQUIDITY = 2
+REMOVE_LIQUIDITY = 3
+ETH_PURCHASE = 4
+TOKEN_PURCHASE = 5
+
+# uint256 amounts are kept exactly as four big-endian 64 bit limbs
+AMOUNT = (np.uint64, 4)
+
+# account is the buyer of purchases, the provider of liquidity events and the
+# sender of transfers, recipient is only set for transfers
+COLUMNS = {
+    "block": np.int64,
+    "log_index": np.int64,
+    "event": np.int8,
+    "eth_amount": AMOUNT,
+    "token_amount": AMOUNT,
+    "liquidity": AMOUNT,
+    "account": "S42",
+    "recipient": "S42",
+}
+
+Partition = Tuple[int, int, str]
+
+
+def empty_columns(
+    n: int = 0, layout: Dict[str, object] = COLUMNS
+) -> Dict[str, np.ndarray]:
+    columns = dict()
+    for name, dtype in layout.items():
+        if dtype is AMOUNT:
+            columns[name] = np.zeros((n, 4), dtype=np.uint64)
+        else:
+            columns[name] = np.zeros(n, dtype=dtype)
+    return columns
+
+
+def to_limbs(values: Sequence[int]) -> np.ndarray:
+    data = b"".join(v.to_bytes(32, "big") for v in values)
+    return np.frombuffer(data, dtype=">u8").reshape(-1, 4).astype(np.uint64)
+
+
+def as_int(limbs: np.ndarray) -> np.ndarray:
+    """Exact amounts as an array of python ints."""
+    values = limbs[:, 0].astype(object)
+    for i in range(1, 4):
+        values = (values << 64) | limbs[:, i].astype(object)
+    return values
+
+
+def as_float(limbs: np.ndarray) -> np.ndarray:
+    values = limbs[:, 0].astype(np.float64)
+    for i in range(1, 4):
+        values = values * 2.0**64 + limbs[:, i].astype(np.float64)
+    return values
+
+
+class EventStore:
+    """Decoded exchange events on disk, one directory per exchange.
+
+    Every ingestion run adds a partition holding the events of its block
+    range, with one ``.npy`` file per column. Reads only open the requested
+    columns, memory-mapped, and cut them to the requested block range.
+    ``compact`` merges the partitions of runs whose state is saved, so the
+    number of partitions of an exchange stays bounded.
+
+    Args:
+        root: directory of the store
+        columns: column names and dtypes of the events
+    """
+
+    def __init__(self, root: str = EVENTS_DIR, columns: Dict[str, object] = COLUMNS):
+        self.root = root
+        self.columns = columns
+
+    def _exchange_dir(self, exchange: str) -> str:
+        return os.path.join(self.root, exchange)
+
+    def partitions(self, exchange: str) -> List[Partition]:
+        exchange_dir = self._exchange_dir(exchange)
+        if not os.path.exists(exchange_dir):
+            return []
+        found = []
+        for name in os.listdir(exchange_dir):
+            if name.endswith(".tmp"):
+                continue
+            first, last = name.split("-")
+            found.append((int(first), int(last), os.path.join(exchange_dir, name)))
+
+        # a compaction that did not finish leaves the merged partitions next to
+        # the one they were merged into
+        partitions = []
+        for first, last, path in sorted(found, key=lambda p: (p[0], -p[1])):
+            if partitions and last <= partitions[-1][1]:
+                shutil.rmtree(path, ignore_errors=True)
+                continue
+            partitions.append((first, last, path))
+        return partitions
+
+    def append(
+        self,
+        exchange: str,
+        first_block: int,
+        last_block: int,
+        columns: Dict[str, np.ndarray],
+    ):
+        """Stores the events of ``[first_block, last_block]``, sorted by block
+        and log index. Partitions from ``first_block`` on are replaced, they
+        are left over from a run that did not finish."""
+        for first, _, old_path in self.partitions(exchange):
+            if first >= first_block:
+                shutil.rmtree(old_path)
+        self._write(exchange, first_block, last_block, columns)
+
+    def _write(
+        self,
+        exchange: str,
+        first_block: int,
+        last_block: int,
+        columns: Dict[str, np.ndarray],
+    ):
+        path = os.path.join(
+            self._exchange_dir(exchange), "{}-{}".format(first_block, last_block)
+        )
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        for name in self.columns:
+            np.save(os.path.join(tmp_path, name + ".npy"), columns[name])
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp_path, path)
+
+    def compact(
+        self, exchange: str, last_block: int, max_partitions: int = MAX_PARTITIONS
+    ):
+        """Merges contiguous partitions up to ``last_block`` once there are more
+        than ``max_partitions``.
+
+        Only call this once the state built from the events up to
+        ``last_block`` is saved: a run that does not finish replaces the
+        partitions it started, and a merged partition could not be.
+        """
+        partitions = self.partitions(exchange)
+        if len(partitions) <= max_partitions:
+            return
+
+        runs: List[List[Partition]] = []
+        for partition in partitions:
+            first, last, _ = partition
+            if last > last_block:
+                break
+            if runs and runs[-1][-1][1] + 1 == first:
+                runs[-1].append(partition)
+            else:
+                runs.append([partition])
+
+        for run in runs:
+            if len(run) < 2:
+                continue
+            columns = {
+                name: np.concatenate(
+                    [np.load(os.path.join(path, name + ".npy")) for _, _, path in run]
+                )
+                for name in self.columns
+            }
+            # the merged partition is complete before the parts are removed
+            self._write(exchange, run[0][0], run[-1][1], columns)
+            for _, _, path in run:
+                shutil.rmtree(path)
+
+    def read(
+        self,
+        exchange: str,
+        columns: Sequence[str],
+        first_block: Optional[int] = None,
+        last_block: Optional[int] = None,
+    ) -> Dict[str, np.ndarray]:
+        """Requested columns of the events in ``[first_block, last_block]``."""
+        parts: Dict[str, List[np.ndarray]] = {name: [] for name in columns}
+        for first, last, path in self.partitions(exchange):
+            if (first_block is not None and last < first_block) or (
+                last_block is not None and first > last_block
+            ):
+                continue
+            mapped = {
+                name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r")
+                for name in set(columns) | {"block"}
+            }
+            lo, hi = 0, len(mapped["block"])
+            if first_block is not None and first < first_block:
+                lo = np.searchsorted(mapped["block"], first_block, side="left")
+            if last_block is not None and last > last_block:
+                hi = np.searchsorted(mapped["block"], last_block, side="right")
+            for name in columns:
+                parts[name].append(mapped[name][lo:hi])
+
+        result = empty_columns(0, self.columns)
+        for name in columns:
+            if len(parts[name]) == 1:
+                result[name] = parts[name][0]
+            elif parts[name]:
+                result[name] = np.concatenate(parts[name])
+        return {name: result[name] for name in columns}
+
+    def drop(self, exchange: str):
+        shutil.rmtree(self._exchange_dir(exchange), ignore_errors=True)
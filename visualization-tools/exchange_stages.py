@@ -0,0 +1,217 @@
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from analytics.uniswap.event_store import (
+    ETH_PURCHASE,
+    LIQUIDITY_TRANSFER,
+    TOKEN_PURCHASE,
+    EventStore,
+    as_int,
+)
+from analytics.uniswap.roi import roi_series
+
+PROVIDERS = "providers"
+ROI = "roi"
+VOLUME = "volume"
+STAGES = (PROVIDERS, ROI, VOLUME)
+
+COLUMNS = {
+    PROVIDERS: ["event", "liquidity", "account", "recipient"],
+    ROI: ["block", "event", "eth_amount", "token_amount"],
+    VOLUME: ["block", "event", "eth_amount", "account"],
+}
+
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+
+# The per-exchange part of the populate stages. Exchanges are independent, so
+# these run in worker processes: a worker reads the exchange's partitions from
+# the event store and sends back plain python results.
+
+
+def accounts(column: np.ndarray) -> List[str]:
+    return [a.decode() for a in column]
+
+
+def providers(
+    events: Dict[str, np.ndarray], balances: Optional[Dict[str, int]] = None
+) -> Dict[str, int]:
+    transfers = events["event"] == LIQUIDITY_TRANSFER
+    balances = defaultdict(int, balances or {})
+    for sender, to, value in zip(
+        accounts(events["account"][transfers]),
+        accounts(events["recipient"][transfers]),
+        as_int(events["liquidity"][transfers]),
+    ):
+        if sender == ZERO_ADDRESS:
+            balances[to] += value
+        elif to == ZERO_ADDRESS:
+            balances[sender] -= value
+        else:
+            balances[sender] -= value
+            balances[to] += value
+    return balances
+
+
+def roi(
+    events: Dict[str, np.ndarray],
+    chart_blocks: Sequence[int],
+    eth_balance: int = 0,
+    token_balance: int = 0,
+) -> tuple:
+    dm_change, eth_balance, token_balance, trade_volume, failed_chunk = roi_series(
+        np.asarray(events["block"]),
+        np.asarray(events["event"]),
+        as_int(events["eth_amount"]),
+        as_int(events["token_amount"]),
+        chart_blocks,
+        eth_balance,
+        token_balance,
+    )
+    chunks = len(chart_blocks) if failed_chunk is None else failed_chunk
+    return (
+        dm_change[:chunks].tolist(),
+        eth_balance[:chunks].tolist(),
+        token_balance[:chunks].tolist(),
+        trade_volume[:chunks].tolist(),
+        failed_chunk,
+    )
+
+
+def trade_volume(
+    events: Dict[str, np.ndarray],
+    chart_blocks: Sequence[int],
+    total_trade_volume: Optional[Dict[str, int]] = None,
+) -> Tuple[List[Dict[str, int]], Dict[str, int]]:
+    """Volume per trader of every chunk, and the running total per trader."""
+    block = events["block"].tolist()
+    event = events["event"].tolist()
+    eth_amount = as_int(events["eth_amount"])
+    buyers = accounts(events["account"])
+    volumes = list()
+    i = 0
+    total_trade_volume = defaultdict(int, total_trade_volume or {})
+    for block_number in chart_blocks:
+        volume = defaultdict(int)
+        while i < len(block) and block[i] < block_number:
+            kind, eth, buyer = event[i], eth_amount[i], buyers[i]
+            i += 1
+            if kind == ETH_PURCHASE:
+                volume[buyer] += eth / 0.997
+                total_trade_volume[buyer] += eth / 0.997
+            elif kind == TOKEN_PURCHASE:
+                volume[buyer] += eth
+                total_trade_volume[buyer] += eth
+
+        volumes.append(volume)
+    return volumes, total_trade_volume
+
+
+def valuable_traders(total_trade_volume: Dict[str, int]) -> Set[str]:
+    """Traders with more than 0.1% of the total volume."""
+    total_volume = sum(total_trade_volume.values())
+    return {t for (t, v) in total_trade_volume.items() if v > total_volume / 1000}
+
+
+def filter_volume(
+    volumes: List[Dict[str, int]], valuable: Set[str]
+) -> List[Dict[str, int]]:
+    """Volume of the valuable traders, the rest is summed up as "Other"."""
+    filtered_volumes = list()
+    for vol in volumes:
+        filtered_vol = defaultdict(int)
+        for t, v in vol.items():
+            if t in valuable:
+                filtered_vol[t] = v
+            else:
+                filtered_vol["Other"] += v
+        filtered_volumes.append(filtered_vol)
+    return filtered_volumes
+
+
+class Resume:
+    """Where the stages of an exchange continue from.
+
+    Providers continue after ``processed_block``, the last block of the
+    previous run. ROI and volume continue at chart chunk ``roi_chunks`` and
+    ``volume_chunks``: a chunk is only complete once the chain is past its
+    last block, so events after the last complete chunk are read again.
+    """
+
+    def __init__(
+        self,
+        processed_block: int,
+        providers: Dict[str, int],
+        roi_chunks: int,
+        eth_balance: int,
+        token_balance: int,
+        volume_chunks: int,
+        total_trade_volume: Dict[str, int],
+    ):
+        self.processed_block = processed_block
+        self.providers = providers
+        self.roi_chunks = roi_chunks
+        self.eth_balance = eth_balance
+        self.token_balance = token_balance
+        self.volume_chunks = volume_chunks
+        self.total_trade_volume = total_trade_volume
+
+
+def process_exchange(
+    events_dir: str,
+    chart_blocks: Sequence[int],
+    stages: Sequence[str],
+    task: Tuple[str, Optional[Resume]],
+) -> Dict[str, Any]:
+    """Runs ``stages`` for one exchange, from scratch when there is nothing
+    to resume from. ROI and volume results only cover the new chunks."""
+    exchange_address, resume = task
+    store = EventStore(events_dir)
+    result = dict()
+
+    if PROVIDERS in stages:
+        if resume is None:
+            events = store.read(exchange_address, COLUMNS[PROVIDERS])
+            result[PROVIDERS] = providers(events)
+        else:
+            events = store.read(
+                exchange_address, COLUMNS[PROVIDERS], resume.processed_block + 1
+            )
+            result[PROVIDERS] = providers(events, resume.providers)
+
+    if ROI in stages:
+        start = 0 if resume is None else resume.roi_chunks
+        events = store.read(
+            exchange_address,
+            COLUMNS[ROI],
+            chart_blocks[start - 1] + 1 if start > 0 else None,
+        )
+        if start > 0:
+            result[ROI] = (
+                start,
+                roi(
+                    events,
+                    chart_blocks[start:],
+                    resume.eth_balance,
+                    resume.token_balance,
+                ),
+            )
+        else:
+            result[ROI] = (0, roi(events, chart_blocks))
+
+    if VOLUME in stages:
+        start = 0 if resume is None else resume.volume_chunks
+        events = store.read(
+            exchange_address,
+            COLUMNS[VOLUME],
+            chart_blocks[start - 1] if start > 0 else None,
+        )
+        if start > 0:
+            result[VOLUME] = (
+                start,
+                trade_volume(events, chart_blocks[start:], resume.total_trade_volume),
+            )
+        else:
+            result[VOLUME] = (0, trade_volume(events, chart_blocks))
+    return result
@@ -0,0 +1,255 @@
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from analytics.uniswap.event_store import EventStore
+from analytics.uniswap.log_fetcher import LogFetcher
+
+
+class LogSource:
+    """One log fetch of an adapter.
+
+    Args:
+        name: name of the fetch, unique within the adapter
+        address: address of an info whose logs are fetched
+        topics: topics filter of the fetch for a list of infos
+        keep: predicate on the fetched logs of an info, None keeps them all
+    """
+
+    def __init__(
+        self,
+        name: str,
+        address: Callable[[Any], str],
+        topics: Callable[[List[Any]], List],
+        keep: Optional[Callable[[Any], Callable[[dict], bool]]] = None,
+    ):
+        self.name = name
+        self.address = address
+        self.topics = topics
+        self.keep = keep
+
+
+class Adapter(ABC):
+    """Protocol specific part of an ingestion.
+
+    An adapter discovers the pools of a protocol, declares the logs to fetch
+    for them and how those are decoded into event store columns, and reduces
+    the stored events of a pool to its state. Fetching, storing and running
+    the reducer in worker processes is shared by every protocol.
+
+    Subclasses set the class attributes and implement the methods below.
+    ``reduce`` runs in worker processes, so it is a module level function
+    taking ``(events_dir, chart_blocks, stages, task)``, set as a
+    ``staticmethod``.
+    """
+
+    name: str = None
+    events_dir: str = None
+    columns: Dict[str, object] = None
+    sources: List[LogSource] = []
+    stages: Sequence[str] = ()
+    reduce: Callable[..., Dict[str, Any]] = None
+
+    @abstractmethod
+    def discover(self, infos: List) -> List:
+        """Current pools, updating ``infos`` saved by an earlier run."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def key(self, info) -> str:
+        """Event store key of a pool."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def decode(self, info, logs: List[dict]) -> Dict[str, np.ndarray]:
+        """Event columns of a pool's logs, sorted by block and log index."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def task(self, info) -> tuple:
+        """Arguments of ``reduce`` for a pool, they must pickle."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def apply(self, info, result: Dict[str, Any]):
+        """Sets the result of ``reduce`` on a pool."""
+        raise NotImplementedError
+
+
+class Job:
+    """Pools of one adapter whose logs are ingested from ``start_block`` on."""
+
+    def __init__(self, adapter: Adapter, infos: List, start_block: int):
+        self.adapter = adapter
+        self.infos = infos
+        self.start_block = start_block
+
+    def fetch_name(self, source: LogSource) -> str:
+        # jobs of one adapter differ in their start block, and a fetch keeps
+        # its name across runs so an interrupted one resumes
+        return "{}_{}_{}".format(self.adapter.name, source.name, self.start_block)
+
+
+def update_is_required(
+    last_processed_block: int, begin_block: int, current_block: int, chunk_size: int
+) -> bool:
+    """Whether a chart chunk ended after the block the saved state is from."""
+    return (
+        current_block - begin_block
+    ) // chunk_size * chunk_size + begin_block > last_processed_block
+
+
+# chart blocks of the running reduce, set once in every worker process
+# rather than pickled with every task
+worker_chart_blocks: List[int] = []
+
+
+def set_chart_blocks(chart_blocks: List[int]):
+    global worker_chart_blocks
+    worker_chart_blocks = chart_blocks
+
+
+def run_task(
+    reduce: Callable[..., Dict[str, Any]],
+    events_dir: str,
+    stages: Sequence[str],
+    task: tuple,
+) -> Dict[str, Any]:
+    return reduce(events_dir, worker_chart_blocks, stages, task)
+
+
+class Ingestion:
+    """Fetches, stores and reduces the events of any number of protocols.
+
+    All fetches of a run go through one ``LogFetcher`` and run at the same
+    time, sharing its rate limit. Every adapter has its own event store. The
+    reducers of all adapters run in one pool of worker processes.
+
+    Args:
+        log_fetcher: fetcher of the logs
+    """
+
+    def __init__(self, log_fetcher: LogFetcher):
+        self.log_fetcher = log_fetcher
+        self.stores: Dict[str, EventStore] = dict()
+
+    def event_store(self, adapter: Adapter) -> EventStore:
+        if adapter.name not in self.stores:
+            self.stores[adapter.name] = EventStore(adapter.events_dir, adapter.columns)
+        return self.stores[adapter.name]
+
+    def fetch(self, jobs: Sequence[Job], last_block: int):
+        fetches = [
+            (
+                job.fetch_name(source),
+                [source.address(info) for info in job.infos],
+                source.topics(job.infos),
+                job.start_block,
+            )
+            for job in jobs
+            if job.infos
+            for source in job.adapter.sources
+        ]
+        if not fetches:
+            return
+        with ThreadPoolExecutor(max_workers=len(fetches)) as executor:
+            futures = [
+                executor.submit(self.log_fetcher.fetch, *f, last_block) for f in fetches
+            ]
+            for future in futures:
+                future.result()
+
+    def store_events(
+        self,
+        adapter: Adapter,
+        info,
+        logs: List[dict],
+        first_block: int,
+        last_block: int,
+    ):
+        logs.sort(key=lambda l: (l["blockNumber"], l["logIndex"]))
+        self.event_store(adapter).append(
+            adapter.key(info), first_block, last_block, adapter.decode(info, logs)
+        )
+
+    def store(self, jobs: Sequence[Job], last_block: int):
+        """Decodes the fetched logs of every pool into the event stores."""
+        for job in jobs:
+            for info in job.infos:
+                logs = []
+                for source in job.adapter.sources:
+                    fetched = self.log_fetcher.read(
+                        job.fetch_name(source), source.address(info)
+                    )
+                    if source.keep is not None:
+                        fetched = filter(source.keep(info), fetched)
+                    logs.extend(fetched)
+                self.store_events(job.adapter, info, logs, job.start_block, last_block)
+            logging.info(
+                "Stored events of {} {} pools".format(len(job.infos), job.adapter.name)
+            )
+
+    def ingest(self, jobs: Sequence[Job], last_block: int):
+        """Fetches the logs of ``jobs`` up to ``last_block`` and stores their
+        events."""
+        self.fetch(jobs, last_block)
+        self.store(jobs, last_block)
+
+    def clear(self, jobs: Sequence[Job]):
+        # fetched logs are kept until the state built from them is saved, so a
+        # crash before that resumes from the fetched files
+        for job in jobs:
+            for source in job.adapter.sources:
+                self.log_fetcher.clear(job.fetch_name(source))
+
+    def compact(self, jobs: Sequence[Job], last_block: int):
+        """Merges the stored events of the jobs' pools, once the state built
+        from them up to ``last_block`` is saved."""
+        for job in jobs:
+            store = self.event_store(job.adapter)
+            for info in job.infos:
+                store.compact(job.adapter.key(info), last_block)
+
+    def reduce(
+        self,
+        pools: Sequence[Tuple[Adapter, List]],
+        chart_blocks: Sequence[int],
+        workers: Optional[int] = None,
+        stages: Optional[Sequence[str]] = None,
+    ):
+        """Runs the reducers of ``(adapter, infos)`` pairs and applies their
+        results, in worker processes unless ``workers`` is 1.
+
+        Args:
+            pools: adapters and their infos
+            chart_blocks: last block of every chart chunk
+            workers: worker processes, None for one per core
+            stages: stages to run instead of the adapters' own
+        """
+        chart_blocks = list(chart_blocks)
+        tasks = []
+        for adapter, infos in pools:
+            events_dir = self.event_store(adapter).root
+            adapter_stages = adapter.stages if stages is None else stages
+            tasks.extend(
+                (adapter, info, adapter.reduce, events_dir, adapter_stages, task)
+                for info, task in zip(infos, map(adapter.task, infos))
+            )
+
+        arguments = [[t[i] for t in tasks] for i in range(2, 6)]
+        if workers == 1:
+            set_chart_blocks(chart_blocks)
+            results = list(map(run_task, *arguments))
+        else:
+            with ProcessPoolExecutor(
+                max_workers=workers,
+                initializer=set_chart_blocks,
+                initargs=(chart_blocks,),
+            ) as executor:
+                results = list(executor.map(run_task, *arguments, chunksize=16))
+
+        for (adapter, info, *_), result in zip(tasks, results):
+            adapter.apply(info, result)
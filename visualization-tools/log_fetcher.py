@@ -0,0 +1,365 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import requests
+from web3.main import to_checksum_address
+
+LOGS_DIR = "logs"
+RATE_LIMIT = 10.0
+MAX_WORKERS = 8
+ADDRESS_CHUNK = 500
+MIN_RANGE = 1
+MAX_RANGE = 200000
+TARGET_RESULTS = 5000
+MAX_ATTEMPTS = 5
+
+# substrings of the errors nodes return when a range holds too many logs
+TOO_MANY_RESULTS = (
+    "too many",
+    "more than",
+    "limit exceeded",
+    "response size",
+    "timeout",
+    "timed out",
+)
+
+Range = Tuple[int, int]
+
+
+class TooManyResults(Exception):
+    pass
+
+
+class RateLimiter:
+    """Spaces requests to one endpoint at least ``1 / rate`` seconds apart."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+
+_rate_limiters: Dict[str, RateLimiter] = dict()
+_rate_limiters_lock = threading.Lock()
+
+
+def rate_limiter(endpoint: str, rate: float = RATE_LIMIT) -> RateLimiter:
+    """Returns the limiter shared by every fetcher of ``endpoint``."""
+    with _rate_limiters_lock:
+        if endpoint not in _rate_limiters:
+            _rate_limiters[endpoint] = RateLimiter(rate)
+        return _rate_limiters[endpoint]
+
+
+def subtract_ranges(start: int, end: int, done: Sequence[Range]) -> List[Range]:
+    """Parts of ``[start, end]`` not covered by the ``done`` ranges."""
+    gaps = []
+    cursor = start
+    for s, e in sorted(done):
+        if s > cursor:
+            gaps.append((cursor, min(s - 1, end)))
+        cursor = max(cursor, e + 1)
+        if cursor > end:
+            break
+    if cursor <= end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+def merge_ranges(ranges: Sequence[Range]) -> List[Range]:
+    merged: List[Range] = []
+    for s, e in sorted(ranges):
+        if merged and s <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], e))
+        else:
+            merged.append((s, e))
+    return merged
+
+
+class Checkpoint:
+    """Progress of one fetch: completed block ranges per address chunk and
+    the size of every output file when they completed.
+
+    A checkpoint only applies to the fetch it was written for, a different
+    signature (addresses, topics or block range) starts from scratch.
+    """
+
+    def __init__(self, path: str, signature: str):
+        self.path = path
+        self.signature = signature
+        self.done: Dict[int, List[Range]] = dict()
+        self.sizes: Dict[str, int] = dict()
+        self.complete = False
+        self.resumed = False
+        if os.path.exists(path):
+            with open(path) as in_f:
+                saved = json.load(in_f)
+            if saved["signature"] == signature:
+                self.done = {
+                    int(k): [tuple(r) for r in v] for k, v in saved["done"].items()
+                }
+                self.sizes = saved["sizes"]
+                self.complete = saved["complete"]
+                self.resumed = True
+
+    def add(self, chunk: int, block_range: Range):
+        self.done[chunk] = merge_ranges(self.done.get(chunk, []) + [block_range])
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as out_f:
+            json.dump(
+                {
+                    "signature": self.signature,
+                    "done": self.done,
+                    "sizes": self.sizes,
+                    "complete": self.complete,
+                },
+                out_f,
+            )
+            out_f.flush()
+            os.fsync(out_f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+class LogFetcher:
+    """Fetches logs through the GraphQL endpoint of a node.
+
+    Every address chunk walks the block range with its own range size, which
+    is halved when the node answers that a range has too many logs and
+    doubled while ranges come back sparse. Requests run on ``max_workers``
+    threads and share a per-endpoint rate limit. Logs are appended to one
+    JSON lines file per emitting address as ranges complete, and a checkpoint
+    of the completed ranges is written after every range so an interrupted
+    fetch resumes where it stopped.
+
+    Args:
+        endpoint: GraphQL endpoint
+        query: logs query template with fromBlock, toBlock, addresses and
+            topics placeholders
+        logs_dir: directory of the output and checkpoints
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        query: str,
+        logs_dir: str = LOGS_DIR,
+        max_workers: int = MAX_WORKERS,
+        rate: float = RATE_LIMIT,
+        address_chunk: int = ADDRESS_CHUNK,
+        initial_range: int = 1000,
+        min_range: int = MIN_RANGE,
+        max_range: int = MAX_RANGE,
+        target_results: int = TARGET_RESULTS,
+    ):
+        self.endpoint = endpoint
+        self.query = query
+        self.logs_dir = logs_dir
+        self.max_workers = max_workers
+        self.limiter = rate_limiter(endpoint, rate)
+        self.address_chunk = address_chunk
+        self.initial_range = initial_range
+        self.min_range = min_range
+        self.max_range = max_range
+        self.target_results = target_results
+        self.session = requests.Session()
+
+    def _request(
+        self, addresses: Sequence[str], topics: List, start: int, end: int
+    ) -> List[dict]:
+        query = self.query.format(
+            fromBlock=start,
+            toBlock=end,
+            addresses=json.dumps(list(addresses)),
+            topics=json.dumps(topics),
+        )
+        for attempt in range(MAX_ATTEMPTS):
+            self.limiter.acquire()
+            try:
+                resp = self.session.post(self.endpoint, json={"query": query})
+                if resp.status_code == 413:
+                    raise TooManyResults(resp.text)
+                body = resp.json()
+                errors = body.get("errors")
+                if errors:
+                    message = "; ".join(str(e.get("message", e)) for e in errors)
+                    if any(s in message.lower() for s in TOO_MANY_RESULTS):
+                        raise TooManyResults(message)
+                    raise RuntimeError(message)
+                return body["data"]["logs"]
+            except TooManyResults:
+                raise
+            except Exception:
+                if attempt + 1 == MAX_ATTEMPTS:
+                    raise
+                logging.warning(
+                    "Logs request {}-{} failed, retrying".format(start, end),
+                    exc_info=True,
+                )
+                time.sleep(2**attempt)
+
+    def _output_dir(self, name: str) -> str:
+        return os.path.join(self.logs_dir, name)
+
+    def _checkpoint_path(self, name: str) -> str:
+        return os.path.join(self.logs_dir, name + ".checkpoint.json")
+
+    def _prepare(self, name: str, checkpoint: Checkpoint):
+        # drop whatever was written after the last checkpoint, or everything
+        # when the checkpoint is from another fetch
+        out_dir = self._output_dir(name)
+        if not checkpoint.resumed and os.path.exists(out_dir):
+            shutil.rmtree(out_dir)
+        os.makedirs(out_dir, exist_ok=True)
+        for file_name in os.listdir(out_dir):
+            size = checkpoint.sizes.get(file_name, 0)
+            path = os.path.join(out_dir, file_name)
+            if size == 0:
+                os.remove(path)
+            elif os.path.getsize(path) != size:
+                with open(path, "r+b") as f:
+                    f.truncate(size)
+
+    def _write(self, name: str, checkpoint: Checkpoint, logs: List[dict]):
+        by_address: Dict[str, List[str]] = dict()
+        for log in logs:
+            address = to_checksum_address(log["account"]["address"])
+            record = {
+                "address": address,
+                "blockNumber": int(log["transaction"]["block"]["number"], 16),
+                "logIndex": log["index"],
+                "topics": log["topics"],
+                "data": log["data"],
+            }
+            by_address.setdefault(address, []).append(json.dumps(record))
+
+        out_dir = self._output_dir(name)
+        for address, lines in by_address.items():
+            file_name = address + ".jsonl"
+            with open(os.path.join(out_dir, file_name), "a") as out_f:
+                out_f.write("\n".join(lines) + "\n")
+                checkpoint.sizes[file_name] = out_f.tell()
+
+    def fetch(
+        self,
+        name: str,
+        addresses: Sequence[str],
+        topics: List,
+        start_block: int,
+        end_block: int,
+    ):
+        """Fetches the logs of ``addresses`` matching ``topics`` in
+        ``[start_block, end_block]`` into ``<logs_dir>/<name>/``."""
+        os.makedirs(self.logs_dir, exist_ok=True)
+        signature = hashlib.sha1(
+            json.dumps([list(addresses), topics, start_block, end_block]).encode()
+        ).hexdigest()
+        checkpoint = Checkpoint(self._checkpoint_path(name), signature)
+        if checkpoint.complete:
+            logging.info("Logs of {} are already fetched".format(name))
+            return
+        self._prepare(name, checkpoint)
+
+        chunks = [
+            addresses[i : i + self.address_chunk]
+            for i in range(0, len(addresses), self.address_chunk)
+        ]
+        gaps = {
+            i: subtract_ranges(start_block, end_block, checkpoint.done.get(i, []))
+            for i in range(len(chunks))
+        }
+        sizes = {i: self.initial_range for i in range(len(chunks))}
+
+        def next_task() -> Optional[Tuple[int, int, int]]:
+            for chunk, chunk_gaps in gaps.items():
+                if chunk_gaps:
+                    start, end = chunk_gaps[0]
+                    stop = min(start + sizes[chunk] - 1, end)
+                    if stop == end:
+                        chunk_gaps.pop(0)
+                    else:
+                        chunk_gaps[0] = (stop + 1, end)
+                    return chunk, start, stop
+            return None
+
+        fetched = 0
+        in_flight = dict()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                while len(in_flight) < self.max_workers:
+                    task = next_task()
+                    if task is None:
+                        break
+                    chunk, start, end = task
+                    future = executor.submit(
+                        self._request, chunks[chunk], topics, start, end
+                    )
+                    in_flight[future] = task
+                if not in_flight:
+                    break
+
+                completed, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    chunk, start, end = in_flight.pop(future)
+                    try:
+                        logs = future.result()
+                    except TooManyResults:
+                        if start == end:
+                            raise
+                        # retry the range in halves and keep ranges smaller
+                        half = max((end - start + 1) // 2, self.min_range)
+                        sizes[chunk] = half
+                        gaps[chunk].insert(0, (start, end))
+                        continue
+
+                    self._write(name, checkpoint, logs)
+                    checkpoint.add(chunk, (start, end))
+                    checkpoint.save()
+                    fetched += len(logs)
+
+                    if len(logs) < self.target_results // 4:
+                        sizes[chunk] = min(sizes[chunk] * 2, self.max_range)
+                    elif len(logs) > self.target_results:
+                        sizes[chunk] = max(sizes[chunk] // 2, self.min_range)
+
+        checkpoint.complete = True
+        checkpoint.save()
+        logging.info("Fetched {} logs of {}".format(fetched, name))
+
+    def addresses(self, name: str) -> List[str]:
+        """Addresses that have logs in the output of fetch ``name``."""
+        out_dir = self._output_dir(name)
+        if not os.path.exists(out_dir):
+            return []
+        return [f[: -len(".jsonl")] for f in os.listdir(out_dir)]
+
+    def read(self, name: str, address: str) -> Iterator[dict]:
+        """Logs of ``address`` from fetch ``name``, in the order they were fetched."""
+        path = os.path.join(self._output_dir(name), address + ".jsonl")
+        if not os.path.exists(path):
+            return
+        with open(path) as in_f:
+            for line in in_f:
+                yield json.loads(line)
+
+    def clear(self, name: str):
+        """Removes the output and checkpoint of fetch ``name`` once consumed."""
+        shutil.rmtree(self._output_dir(name), ignore_errors=True)
+        if os.path.exists(self._checkpoint_path(name)):
+            os.remove(self._checkpoint_path(name))
@@ -0,0 +1,157 @@
+"""Orders of a batch auction instance as a table of columns."""
+
+from decimal import Decimal
+from typing import Dict, Iterator, List, Sequence, Tuple, Union
+
+import numpy as np
+
+AMOUNTS = ("sellAmount", "buyAmount", "execSellAmount", "execBuyAmount")
+TOKEN_FIELDS = ("sellToken", "buyToken")
+
+
+def to_int(value) -> int:
+    """Exact amount of a JSON value, which may be in exponent notation."""
+    try:
+        return int(value)
+    except ValueError:
+        return int(Decimal(value))
+
+
+def int_column(values: Sequence[int]) -> np.ndarray:
+    """Object array of exact Python ints, amounts exceed 64 bits."""
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+def group(*keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Rows grouped by equal keys, which are non-negative integer codes.
+
+    Returns a permutation of the rows and the start of every group in it.
+    Rows of a group keep their order and groups come in the order of their
+    first row.
+    """
+    if len(keys[0]) == 0:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp)
+    key = np.ravel_multi_index(keys, [int(k.max()) + 1 for k in keys])
+    _, first, inverse = np.unique(key, return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=np.intp)
+    rank[np.argsort(first)] = np.arange(len(first))
+    group_of = rank[inverse.reshape(-1)]
+    rows = np.argsort(group_of, kind="stable")
+    starts = np.flatnonzero(np.diff(group_of[rows], prepend=-1))
+    return rows, starts
+
+
+class OrderTable:
+    """Orders as columns, used like the list of order dicts it replaces.
+
+    Accounts and tokens are integer codes indexing ``accounts`` and
+    ``tokens``. Amounts are exact Python ints, an amount column that was
+    not read is all zeros. Other fields are kept as they were read.
+    Iterating or indexing with an int gives orders as dicts with
+    ``Decimal`` amounts, indexing with a slice, mask or index array gives a
+    table.
+
+    Args:
+        tokens: token IDs, indexed by the token codes
+        accounts: account IDs, indexed by the account codes
+        columns: field -> column, in the order of the orders' fields
+    """
+
+    def __init__(
+        self, tokens: List[str], accounts: List[str], columns: Dict[str, np.ndarray]
+    ):
+        self.tokens = tokens
+        self.accounts = accounts
+        self.columns = columns
+
+    @classmethod
+    def from_dicts(cls, orders: Sequence[Dict]) -> "OrderTable":
+        """Table of orders as read from an instance file or the contract."""
+        fields = list(dict.fromkeys(name for o in orders for name in o))
+        values = {name: [o.get(name) for o in orders] for name in fields}
+
+        tokens = sorted(set(values.get("sellToken", []) + values.get("buyToken", [])))
+        token_codes = {t: c for c, t in enumerate(tokens)}
+        accounts = sorted(set(values.get("accountID", [])))
+        account_codes = {a: c for c, a in enumerate(accounts)}
+
+        columns = dict()
+        for name in fields:
+            if name in TOKEN_FIELDS:
+                columns[name] = np.array(
+                    [token_codes[t] for t in values[name]], dtype=np.int32
+                )
+            elif name == "accountID":
+                columns[name] = np.array(
+                    [account_codes[a] for a in values[name]], dtype=np.int32
+                )
+            elif name in AMOUNTS:
+                columns[name] = int_column(
+                    [0 if v is None else to_int(v) for v in values[name]]
+                )
+            else:
+                columns[name] = int_column(values[name])
+        return cls(tokens, accounts, columns)
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def column(self, name: str) -> np.ndarray:
+        if name in self.columns:
+            return self.columns[name]
+        if name in AMOUNTS:
+            return int_column([0] * len(self))
+        if len(self) == 0:
+            # a table read from no orders has no fields
+            return np.zeros(0, dtype=np.int32)
+        raise KeyError(name)
+
+    def ids(self, name: str) -> List:
+        """Token or account IDs of a code column, values of any other."""
+        if name in TOKEN_FIELDS:
+            return [self.tokens[c] for c in self.column(name).tolist()]
+        if name == "accountID":
+            return [self.accounts[c] for c in self.column(name).tolist()]
+        return self.column(name).tolist()
+
+    def replace(self, **columns: np.ndarray) -> "OrderTable":
+        """New table with some columns replaced."""
+        return OrderTable(self.tokens, self.accounts, dict(self.columns, **columns))
+
+    def to_dicts(self, decimal: bool = False) -> List[Dict]:
+        """The orders as dicts.
+
+        Args:
+            decimal: amounts as ``Decimal`` and every amount field present,
+                otherwise amounts as strings like in an instance file
+        """
+        names = list(self.columns)
+        if decimal:
+            names += [name for name in AMOUNTS if name not in self.columns]
+        values = []
+        for name in names:
+            column = self.ids(name)
+            if name in AMOUNTS:
+                column = [Decimal(v) if decimal else str(v) for v in column]
+            values.append(column)
+        return [dict(zip(names, row)) for row in zip(*values)]
+
+    def __getitem__(self, index) -> Union[Dict, "OrderTable"]:
+        if isinstance(index, (int, np.integer)):
+            return self[[index]].to_dicts(decimal=True)[0]
+        return OrderTable(
+            self.tokens,
+            self.accounts,
+            {name: column[index] for name, column in self.columns.items()},
+        )
+
+    def __iter__(self) -> Iterator[Dict]:
+        return iter(self.to_dicts(decimal=True))
+
+
+def as_table(orders: Union[OrderTable, Sequence[Dict]]) -> OrderTable:
+    if isinstance(orders, OrderTable):
+        return orders
+    return OrderTable.from_dicts(orders)
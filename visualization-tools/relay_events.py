@@ -0,0 +1,167 @@
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from eth_utils import event_abi_to_log_topic
+
+from analytics.uniswap.event_decoder import Getter, compile_event, to_bytes
+from analytics.uniswap.event_store import AMOUNT, empty_columns
+
+# event types
+CONVERSION = 0
+PRICE_DATA = 1
+RELAY_TRANSFER = 2
+
+# account is the trader of conversions and the sender of transfers.
+# Conversions fill from_token, to_token, amount and return_amount,
+# price data updates fill from_token (the connector), supply,
+# reserve_balance and weight, transfers fill recipient and amount.
+RELAY_COLUMNS = {
+    "block": np.int64,
+    "log_index": np.int64,
+    "event": np.int8,
+    "account": "S42",
+    "recipient": "S42",
+    "from_token": "S42",
+    "to_token": "S42",
+    "amount": AMOUNT,
+    "return_amount": AMOUNT,
+    "supply": AMOUNT,
+    "reserve_balance": AMOUNT,
+    "weight": np.int64,
+}
+
+
+def event(name: str, inputs: Sequence[Tuple[str, str, bool]]) -> dict:
+    return {
+        "anonymous": False,
+        "name": name,
+        "type": "event",
+        "inputs": [{"name": n, "type": t, "indexed": i} for n, t, i in inputs],
+    }
+
+
+CONVERSION_ARGS = [
+    ("_fromToken", "address", True),
+    ("_toToken", "address", True),
+    ("_trader", "address", True),
+    ("_amount", "uint256", False),
+    ("_return", "uint256", False),
+]
+
+# converters before 0.4 report the price instead of the fee
+CONVERTER_EVENTS = [
+    event("Conversion", CONVERSION_ARGS + [("_conversionFee", "int256", False)]),
+    event(
+        "Conversion",
+        CONVERSION_ARGS
+        + [("_currentPriceN", "uint256", False), ("_currentPriceD", "uint256", False)],
+    ),
+    event(
+        "PriceDataUpdate",
+        [
+            ("_connectorToken", "address", True),
+            ("_tokenSupply", "uint256", False),
+            ("_connectorBalance", "uint256", False),
+            ("_connectorWeight", "uint32", False),
+        ],
+    ),
+]
+RELAY_EVENTS = [
+    event(
+        "Transfer",
+        [
+            ("_from", "address", True),
+            ("_to", "address", True),
+            ("_value", "uint256", False),
+        ],
+    )
+]
+
+# event name -> (event type, column -> argument)
+LAYOUTS = {
+    "Conversion": (
+        CONVERSION,
+        {
+            "account": "_trader",
+            "from_token": "_fromToken",
+            "to_token": "_toToken",
+            "amount": "_amount",
+            "return_amount": "_return",
+        },
+    ),
+    "PriceDataUpdate": (
+        PRICE_DATA,
+        {
+            "from_token": "_connectorToken",
+            "supply": "_tokenSupply",
+            "reserve_balance": "_connectorBalance",
+            "weight": "_connectorWeight",
+        },
+    ),
+    "Transfer": (
+        RELAY_TRANSFER,
+        {"account": "_from", "recipient": "_to", "amount": "_value"},
+    ),
+}
+
+
+def topics(events: Sequence[dict]) -> List[str]:
+    return ["0x" + event_abi_to_log_topic(e).hex() for e in events]
+
+
+class RelayDecoder:
+    """Decodes converter and relay token logs straight into relay columns,
+    with decoders compiled once per event like ``EventDecoder``."""
+
+    def __init__(self):
+        self.decoders: Dict[bytes, Tuple[int, Dict[str, Getter]]] = dict()
+        for item in CONVERTER_EVENTS + RELAY_EVENTS:
+            kind, layout = LAYOUTS[item["name"]]
+            getters = compile_event(item)
+            self.decoders[event_abi_to_log_topic(item)] = (
+                kind,
+                {column: getters[arg] for column, arg in layout.items()},
+            )
+
+    def decode(
+        self, logs: Sequence[dict], relay_address: Optional[str] = None
+    ) -> Dict[str, np.ndarray]:
+        """Columns of the known events among ``logs``, which are sorted by
+        block and log index. Transfers are only kept when they are emitted by
+        ``relay_address``."""
+        rows = []
+        for log in logs:
+            log_topics = [to_bytes(t) for t in log["topics"]]
+            decoder = self.decoders.get(log_topics[0])
+            if decoder is None:
+                continue
+            kind, getters = decoder
+            if kind == RELAY_TRANSFER and log["address"] != relay_address:
+                continue
+            data = to_bytes(log["data"])
+            rows.append(
+                (
+                    log["blockNumber"],
+                    log["logIndex"],
+                    kind,
+                    {column: get(log_topics, data) for column, get in getters.items()},
+                )
+            )
+
+        columns = empty_columns(len(rows), RELAY_COLUMNS)
+        if not rows:
+            return columns
+        columns["block"][:] = [r[0] for r in rows]
+        columns["log_index"][:] = [r[1] for r in rows]
+        columns["event"][:] = [r[2] for r in rows]
+        for name in ("account", "recipient", "from_token", "to_token"):
+            columns[name][:] = [r[3].get(name, "") for r in rows]
+        for name in ("amount", "return_amount", "supply", "reserve_balance"):
+            words = b"".join(r[3].get(name, bytes(32)) for r in rows)
+            columns[name] = (
+                np.frombuffer(words, dtype=">u8").reshape(-1, 4).astype(np.uint64)
+            )
+        columns["weight"][:] = [
+            int.from_bytes(r[3].get("weight", bytes(32)), "big") for r in rows
+        ]
+        return columns
@@ -0,0 +1,166 @@
+from collections import defaultdict
+from typing import Any, Dict, Sequence, Tuple
+
+import numpy as np
+
+from analytics.uniswap.event_store import EventStore, as_float, as_int
+from analytics.uniswap.exchange_stages import ZERO_ADDRESS, accounts
+from analytics.uniswap.relay_events import (
+    CONVERSION,
+    PRICE_DATA,
+    RELAY_COLUMNS,
+    RELAY_TRANSFER,
+)
+
+PROVIDERS = "providers"
+HISTORY = "history"
+STAGES = (PROVIDERS, HISTORY)
+
+COLUMNS = {
+    PROVIDERS: ["event", "account", "recipient", "amount"],
+    HISTORY: [
+        "block",
+        "event",
+        "from_token",
+        "to_token",
+        "amount",
+        "return_amount",
+        "supply",
+        "reserve_balance",
+        "weight",
+    ],
+}
+
+# The per-relay part of the Bancor stages, run in worker processes like the
+# Uniswap exchange stages.
+
+
+def providers(events: Dict[str, np.ndarray], relay_address: str) -> Dict[str, int]:
+    """Relay token balances. Relay tokens are issued and destroyed through
+    transfers from and to the relay token itself."""
+    minters = {ZERO_ADDRESS, relay_address}
+    transfers = events["event"] == RELAY_TRANSFER
+    balances = defaultdict(int)
+    for sender, to, value in zip(
+        accounts(events["account"][transfers]),
+        accounts(events["recipient"][transfers]),
+        as_int(events["amount"][transfers]),
+    ):
+        if sender not in minters:
+            balances[sender] -= value
+        if to not in minters:
+            balances[to] += value
+    return balances
+
+
+def last_index(mask: np.ndarray) -> np.ndarray:
+    """Index of the last true entry up to every position, -1 before the first."""
+    return np.maximum.accumulate(np.where(mask, np.arange(len(mask)), -1))
+
+
+def history(
+    events: Dict[str, np.ndarray],
+    chart_blocks: Sequence[int],
+    base_token: str,
+    token: str,
+) -> Dict[str, list]:
+    """Per chart chunk state of a relay, computed from its event columns.
+
+    Connector balances, relay token supply and connector weights come from
+    the price data updates the converter emits after every change. The value
+    of one relay token is ``B^wb * T^wt / S``, and the ROI of a chunk is the
+    change of that value, so adding and removing liquidity leave it as is.
+
+    Args:
+        events: ``HISTORY`` columns of the relay
+        chart_blocks: last block of every chart chunk
+        base_token: address of the BNT or USDB connector
+        token: address of the other connector
+
+    Returns:
+        History columns: block_number, dm_change, bnt_balance, token_balance
+        and trade_volume (in base token) per chunk
+    """
+    chart_blocks = np.asarray(chart_blocks, dtype=np.int64)
+    n_chunks = len(chart_blocks)
+    base_token, token = base_token.encode(), token.encode()
+
+    price = events["event"] == PRICE_DATA
+    block = np.asarray(events["block"][price])
+    connector = events["from_token"][price]
+    supply = as_int(events["supply"][price])
+    balance = as_int(events["reserve_balance"][price])
+    weight = events["weight"][price].astype(np.float64) / 1e6
+
+    # last update of each connector at the end of every chunk, -1 for none
+    processed = np.searchsorted(block, chart_blocks, side="right")
+    base_at = np.concatenate([[-1], last_index(connector == base_token)])[processed]
+    token_at = np.concatenate([[-1], last_index(connector == token)])[processed]
+
+    known = (base_at >= 0) & (token_at >= 0)
+    bnt_balance = np.zeros(n_chunks, dtype=object)
+    token_balance = np.zeros(n_chunks, dtype=object)
+    chunk_supply = np.zeros(n_chunks, dtype=object)
+    bnt_balance[known] = balance[base_at[known]]
+    token_balance[known] = balance[token_at[known]]
+    chunk_supply[known] = supply[np.maximum(base_at, token_at)[known]]
+
+    valued = known & (bnt_balance > 0) & (token_balance > 0) & (chunk_supply > 0)
+    log_value = np.full(n_chunks, np.nan)
+    log_value[valued] = (
+        weight[base_at[valued]] * np.log(bnt_balance[valued].astype(np.float64))
+        + weight[token_at[valued]] * np.log(token_balance[valued].astype(np.float64))
+        - np.log(chunk_supply[valued].astype(np.float64))
+    )
+    previous = np.concatenate([[np.nan], log_value[:-1]])
+    dm_change = np.exp(log_value - previous)
+    dm_change[np.isnan(dm_change)] = 1.0
+
+    # conversions between the connectors are counted in base token, buying
+    # and selling the relay token itself is not trading
+    conversion = events["event"] == CONVERSION
+    chunk = np.searchsorted(chart_blocks, events["block"][conversion], side="left")
+    sold = events["from_token"][conversion] == base_token
+    bought = events["to_token"][conversion] == base_token
+    volume = np.where(
+        sold,
+        as_float(events["amount"][conversion]),
+        as_float(events["return_amount"][conversion]),
+    )
+    counted = (chunk < n_chunks) & (sold | bought)
+    trade_volume = np.bincount(
+        chunk[counted], weights=volume[counted], minlength=n_chunks
+    )[:n_chunks]
+
+    return {
+        "block_number": chart_blocks.tolist(),
+        "dm_change": dm_change.tolist(),
+        "bnt_balance": bnt_balance.tolist(),
+        "token_balance": token_balance.tolist(),
+        "trade_volume": trade_volume.tolist(),
+    }
+
+
+def process_relay(
+    events_dir: str,
+    chart_blocks: Sequence[int],
+    stages: Sequence[str],
+    task: Tuple[str, str, str],
+) -> Dict[str, Any]:
+    """Runs ``stages`` for one relay, ``task`` is the relay token, base
+    token and other connector address."""
+    relay_address, base_token, token = task
+    store = EventStore(events_dir, RELAY_COLUMNS)
+    result = dict()
+    if PROVIDERS in stages:
+        result[PROVIDERS] = providers(
+            store.read(relay_address, COLUMNS[PROVIDERS]), relay_address
+        )
+    if HISTORY in stages:
+        result[HISTORY] = history(
+            store.read(relay_address, COLUMNS[HISTORY]),
+            chart_blocks,
+            base_token,
+            token,
+        )
+    return result
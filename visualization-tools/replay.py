@@ -0,0 +1,264 @@
+"""Records and replays the JSON-RPC and GraphQL traffic of the pipelines.
+
+The server stands in for a node. Pointed at an upstream node it forwards
+every request to the same path under the upstream URL and records the
+responses into a fixture file, so one server records both the JSON-RPC
+endpoint at its root and a GraphQL endpoint like ``/graphql``. Without an
+upstream it answers from the fixtures only, so the ingestion code can be run
+and benchmarked offline:
+
+    python replay.py --fixtures run.jsonl --upstream https://node:8545
+    python replay.py --fixtures run.jsonl --latency 0.05 --rate 20
+
+Clients only need their endpoints pointed at the server's URL, with the
+path they have on the node. JSON-RPC
+requests are matched by method and params, so batches are answered call by
+call whatever their composition and ids. GraphQL requests are matched by
+query and variables.
+"""
+
+import argparse
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+
+NOT_RECORDED = {"code": -32000, "message": "not recorded"}
+
+
+def rpc_key(call: dict) -> str:
+    return json.dumps(["rpc", call.get("method"), call.get("params")], sort_keys=True)
+
+
+def graphql_key(body: dict) -> str:
+    return json.dumps(
+        ["graphql", body.get("query"), body.get("variables")], sort_keys=True
+    )
+
+
+class Fixtures:
+    """Recorded responses, kept in a JSON lines file of ``{"key", "response"}``
+    records. Records are appended as they are made, later records of a key
+    replace earlier ones."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.responses: Dict[str, Any] = dict()
+        try:
+            with open(path) as in_f:
+                for line in in_f:
+                    record = json.loads(line)
+                    self.responses[record["key"]] = record["response"]
+        except FileNotFoundError:
+            pass
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.responses.get(key)
+
+    def put(self, key: str, response: Any):
+        with self.lock:
+            self.responses[key] = response
+            with open(self.path, "a") as out_f:
+                out_f.write(json.dumps({"key": key, "response": response}) + "\n")
+
+
+class RequestLimit:
+    """Allows at most ``rate`` requests per second, with bursts of up to
+    ``rate`` requests."""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.tokens = rate
+        self.time = time.monotonic()
+
+    def allow(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.time) * self.rate)
+            self.time = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class ReplayServer:
+    """Local stand-in for a node's JSON-RPC and GraphQL endpoints.
+
+    Args:
+        fixtures: fixture file, created when recording
+        upstream: endpoint to forward to and record from, None to replay
+        latency: seconds added to every response
+        rate: requests per second answered, None for no limit. Requests
+            over the limit get HTTP 429 like from a rate limited node.
+        host: interface to listen on
+        port: port to listen on, 0 for any free port
+    """
+
+    def __init__(
+        self,
+        fixtures: str,
+        upstream: Optional[str] = None,
+        latency: float = 0.0,
+        rate: Optional[float] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.fixtures = Fixtures(fixtures)
+        self.upstream = upstream
+        self.latency = latency
+        self.limit = RequestLimit(rate) if rate else None
+        self.session = requests.Session()
+        self.hits = 0
+        self.misses = 0
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def _forward(self, path: str, body: Any) -> Tuple[int, Any]:
+        url = self.upstream if path in ("", "/") else self.upstream.rstrip("/") + path
+        resp = self.session.post(url, json=body)
+        try:
+            return resp.status_code, resp.json()
+        except ValueError:
+            return resp.status_code, {"errors": [{"message": resp.text}]}
+
+    def _rpc(self, path: str, body: Any) -> Tuple[int, Any]:
+        calls = body if isinstance(body, list) else [body]
+        if self.upstream is not None:
+            status, responses = self._forward(path, body)
+            if status == 200:
+                by_id = {
+                    r.get("id"): r
+                    for r in (responses if isinstance(responses, list) else [responses])
+                    if isinstance(r, dict)
+                }
+                for call in calls:
+                    response = by_id.get(call.get("id"))
+                    if response is not None:
+                        response = dict(response)
+                        response.pop("id", None)
+                        self.fixtures.put(rpc_key(call), response)
+            return status, responses
+
+        responses = []
+        for call in calls:
+            recorded = self.fixtures.get(rpc_key(call))
+            if recorded is None:
+                self.misses += 1
+                recorded = {"jsonrpc": "2.0", "error": NOT_RECORDED}
+            else:
+                self.hits += 1
+            responses.append(dict(recorded, id=call.get("id")))
+        return 200, responses if isinstance(body, list) else responses[0]
+
+    def _graphql(self, path: str, body: dict) -> Tuple[int, Any]:
+        key = graphql_key(body)
+        if self.upstream is not None:
+            status, response = self._forward(path, body)
+            # too many results (413) is an answer the fetcher adapts to
+            if status in (200, 413):
+                self.fixtures.put(key, {"status": status, "body": response})
+            return status, response
+
+        recorded = self.fixtures.get(key)
+        if recorded is None:
+            self.misses += 1
+            return 200, {"errors": [{"message": NOT_RECORDED["message"]}]}
+        self.hits += 1
+        return recorded["status"], recorded["body"]
+
+    def handle(self, body: Any, path: str = "/") -> Tuple[int, Any]:
+        """Status and body of the answer to a request body posted to
+        ``path``."""
+        if self.limit is not None and not self.limit.allow():
+            return 429, {"error": "rate limit exceeded"}
+        if self.latency:
+            time.sleep(self.latency)
+        if isinstance(body, dict) and "query" in body:
+            return self._graphql(path, body)
+        return self._rpc(path, body)
+
+    def _handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                try:
+                    status, response = server.handle(
+                        json.loads(self.rfile.read(length)), self.path
+                    )
+                except Exception as e:
+                    logging.exception("Request failed")
+                    status, response = 500, {"error": str(e)}
+                data = json.dumps(response).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                logging.debug(format, *args)
+
+        return Handler
+
+    def start(self) -> "ReplayServer":
+        """Serves in a background thread."""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        logging.info(
+            "Answered {} recorded requests, {} were not recorded".format(
+                self.hits, self.misses
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Record or replay JSON-RPC and GraphQL responses."
+    )
+    parser.add_argument("--fixtures", type=str, required=True, help="Fixture file.")
+    parser.add_argument(
+        "--upstream",
+        type=str,
+        default=None,
+        help="Node endpoint to record from, replays the fixtures when not set.",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds added to every response."
+    )
+    parser.add_argument(
+        "--rate", type=float, default=None, help="Requests per second answered."
+    )
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8545)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    server = ReplayServer(
+        args.fixtures, args.upstream, args.latency, args.rate, args.host, args.port
+    )
+    logging.info("Serving on {}".format(server.url))
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
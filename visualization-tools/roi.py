@@ -0,0 +1,140 @@
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+from analytics.uniswap.event_store import (
+    ADD_LIQUIDITY,
+    ETH_PURCHASE,
+    LIQUIDITY_TRANSFER,
+    REMOVE_LIQUIDITY,
+    TOKEN_PURCHASE,
+    TOKEN_TRANSFER,
+)
+
+
+def skipped_transfers(block: np.ndarray, event: np.ndarray) -> np.ndarray:
+    """Token transfers that are part of a following EthPurchase or
+    AddLiquidity of the same block (see ``skip_transfer``)."""
+    n = len(event)
+    # pad so that position p + 1 and p + 2 always exist, padding blocks are
+    # later than any real block so they never count as the same block
+    last = block[-1] + 1 if n else 0
+    next_block = np.concatenate([block[1:], [last, last]])
+    next_next_block = next_block[1:]
+    next_event = np.concatenate([event[1:], [-1, -1]])
+    next_next_event = next_event[1:]
+    next_block, next_event = next_block[:n], next_event[:n]
+    next_next_block, next_next_event = next_next_block[:n], next_next_event[:n]
+
+    same_block = next_block == block
+    part_of_next = np.isin(next_event, (ETH_PURCHASE, ADD_LIQUIDITY))
+    part_of_next_next = (
+        (next_next_block == block)
+        & (next_event == LIQUIDITY_TRANSFER)
+        & (next_next_event == ETH_PURCHASE)
+    )
+    return (event == TOKEN_TRANSFER) & same_block & (part_of_next | part_of_next_next)
+
+
+def roi_series(
+    block: np.ndarray,
+    event: np.ndarray,
+    eth_amount: np.ndarray,
+    token_amount: np.ndarray,
+    chart_blocks: Sequence[int],
+    eth_start: int = 0,
+    token_start: int = 0,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, Optional[int]]:
+    """Per chart chunk ROI of an exchange, computed from its event columns.
+
+    Reserves after every event are prefix sums of the per-event changes,
+    kept as exact python ints. The change of the liquidity value of a trade
+    is ``(E' * T') / (E * T)``, and the chunk's change is the product over its
+    trades, which is summed in log space instead of multiplied out as ever
+    growing integers. Events are bucketed into chunks with ``searchsorted``.
+
+    Args:
+        block, event: event block numbers and types, sorted
+        eth_amount, token_amount: exact event amounts (python ints)
+        chart_blocks: last block of every chart chunk
+        eth_start, token_start: reserves before the first event, when the
+            series continues an earlier one
+
+    Returns:
+        dm_change, eth_balance, token_balance and trade_volume per chunk, and
+        the first chunk that cannot be computed (a trade against an empty
+        reserve) or None
+    """
+    chart_blocks = np.asarray(chart_blocks, dtype=np.int64)
+    n_chunks = len(chart_blocks)
+
+    transfer = (event == TOKEN_TRANSFER) & ~skipped_transfers(block, event)
+    add = event == ADD_LIQUIDITY
+    remove = event == REMOVE_LIQUIDITY
+    eth_purchase = event == ETH_PURCHASE
+    token_purchase = event == TOKEN_PURCHASE
+    trade = eth_purchase | token_purchase
+
+    zero = np.zeros(len(event), dtype=object)
+    eth_delta = np.where(add | token_purchase, eth_amount, zero)
+    eth_delta = np.where(remove | eth_purchase, -eth_amount, eth_delta)
+    token_delta = np.where(transfer | add | eth_purchase, token_amount, zero)
+    token_delta = np.where(remove | token_purchase, -token_amount, token_delta)
+
+    eth_after = eth_start + np.cumsum(eth_delta) if len(event) else zero
+    token_after = token_start + np.cumsum(token_delta) if len(event) else zero
+    eth_before = eth_after - eth_delta
+    token_before = token_after - token_delta
+
+    # events after the last chart block are never reported
+    chunk = np.searchsorted(chart_blocks, block, side="left")
+    counted = chunk < n_chunks
+
+    # a trade against an empty reserve makes the chunk's ratio undefined
+    broken = trade & counted & ((eth_before == 0) | (token_before == 0))
+    failed_chunk = int(chunk[broken].min()) if broken.any() else None
+
+    factor = np.ones(len(event))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rated = trade & ~broken
+        factor[rated] = (
+            eth_after[rated].astype(np.float64) / eth_before[rated].astype(np.float64)
+        ) * (
+            token_after[rated].astype(np.float64)
+            / token_before[rated].astype(np.float64)
+        )
+        grown = transfer & (token_before > 0)
+        factor[grown] = token_after[grown].astype(np.float64) / token_before[
+            grown
+        ].astype(np.float64)
+        log_factor = np.log(factor)
+
+    log_change = np.bincount(
+        chunk[counted], weights=log_factor[counted], minlength=n_chunks
+    )[:n_chunks]
+    dm_change = np.exp(log_change / 2)
+
+    # reserves after the last event of every chunk
+    processed = np.searchsorted(block, chart_blocks, side="right")
+    has_events = processed > 0
+    eth_balance = np.full(n_chunks, eth_start, dtype=object)
+    token_balance = np.full(n_chunks, token_start, dtype=object)
+    eth_balance[has_events] = eth_after[processed[has_events] - 1]
+    token_balance[has_events] = token_after[processed[has_events] - 1]
+
+    # eth bought is grossed up by the 0.3% fee, eth sold already includes it
+    bought = eth_purchase & counted
+    sold = token_purchase & counted
+    trade_volume = np.zeros(n_chunks, dtype=object)
+    if sold.any():
+        np.add.at(trade_volume, chunk[sold], eth_amount[sold])
+    if bought.any():
+        fee_volume = np.bincount(
+            chunk[bought],
+            weights=eth_amount[bought].astype(np.float64) / 0.997,
+            minlength=n_chunks,
+        )[:n_chunks]
+        with_bought = np.bincount(chunk[bought], minlength=n_chunks)[:n_chunks] > 0
+        trade_volume[with_bought] = trade_volume[with_bought] + fee_volume[with_bought]
+
+    return dm_change, eth_balance, token_balance, trade_volume, failed_chunk
@@ -0,0 +1,319 @@
+import io
+import json
+import sqlite3
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from analytics.uniswap.structs import (
+    ExchangeInfo,
+    HistorySeries,
+    RelayInfo,
+    RoiSeries,
+    VolumeMatrix,
+)
+
+STATE_DB = "uniswap_state.sqlite"
+RELAY_STATE_DB = "bancor_state.sqlite"
+
+CURSOR_TABLE = (
+    "CREATE TABLE IF NOT EXISTS cursor ("
+    "id INTEGER PRIMARY KEY CHECK (id = 0), last_block INTEGER NOT NULL)"
+)
+
+# schema version -> statements upgrading the previous version to it
+MIGRATIONS = {
+    1: [
+        CURSOR_TABLE,
+        "CREATE TABLE IF NOT EXISTS exchanges ("
+        "exchange_address TEXT PRIMARY KEY, position INTEGER NOT NULL, "
+        "token_address TEXT NOT NULL, token_name TEXT NOT NULL, "
+        "token_symbol TEXT NOT NULL, token_decimals INTEGER NOT NULL, "
+        "eth_balance TEXT NOT NULL, token_balance TEXT NOT NULL, "
+        "providers TEXT NOT NULL, valuable_traders TEXT NOT NULL, "
+        "roi BLOB NOT NULL, volume BLOB NOT NULL, trade_volume BLOB NOT NULL, "
+        "total_trade_volume TEXT NOT NULL, processed_block INTEGER)",
+    ]
+}
+
+SUMMARY_COLUMNS = [
+    "exchange_address",
+    "token_address",
+    "token_name",
+    "token_symbol",
+    "token_decimals",
+    "eth_balance",
+    "token_balance",
+]
+SERIES_COLUMNS = ["providers", "valuable_traders", "roi", "volume"]
+RESUME_COLUMNS = ["trade_volume", "total_trade_volume", "processed_block"]
+
+RELAY_MIGRATIONS = {
+    1: [
+        CURSOR_TABLE,
+        "CREATE TABLE IF NOT EXISTS relays ("
+        "token_address TEXT PRIMARY KEY, position INTEGER NOT NULL, "
+        "token_symbol TEXT NOT NULL, underlying_token_symbol TEXT NOT NULL, "
+        "underlying_token_address TEXT NOT NULL, base_token_symbol TEXT NOT NULL, "
+        "base_token_address TEXT NOT NULL, converter_address TEXT NOT NULL, "
+        "bnt_balance TEXT NOT NULL, token_decimals INTEGER NOT NULL, "
+        "token_balance TEXT NOT NULL, providers TEXT NOT NULL, history BLOB NOT NULL)",
+    ]
+}
+
+RELAY_SUMMARY_COLUMNS = [
+    "token_address",
+    "token_symbol",
+    "underlying_token_symbol",
+    "underlying_token_address",
+    "base_token_symbol",
+    "base_token_address",
+    "converter_address",
+    "bnt_balance",
+    "token_decimals",
+    "token_balance",
+]
+
+
+class SchemaError(Exception):
+    pass
+
+
+def to_blob(**arrays: np.ndarray) -> bytes:
+    out = io.BytesIO()
+    np.savez(out, **arrays)
+    return out.getvalue()
+
+
+def from_blob(blob: bytes) -> Dict[str, np.ndarray]:
+    with np.load(io.BytesIO(blob), allow_pickle=False) as arrays:
+        return {name: arrays[name] for name in arrays.files}
+
+
+def volume_to_blob(volume: VolumeMatrix) -> bytes:
+    return to_blob(
+        chunks=np.array(volume.chunks),
+        traders=np.array(volume.traders, dtype=str),
+        chunk=volume.chunk,
+        trader=volume.trader,
+        value=volume.value,
+    )
+
+
+def volume_from_blob(blob: bytes) -> VolumeMatrix:
+    arrays = from_blob(blob)
+    return VolumeMatrix(
+        int(arrays["chunks"]),
+        arrays["traders"].tolist(),
+        arrays["chunk"],
+        arrays["trader"],
+        arrays["value"],
+    )
+
+
+class VersionedStore:
+    """SQLite file with a schema version and the block its content was
+    loaded up to.
+
+    The schema version is kept in ``PRAGMA user_version``. Opening an older
+    file runs the ``migrations`` of every version after it.
+
+    Args:
+        path: SQLite database file
+        migrations: schema version -> statements upgrading to it
+    """
+
+    def __init__(self, path: str, migrations: Dict[int, List[str]]):
+        self.connection = sqlite3.connect(path)
+        schema_version = max(migrations)
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version > schema_version:
+            raise SchemaError(
+                "{} has schema version {}, this code reads up to {}".format(
+                    path, version, schema_version
+                )
+            )
+        with self.connection:
+            for v in range(version + 1, schema_version + 1):
+                for statement in migrations[v]:
+                    self.connection.execute(statement)
+            self.connection.execute("PRAGMA user_version = {}".format(schema_version))
+
+    def last_block(self) -> Optional[int]:
+        """Block the saved state was loaded up to, None when nothing is saved."""
+        row = self.connection.execute("SELECT last_block FROM cursor").fetchone()
+        return None if row is None else row[0]
+
+    def _replace(self, table: str, rows: List[tuple], last_block: int):
+        """Replaces the rows of ``table`` and the block in one transaction."""
+        with self.connection:
+            self.connection.execute("DELETE FROM {}".format(table))
+            if rows:
+                self.connection.executemany(
+                    "INSERT INTO {} VALUES ({})".format(
+                        table, ", ".join("?" * len(rows[0]))
+                    ),
+                    rows,
+                )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO cursor VALUES (0, ?)", (last_block,)
+            )
+
+    def _select(
+        self, table: str, columns: List[str], where: str = "", params: tuple = ()
+    ) -> List[Dict]:
+        rows = self.connection.execute(
+            "SELECT {} FROM {} {} ORDER BY position".format(
+                ", ".join(columns), table, where
+            ),
+            params,
+        )
+        return [dict(zip(columns, row)) for row in rows]
+
+
+class StateStore(VersionedStore):
+    """State of the Uniswap analysis, kept in SQLite between runs.
+
+    Every exchange is a row: its metadata in plain columns, its series as
+    NumPy blobs. A save replaces the exchanges and the block they were
+    loaded up to in one transaction, so a crash leaves the previous state
+    intact. Loads only read the columns that are asked for, and single
+    exchanges can be loaded on their own.
+
+    Args:
+        path: SQLite database file
+    """
+
+    def __init__(self, path: str = STATE_DB):
+        super().__init__(path, MIGRATIONS)
+
+    def save(self, infos: Sequence[ExchangeInfo], last_block: int):
+        """Replaces the saved exchanges and block in one transaction."""
+        rows = [
+            (
+                info.exchange_address,
+                position,
+                info.token_address,
+                info.token_name,
+                info.token_symbol,
+                info.token_decimals,
+                str(info.eth_balance),
+                str(info.token_balance),
+                json.dumps(info.providers),
+                json.dumps(info.valuable_traders),
+                to_blob(roi=info.roi.data),
+                volume_to_blob(info.volume),
+                volume_to_blob(info.trade_volume),
+                json.dumps(info.total_trade_volume),
+                info.processed_block,
+            )
+            for position, info in enumerate(infos)
+        ]
+        self._replace("exchanges", rows, last_block)
+
+    def _info(self, values: Dict) -> ExchangeInfo:
+        info = ExchangeInfo(
+            values["token_address"],
+            values["token_name"],
+            values["token_symbol"],
+            values["token_decimals"],
+            values["exchange_address"],
+            int(values["eth_balance"]),
+            int(values["token_balance"]),
+        )
+        if "roi" in values:
+            info.providers = json.loads(values["providers"])
+            info.valuable_traders = json.loads(values["valuable_traders"])
+            info.roi = RoiSeries(from_blob(values["roi"])["roi"])
+            info.volume = volume_from_blob(values["volume"])
+        if "trade_volume" in values:
+            info.trade_volume = volume_from_blob(values["trade_volume"])
+            info.total_trade_volume = json.loads(values["total_trade_volume"])
+            info.processed_block = values["processed_block"]
+        return info
+
+    def _load(
+        self, where: str, params: tuple, series: bool, resume: bool
+    ) -> List[ExchangeInfo]:
+        columns = (
+            SUMMARY_COLUMNS
+            + (SERIES_COLUMNS if series else [])
+            + (RESUME_COLUMNS if resume else [])
+        )
+        return [
+            self._info(values)
+            for values in self._select("exchanges", columns, where, params)
+        ]
+
+    def load(self, series: bool = True, resume: bool = True) -> List[ExchangeInfo]:
+        """Saved exchanges in the order they were saved.
+
+        Args:
+            series: load providers, ROI and volume
+            resume: load the state the next update continues from, infos
+                loaded without it must not be saved
+        """
+        return self._load("", (), series, resume)
+
+    def load_exchange(self, exchange_address: str) -> Optional[ExchangeInfo]:
+        infos = self._load(
+            "WHERE exchange_address = ?", (exchange_address,), True, True
+        )
+        return infos[0] if infos else None
+
+
+class RelayStateStore(VersionedStore):
+    """State of the Bancor analysis, one row per relay like ``StateStore``.
+
+    Args:
+        path: SQLite database file
+    """
+
+    def __init__(self, path: str = RELAY_STATE_DB):
+        super().__init__(path, RELAY_MIGRATIONS)
+
+    def save(self, infos: Sequence[RelayInfo], last_block: int):
+        """Replaces the saved relays and block in one transaction."""
+        rows = [
+            (
+                info.token_address,
+                position,
+                info.token_symbol,
+                info.underlying_token_symbol,
+                info.underlying_token_address,
+                info.base_token_symbol,
+                info.base_token_address,
+                info.converter_address,
+                str(info.bnt_balance),
+                info.token_decimals,
+                str(info.token_balance),
+                json.dumps(info.providers),
+                to_blob(history=info.history.data),
+            )
+            for position, info in enumerate(infos)
+        ]
+        self._replace("relays", rows, last_block)
+
+    def load(self, series: bool = True) -> List[RelayInfo]:
+        """Saved relays in the order they were saved, with providers and
+        history when ``series`` is set."""
+        columns = RELAY_SUMMARY_COLUMNS + (["providers", "history"] if series else [])
+        infos = []
+        for values in self._select("relays", columns):
+            info = RelayInfo(
+                values["token_address"],
+                values["token_symbol"],
+                values["converter_address"],
+            )
+            info.underlying_token_symbol = values["underlying_token_symbol"]
+            info.underlying_token_address = values["underlying_token_address"]
+            info.base_token_symbol = values["base_token_symbol"]
+            info.base_token_address = values["base_token_address"]
+            info.token_decimals = values["token_decimals"]
+            info.bnt_balance = int(values["bnt_balance"])
+            info.token_balance = int(values["token_balance"])
+            if series:
+                info.providers = json.loads(values["providers"])
+                info.history = HistorySeries(from_blob(values["history"])["history"])
+            infos.append(info)
+        return infos
@@ -1,7 +1,43 @@
-from typing import Dict, List
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Sequence, Union
 
+import numpy as np
+
+from analytics.uniswap.event_store import as_int, to_limbs
+
+# balances are signed, they are kept as 256 bit two's complement limbs
+AMOUNT = (np.uint64, 4)
+
+
+def to_amounts(values: Sequence[int]) -> np.ndarray:
+    return to_limbs([int(v) % 2**256 for v in values])
+
+
+def from_amounts(limbs: np.ndarray) -> np.ndarray:
+    """Exact amounts as an array of python ints."""
+    values = as_int(limbs.reshape(-1, 4))
+    return np.where(values >= 2**255, values - 2**256, values)
+
+
+class Record:
+    """Base of the slotted records. They pickle as a dict of their slots,
+    like the records pickled before they had slots."""
+
+    __slots__ = ()
+
+    def __getstate__(self) -> dict:
+        return {
+            name: getattr(self, name) for name in self.__slots__ if hasattr(self, name)
+        }
+
+    def __setstate__(self, state: dict):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+class RoiInfo(Record):
+    __slots__ = ("dm_change", "eth_balance", "token_balance", "trade_volume")
 
-class RoiInfo:
     def __init__(
         self, dm_change: float, eth_balance: int, token_balance: int, trade_volume: int
     ):
@@ -11,7 +47,231 @@ class RoiInfo:
         self.trade_volume: int = trade_volume
 
 
-class ExchangeInfo:
+class History(Record):
+    __slots__ = (
+        "block_number",
+        "dm_change",
+        "bnt_balance",
+        "token_balance",
+        "trade_volume",
+    )
+
+    def __init__(
+        self,
+        block_number: int,
+        dm_change: float,
+        bnt_balance: int,
+        token_balance: int,
+        trade_volume: int,
+    ):
+        self.block_number: int = block_number
+        self.dm_change: float = dm_change
+        self.bnt_balance: int = bnt_balance
+        self.token_balance: int = token_balance
+        self.trade_volume: int = trade_volume
+
+
+class Series:
+    """Time series of records, kept as one structured array.
+
+    Indexing returns a record, slicing and ``+`` return a series, so a series
+    is used like the list of records it replaces. Whole columns come from
+    ``column``, balances as exact python ints.
+    """
+
+    dtype: np.dtype = None
+    record: type = None
+
+    def __init__(self, data: Optional[np.ndarray] = None):
+        self.data = np.zeros(0, dtype=self.dtype) if data is None else data
+
+    @classmethod
+    def from_columns(cls, **columns: Sequence) -> "Series":
+        data = np.zeros(len(next(iter(columns.values()))), dtype=cls.dtype)
+        for name, values in columns.items():
+            data[name] = to_amounts(values) if cls.dtype[name].shape else values
+        return cls(data)
+
+    @classmethod
+    def from_records(cls, records: Sequence) -> "Series":
+        return cls.from_columns(
+            **{name: [getattr(r, name) for r in records] for name in cls.dtype.names}
+        )
+
+    def column(self, name: str) -> np.ndarray:
+        if self.dtype[name].shape:
+            return from_amounts(self.data[name])
+        return self.data[name]
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return type(self)(self.data[index])
+        row = self.data[index]
+        return self.record(
+            *[
+                (
+                    int(from_amounts(row[name])[0])
+                    if self.dtype[name].shape
+                    else row[name].item()
+                )
+                for name in self.dtype.names
+            ]
+        )
+
+    def __iter__(self) -> Iterator:
+        return (self[i] for i in range(len(self)))
+
+    def __add__(self, other: "Series") -> "Series":
+        return type(self)(np.concatenate([self.data, other.data]))
+
+
+class RoiSeries(Series):
+    dtype = np.dtype(
+        [
+            ("dm_change", np.float64),
+            ("eth_balance", AMOUNT),
+            ("token_balance", AMOUNT),
+            ("trade_volume", np.float64),
+        ]
+    )
+    record = RoiInfo
+
+
+class HistorySeries(Series):
+    dtype = np.dtype(
+        [
+            ("block_number", np.int64),
+            ("dm_change", np.float64),
+            ("bnt_balance", AMOUNT),
+            ("token_balance", AMOUNT),
+            ("trade_volume", np.float64),
+        ]
+    )
+    record = History
+
+
+class VolumeMatrix:
+    """Volume per trader of every chart chunk, as a sparse matrix.
+
+    Entries are ``(chunk, trader, value)`` triples sorted by chunk, where
+    ``trader`` indexes ``traders``. Indexing with a chunk returns the dict of
+    its traders' volumes, so the matrix is used like the list of dicts it
+    replaces.
+    """
+
+    def __init__(
+        self,
+        chunks: int = 0,
+        traders: Optional[List[str]] = None,
+        chunk: Optional[np.ndarray] = None,
+        trader: Optional[np.ndarray] = None,
+        value: Optional[np.ndarray] = None,
+    ):
+        self.chunks = chunks
+        self.traders: List[str] = traders or list()
+        self.chunk = np.zeros(0, dtype=np.int32) if chunk is None else chunk
+        self.trader = np.zeros(0, dtype=np.int32) if trader is None else trader
+        self.value = np.zeros(0, dtype=np.float64) if value is None else value
+
+    @classmethod
+    def from_dicts(cls, volumes: Sequence[Dict[str, float]]) -> "VolumeMatrix":
+        index: Dict[str, int] = dict()
+        chunk, trader, value = [], [], []
+        for j, volume in enumerate(volumes):
+            for t, v in volume.items():
+                chunk.append(j)
+                trader.append(index.setdefault(t, len(index)))
+                value.append(v)
+        return cls(
+            len(volumes),
+            list(index),
+            np.array(chunk, dtype=np.int32),
+            np.array(trader, dtype=np.int32),
+            np.array(value, dtype=np.float64),
+        )
+
+    def totals(self) -> np.ndarray:
+        """Volume of every chunk, summed over traders."""
+        return np.bincount(self.chunk, weights=self.value, minlength=self.chunks)
+
+    def column(self, trader: str) -> np.ndarray:
+        """Volume of ``trader`` in every chunk."""
+        column = np.zeros(self.chunks)
+        if trader in self.traders:
+            entries = self.trader == self.traders.index(trader)
+            column[self.chunk[entries]] = self.value[entries]
+        return column
+
+    def __len__(self) -> int:
+        return self.chunks
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            start, stop, _ = index.indices(self.chunks)
+            stop = max(start, stop)
+            lo, hi = np.searchsorted(self.chunk, [start, stop])
+            return VolumeMatrix(
+                stop - start,
+                self.traders,
+                self.chunk[lo:hi] - start,
+                self.trader[lo:hi],
+                self.value[lo:hi],
+            )
+        if index < 0:
+            index += self.chunks
+        if not 0 <= index < self.chunks:
+            raise IndexError("chunk {} is out of range".format(index))
+        lo, hi = np.searchsorted(self.chunk, [index, index + 1])
+        return defaultdict(
+            int,
+            zip(
+                [self.traders[t] for t in self.trader[lo:hi].tolist()],
+                self.value[lo:hi].tolist(),
+            ),
+        )
+
+    def __iter__(self) -> Iterator[Dict[str, float]]:
+        return (self[j] for j in range(self.chunks))
+
+    def __add__(self, other: "VolumeMatrix") -> "VolumeMatrix":
+        traders = list(self.traders)
+        index = {t: i for i, t in enumerate(traders)}
+        for t in other.traders:
+            if t not in index:
+                index[t] = len(traders)
+                traders.append(t)
+        remap = np.array([index[t] for t in other.traders], dtype=np.int32)
+        return VolumeMatrix(
+            self.chunks + other.chunks,
+            traders,
+            np.concatenate([self.chunk, other.chunk + self.chunks]).astype(np.int32),
+            np.concatenate([self.trader, remap[other.trader]]).astype(np.int32),
+            np.concatenate([self.value, other.value]),
+        )
+
+
+class ExchangeInfo(Record):
+    __slots__ = (
+        "token_address",
+        "token_name",
+        "token_symbol",
+        "token_decimals",
+        "exchange_address",
+        "eth_balance",
+        "token_balance",
+        "providers",
+        "roi",
+        "volume",
+        "valuable_traders",
+        "trade_volume",
+        "total_trade_volume",
+        "processed_block",
+        "logs",
+    )
+
     def __init__(
         self,
         token_address: str,
@@ -30,39 +290,73 @@ class ExchangeInfo:
         self.eth_balance: int = eth_balance
         self.token_balance: int = token_balance
         self.providers: Dict[str, int] = dict()
-        self.history: List[int] = list()
-        self.logs: List[dict] = list()
-        self.roi: List[RoiInfo] = list()
-        self.volume: List[Dict[str, int]] = list()
+        self.roi: RoiSeries = RoiSeries()
+        self.volume: VolumeMatrix = VolumeMatrix()
         self.valuable_traders: List[str] = list()
+        # state the next run continues from: volume per trader of every chunk
+        # before filtering, its running total and the last block processed
+        self.trade_volume: VolumeMatrix = VolumeMatrix()
+        self.total_trade_volume: Dict[str, int] = dict()
+        self.processed_block: Optional[int] = None
 
+    @property
+    def history(self) -> np.ndarray:
+        """Ether balance of the exchange at every chart chunk."""
+        return self.roi.column("eth_balance")
 
-class History:
-    def __init__(
-        self,
-        block_number: int,
-        dm_change: float,
-        bnt_balance: int,
-        token_balance: int,
-        trade_volume: int,
-    ):
-        self.block_number: int = block_number
-        self.dm_change: float = dm_change
-        self.bnt_balance: int = bnt_balance
-        self.token_balance: int = token_balance
-        self.trade_volume: int = trade_volume
+    def __setstate__(self, state: dict):
+        # states pickled before the records had slots keep the series as
+        # lists, the history next to the ROI and possibly the raw logs
+        self.__init__(*[state[name] for name in ExchangeInfo.__slots__[:7]])
+        state = dict(state)
+        state.pop("history", None)
+        if isinstance(state.get("roi"), list):
+            state["roi"] = RoiSeries.from_records(state["roi"])
+        for name in ("volume", "trade_volume"):
+            if isinstance(state.get(name), list):
+                state[name] = VolumeMatrix.from_dicts(state[name])
+        super().__setstate__(state)
 
 
-class RelayInfo:
+class RelayInfo(Record):
+    __slots__ = (
+        "token_address",
+        "token_symbol",
+        "underlying_token_symbol",
+        "underlying_token_address",
+        "base_token_symbol",
+        "base_token_address",
+        "converter_address",
+        "bnt_balance",
+        "token_decimals",
+        "token_balance",
+        "providers",
+        "history",
+    )
+
     def __init__(self, token_address: str, token_symbol: str, converter_address: str):
         self.token_address: str = token_address
         self.token_symbol: str = token_symbol
         self.underlying_token_symbol: str = None
+        self.underlying_token_address: str = None
+        # BNT or USDB, bnt_balance is the balance of this connector
+        self.base_token_symbol: str = None
+        self.base_token_address: str = None
         self.converter_address: str = converter_address
         self.bnt_balance: int = 0
         self.token_decimals: int = None
         self.token_balance: int = 0
         self.providers: Dict[str, int] = dict()
-        self.history: List[History] = list()
-        self.converter_logs: List[dict] = list()
-        self.relay_logs: List[dict] = list()
+        self.history: HistorySeries = HistorySeries()
+
+    def __setstate__(self, state: dict):
+        # raw logs are kept in the event store now
+        self.__init__(
+            state["token_address"], state["token_symbol"], state["converter_address"]
+        )
+        state = {
+            k: v for k, v in state.items() if k not in ("converter_logs", "relay_logs")
+        }
+        if isinstance(state.get("history"), list):
+            state["history"] = HistorySeries.from_records(state["history"])
+        super().__setstate__(state)
@@ -0,0 +1,75 @@
+import json
+import os
+import tempfile
+import unittest
+
+from analytics.uniswap.event_store import EventStore
+from analytics.uniswap.relay_events import RELAY_COLUMNS, RelayDecoder
+from analytics.uniswap.relay_stages import STAGES, process_relay
+
+# Logs of one relay as the log fetcher records them: the relay token's
+# transfers and its converter's conversions and price data updates.
+FIXTURE = os.path.join(os.path.dirname(__file__), "data", "bancor_relay_logs.jsonl")
+
+RELAY = "0xA1A1a1a1A1A1A1A1A1a1a1a1a1a1A1A1a1A1a1a1"
+BNT = "0x1f1f1F1f1F1f1f1F1F1F1f1F1f1F1f1F1F1F1F1F"
+TOKEN = "0xe7e7e7E7E7e7e7e7E7E7e7e7E7e7e7E7e7E7E7e7"
+ALICE = "0x0A0A0a0a0a0a0a0A0a0a0A0a0A0A0A0a0a0a0a0a"
+BOB = "0x0B0b0b0b0B0B0B0B0b0b0b0b0B0B0B0B0B0b0B0b"
+
+E = 10**18
+CHART_BLOCKS = [150, 200, 250, 300]
+
+
+def relay_value(bnt_balance, token_balance, supply):
+    # both connectors weigh 50%
+    return (bnt_balance * token_balance) ** 0.5 / supply
+
+
+class TestRelayStages(unittest.TestCase):
+    def setUp(self):
+        with open(FIXTURE) as in_f:
+            logs = [json.loads(line) for line in in_f]
+        logs.sort(key=lambda l: (l["blockNumber"], l["logIndex"]))
+
+        self.events_dir = tempfile.TemporaryDirectory()
+        store = EventStore(self.events_dir.name, RELAY_COLUMNS)
+        store.append(RELAY, 0, CHART_BLOCKS[-1], RelayDecoder().decode(logs, RELAY))
+
+        self.result = process_relay(
+            self.events_dir.name, CHART_BLOCKS, STAGES, (RELAY, BNT, TOKEN)
+        )
+
+    def tearDown(self):
+        self.events_dir.cleanup()
+
+    def test_providers(self):
+        # minted to alice, who passes some on to bob, who burns part of it
+        self.assertEqual(
+            {ALICE: 700 * E, BOB: 200 * E}, dict(self.result["providers"])
+        )
+
+    def test_history(self):
+        history = self.result["history"]
+        self.assertEqual(CHART_BLOCKS, history["block_number"])
+        self.assertEqual(
+            [2000 * E, 2100 * E, 1800 * E, 1800 * E], history["bnt_balance"]
+        )
+        self.assertEqual(
+            [4000 * E, 3820 * E, 3600 * E, 3600 * E], history["token_balance"]
+        )
+        # BNT sold in the second chunk, BNT bought in the third
+        self.assertEqual([0.0, 100.0 * E, 105.0 * E, 0.0], history["trade_volume"])
+
+        values = [
+            relay_value(2000, 4000, 1000),
+            relay_value(2100, 3820, 1000),
+            relay_value(1800, 3600, 900),
+        ]
+        expected = [1.0, values[1] / values[0], values[2] / values[1], 1.0]
+        for dm_change, value in zip(history["dm_change"], expected):
+            self.assertAlmostEqual(value, dm_change, places=9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import logging
+import sqlite3
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from web3.main import to_checksum_address
+
+from analytics.uniswap.batch_rpc import BatchRpc, EthCall, failed
+from analytics.utils import bytes_to_str
+
+# ERC-20 flavours in the order they are tried: the standard string getters,
+# the upper case getters of some early tokens and bytes32 getters (e.g. MKR)
+STR = "str"
+STR_CAPS = "str_caps"
+BYTES32 = "bytes32"
+
+ABI_VARIANTS = {
+    STR: (("name()", "symbol()", "decimals()"), ("string", "string", "uint256")),
+    STR_CAPS: (("NAME()", "SYMBOL()", "DECIMALS()"), ("string", "string", "uint256")),
+    BYTES32: (("name()", "symbol()", "decimals()"), ("bytes32", "bytes32", "uint256")),
+}
+
+TokenMetadata = Tuple[str, str, int, str]
+
+METADATA_CACHE = "token_metadata.sqlite"
+
+
+def metadata_calls(token_address: str, variant: str) -> List[EthCall]:
+    signatures, output_types = ABI_VARIANTS[variant]
+    return [
+        EthCall(token_address, signature, (), [output_type])
+        for signature, output_type in zip(signatures, output_types)
+    ]
+
+
+def load_token_metadata(
+    rpc: BatchRpc, token_addresses: Sequence[str], variants: Sequence[str] = None
+) -> Dict[str, Optional[TokenMetadata]]:
+    """Loads name, symbol and decimals of tokens with batched calls.
+
+    Every variant is tried for all tokens at once, and only the tokens that
+    failed move on to the next variant.
+
+    Args:
+        rpc: batch client
+        token_addresses: tokens to load
+        variants: ABI variants to try, in order
+
+    Returns:
+        token address -> (name, symbol, decimals, variant), or None when no
+        variant worked
+    """
+    variants = list(ABI_VARIANTS) if variants is None else variants
+    metadata: Dict[str, Optional[TokenMetadata]] = dict()
+    pending = list(token_addresses)
+    for variant in variants:
+        if not pending:
+            break
+        calls = [c for t in pending for c in metadata_calls(t, variant)]
+        results = rpc.eth_call(calls)
+        failed_tokens = []
+        for i, token_address in enumerate(pending):
+            name, symbol, decimals = results[3 * i : 3 * i + 3]
+            if failed(name) or failed(symbol) or failed(decimals):
+                failed_tokens.append(token_address)
+                continue
+            if variant == BYTES32:
+                name, symbol = bytes_to_str(name), bytes_to_str(symbol)
+            metadata[token_address] = (name, symbol, decimals, variant)
+        pending = failed_tokens
+
+    for token_address in pending:
+        logging.error("Could not load metadata of token {}".format(token_address))
+        metadata[token_address] = None
+    return metadata
+
+
+class TokenMetadataCache:
+    """Name, symbol and decimals of tokens, kept in SQLite between runs.
+
+    Token metadata never changes, so once a token has been loaded it is never
+    asked again. Rows are keyed by checksummed token address and record the
+    ABI variant that worked for the token.
+
+    Args:
+        path: SQLite database file
+    """
+
+    def __init__(self, path: str = METADATA_CACHE):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS token_metadata ("
+            "token_address TEXT PRIMARY KEY, name TEXT NOT NULL, "
+            "symbol TEXT NOT NULL, decimals INTEGER NOT NULL, variant TEXT NOT NULL)"
+        )
+        self.connection.commit()
+
+    def get_many(self, token_addresses: Sequence[str]) -> Dict[str, TokenMetadata]:
+        """Returns the cached tokens among ``token_addresses``."""
+        wanted = {to_checksum_address(t): t for t in token_addresses}
+        rows = self.connection.execute(
+            "SELECT token_address, name, symbol, decimals, variant FROM token_metadata"
+        )
+        return {wanted[row[0]]: tuple(row[1:]) for row in rows if row[0] in wanted}
+
+    def put_many(self, metadata: Dict[str, Optional[TokenMetadata]]):
+        """Stores loaded tokens, tokens without metadata are left out."""
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO token_metadata VALUES (?, ?, ?, ?, ?)",
+            [
+                (to_checksum_address(t), m[0], m[1], int(m[2]), m[3])
+                for t, m in metadata.items()
+                if m is not None
+            ],
+        )
+        self.connection.commit()
+
+
+def load_cached_token_metadata(
+    rpc: BatchRpc, cache: TokenMetadataCache, token_addresses: Sequence[str]
+) -> Dict[str, Optional[TokenMetadata]]:
+    """``load_token_metadata`` that only calls the node for tokens not in ``cache``."""
+    metadata: Dict[str, Optional[TokenMetadata]] = cache.get_many(token_addresses)
+    missing = [t for t in token_addresses if t not in metadata]
+    if missing:
+        loaded = load_token_metadata(rpc, missing)
+        cache.put_many(loaded)
+        metadata.update(loaded)
+    logging.info(
+        "Token metadata: {} cached, {} loaded".format(
+            len(token_addresses) - len(missing), len(missing)
+        )
+    )
+    return metadata
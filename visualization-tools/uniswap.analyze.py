@@ -1,29 +1,15 @@
-import json
 import logging
 import os
 import pickle
-import re
-from collections import defaultdict
-from itertools import compress, groupby
-from math import sqrt
-from operator import itemgetter
-from typing import List, Iterable, Dict
-
-import requests
-from retrying import retry
-from web3._utils.events import get_event_data
-from web3.main import HexBytes, to_checksum_address
+from itertools import compress
+from typing import List, Iterable, Dict, Optional, Sequence
 
 from analytics.uniswap.config import (
     uniswap_factory,
     web3,
-    pool,
     UNISWAP_EXCHANGE_ABI,
-    STR_ERC_20_ABI,
     ETH,
     HARDCODED_INFO,
-    STR_CAPS_ERC_20_ABI,
-    ERC_20_ABI,
     HISTORY_BEGIN_BLOCK,
     CURRENT_BLOCK,
     HISTORY_CHUNK_SIZE,
@@ -34,20 +20,76 @@ from analytics.uniswap.config import (
     LAST_BLOCK_DUMP,
     ALL_EVENTS,
     EVENT_TRANSFER,
-    EVENT_ADD_LIQUIDITY,
-    EVENT_REMOVE_LIQUIDITY,
-    EVENT_ETH_PURCHASE,
     ROI_DATA,
-    EVENT_TOKEN_PURCHASE,
     VOLUME_DATA,
     TOTAL_VOLUME_DATA,
     GRAPHQL_ENDPOINT,
     GRAPHQL_LOGS_QUERY,
-    LOGS_BLOCKS_CHUNK,
     EXCLUDED_EXCHANGES,
 )
-from analytics.uniswap.structs import RoiInfo, ExchangeInfo
-from analytics.utils import timeit, bytes_to_str
+from analytics.uniswap.batch_rpc import BatchRpc, EthCall, failed
+from analytics.uniswap.block_timestamps import TimestampCache, load_block_timestamps
+from analytics.uniswap.csv_output import (
+    save_files,
+    save_tokens,
+    ticker,
+    providers_csv,
+    roi_csv,
+    summary_csv,
+    volume_csv,
+    volume_totals,
+    write_if_changed,
+)
+from analytics.uniswap.event_decoder import EventDecoder
+from analytics.uniswap.event_store import COLUMNS, EVENTS_DIR
+from analytics.uniswap.exchange_stages import (
+    PROVIDERS,
+    ROI,
+    STAGES,
+    VOLUME,
+    Resume,
+    filter_volume,
+    process_exchange,
+    valuable_traders,
+)
+from analytics.uniswap.ingestion import (
+    Adapter,
+    Ingestion,
+    Job,
+    LogSource,
+    update_is_required,
+)
+from analytics.uniswap.log_fetcher import LogFetcher
+from analytics.uniswap.state_store import StateStore
+from analytics.uniswap.structs import (
+    RoiInfo,
+    RoiSeries,
+    ExchangeInfo,
+    VolumeMatrix,
+)
+from analytics.uniswap.token_metadata import (
+    STR,
+    TokenMetadataCache,
+    load_cached_token_metadata,
+)
+from analytics.utils import timeit
+
+rpc = BatchRpc(web3.provider.endpoint_uri)
+metadata_cache = TokenMetadataCache()
+timestamp_cache = TimestampCache()
+log_fetcher = LogFetcher(GRAPHQL_ENDPOINT, GRAPHQL_LOGS_QUERY)
+event_decoder = EventDecoder(UNISWAP_EXCHANGE_ABI)
+ingestion = Ingestion(log_fetcher)
+state_store = StateStore()
+
+# worker processes of the per-exchange stages, None for one per core
+WORKERS = None
+# worker processes rendering the per-ticker output files
+OUTPUT_WORKERS = 1
+
+# exact chart timestamps when None, otherwise only every n-th chart block is
+# loaded and the timestamps in between are interpolated
+TIMESTAMP_INTERPOLATION_STEP = None
 
 
 @timeit
@@ -59,10 +101,15 @@ def load_token_count() -> int:
 def load_tokens(token_count: int) -> List[str]:
     if not token_count:
         token_count = load_token_count()
-    tokens = [
-        uniswap_factory.functions.getTokenWithId(i).call()
-        for i in range(1, token_count + 1)
-    ]
+    tokens = rpc.eth_call(
+        [
+            EthCall(
+                uniswap_factory.address, "getTokenWithId(uint256)", [i], ["address"]
+            )
+            for i in range(1, token_count + 1)
+        ],
+        strict=True,
+    )
     logging.info("Found {} tokens".format(len(tokens)))
     return tokens
 
@@ -70,60 +117,69 @@ def load_tokens(token_count: int) -> List[str]:
 @timeit
 def load_exchanges(tokens: List[str]) -> List[str]:
     if not tokens:
-        tokens = load_tokens()
-    exchanges = [uniswap_factory.functions.getExchange(t).call() for t in tokens]
+        tokens = load_tokens(load_token_count())
+    exchanges = rpc.eth_call(
+        [
+            EthCall(uniswap_factory.address, "getExchange(address)", [t], ["address"])
+            for t in tokens
+        ],
+        strict=True,
+    )
     logging.info("Found {} exchanges".format(len(exchanges)))
     return exchanges
 
 
-def load_exchange_data_impl(token_address, exchange_address):
-    if exchange_address in EXCLUDED_EXCHANGES:
-        return None
+def load_exchange_data(
+    tokens: List[str], exchanges: List[str]
+) -> List[Optional[ExchangeInfo]]:
+    pairs = [(t, e) for (t, e) in zip(tokens, exchanges) if e not in EXCLUDED_EXCHANGES]
 
-    token = web3.eth.contract(abi=STR_ERC_20_ABI, address=token_address)
-    if token_address in HARDCODED_INFO:
-        token_name, token_symbol, token_decimals = HARDCODED_INFO[token_address]
-    else:
-        try:
-            token_name = token.functions.name().call()
-            token_symbol = token.functions.symbol().call()
-            token_decimals = token.functions.decimals().call()
-        except Exception:
-            try:
-                token = web3.eth.contract(
-                    abi=STR_CAPS_ERC_20_ABI, address=token_address
+    # metadata comes from the cache for every token seen by an earlier run,
+    # only the balances are loaded again at CURRENT_BLOCK
+    metadata = load_cached_token_metadata(
+        rpc, metadata_cache, [t for (t, _) in pairs if t not in HARDCODED_INFO]
+    )
+    for t, _ in pairs:
+        if t in HARDCODED_INFO:
+            metadata[t] = tuple(HARDCODED_INFO[t]) + (STR,)
+
+    token_balances = rpc.eth_call(
+        [
+            EthCall(t, "balanceOf(address)", [e], ["uint256"], CURRENT_BLOCK)
+            for (t, e) in pairs
+        ]
+    )
+    eth_balances = rpc.get_balances([e for (_, e) in pairs], CURRENT_BLOCK)
+
+    infos = []
+    for (token_address, exchange_address), token_balance, eth_balance in zip(
+        pairs, token_balances, eth_balances
+    ):
+        if metadata[token_address] is None:
+            infos.append(None)
+            continue
+        if failed(token_balance) or failed(eth_balance):
+            logging.error(
+                "FUCKED UP {}: {}".format(
+                    token_address,
+                    token_balance if failed(token_balance) else eth_balance,
                 )
-                token_name = token.functions.NAME().call()
-                token_symbol = token.functions.SYMBOL().call()
-                token_decimals = token.functions.DECIMALS().call()
-            except Exception:
-                try:
-                    token = web3.eth.contract(abi=ERC_20_ABI, address=token_address)
-                    token_name = bytes_to_str(token.functions.name().call())
-                    token_symbol = bytes_to_str(token.functions.symbol().call())
-                    token_decimals = token.functions.decimals().call()
-                except Exception:
-                    logging.exception("FUCKED UP {}".format(token_address))
-                    return None
-
-    try:
-        token_balance = token.functions.balanceOf(exchange_address).call(
-            block_identifier=CURRENT_BLOCK
+            )
+            infos.append(None)
+            continue
+        token_name, token_symbol, token_decimals, _ = metadata[token_address]
+        infos.append(
+            ExchangeInfo(
+                token_address,
+                token_name,
+                token_symbol.strip("\x00"),
+                token_decimals,
+                exchange_address,
+                eth_balance,
+                token_balance,
+            )
         )
-    except Exception:
-        logging.exception("FUCKED UP {}".format(token_address))
-        return None
-    token_symbol = token_symbol.strip("\x00")
-    eth_balance = web3.eth.getBalance(exchange_address, block_identifier=CURRENT_BLOCK)
-    return ExchangeInfo(
-        token_address,
-        token_name,
-        token_symbol,
-        token_decimals,
-        exchange_address,
-        eth_balance,
-        token_balance,
-    )
+    return infos
 
 
 @timeit
@@ -132,9 +188,7 @@ def load_exchange_infos(infos: List[ExchangeInfo]) -> List[ExchangeInfo]:
     tokens = load_tokens(token_count)
     exchanges = load_exchanges(tokens)
 
-    new_infos = filter(
-        None, [load_exchange_data_impl(t, e) for (t, e) in zip(tokens, exchanges)]
-    )
+    new_infos = filter(None, load_exchange_data(tokens, exchanges))
     if infos:
         known_tokens = dict((info.token_address, info) for info in infos)
         for new_info in new_infos:
@@ -168,305 +222,174 @@ def get_chart_range(start: int = HISTORY_BEGIN_BLOCK) -> Iterable[int]:
 
 @timeit
 def load_timestamps() -> List[int]:
-    return [web3.eth.getBlock(n)["timestamp"] for n in get_chart_range()]
-
-
-@timeit
-def get_logs(addresses: List[str], topics: List, start_block: int) -> Dict[str, List]:
-    @retry(stop_max_attempt_number=3, wait_fixed=1)
-    def get_chunk(start):
-        resp = requests.post(
-            GRAPHQL_ENDPOINT,
-            json={
-                "query": GRAPHQL_LOGS_QUERY.format(
-                    fromBlock=start,
-                    toBlock=min(start + LOGS_BLOCKS_CHUNK - 1, CURRENT_BLOCK),
-                    addresses=json.dumps(addresses),
-                    topics=json.dumps(topics),
-                )
-            },
-        )
-        return postprocess_graphql_response(resp.json()["data"]["logs"])
-
-    _addresses = addresses
-    len_addresses = len(addresses)
-    len_part = len_addresses // 10
-    log_chunks = []
-    for i in range(0, len_addresses, len_part):
-        addresses = _addresses[i : i + len_part]
-        log_chunks += pool.map(
-            get_chunk, range(start_block, CURRENT_BLOCK + 1, LOGS_BLOCKS_CHUNK)
-        )
-    logs = [log for chunk in log_chunks for log in chunk]
-    logs.sort(key=lambda l: (l["address"], l["blockNumber"]))
-    return dict((k, list(g)) for k, g in groupby(logs, itemgetter("address")))
+    return load_block_timestamps(
+        rpc, timestamp_cache, get_chart_range(), TIMESTAMP_INTERPOLATION_STEP
+    )
 
 
-def postprocess_graphql_response(logs: List[dict]) -> List[dict]:
-    return [
-        {
-            "topics": [HexBytes(t) for t in log["topics"]],
-            "blockNumber": int(log["transaction"]["block"]["number"], 16),
-            "data": log["data"],
-            "logIndex": log["index"],
-            "transactionIndex": None,
-            "transactionHash": None,
-            "address": to_checksum_address(log["account"]["address"]),
-            "blockHash": None,
-        }
-        for log in logs
-    ]
+def store_events(
+    info: ExchangeInfo, logs: List[dict], first_block: int, last_block: int
+):
+    ingestion.store_events(adapter, info, logs, first_block, last_block)
 
 
-@timeit
-def load_logs(start_block: int, infos: List[ExchangeInfo]) -> List[ExchangeInfo]:
-    exchange_addresses = [info.exchange_address for info in infos]
-    token_addresses = [info.token_address for info in infos]
-    exchange_logs = get_logs(exchange_addresses, [ALL_EVENTS], start_block)
-    exchange_addresses_topics = [
-        "0x000000000000000000000000" + addr[2:] for addr in exchange_addresses
-    ]
-    token_logs = get_logs(
-        token_addresses, [[EVENT_TRANSFER], [], exchange_addresses_topics], start_block
-    )
+def migrate_logs(infos: List[ExchangeInfo], last_block: int):
+    # state saved before the event store kept raw logs in ExchangeInfo.logs
     for info in infos:
-        new_exchange_logs = exchange_logs.get(info.exchange_address)
-        if new_exchange_logs:
-            info.logs += new_exchange_logs
-        new_token_logs = token_logs.get(info.token_address)
-        if new_token_logs:
-            info.logs.extend(
-                filter(transfers_to_address_only(info.exchange_address), new_token_logs)
-            )
-        info.logs.sort(key=lambda l: (l["blockNumber"], l["logIndex"]))
-
-    logging.info("Loaded transfer logs for {} exchanges".format(len(infos)))
-    return infos
+        logs = getattr(info, "logs", None)
+        if logs is not None:
+            del info.logs
+        if logs:
+            store_events(info, logs, HISTORY_BEGIN_BLOCK, last_block)
 
 
 def transfers_to_address_only(address: str):
+    suffix = address[2:].lower()
+
     def foo(log):
-        topic_to = log["topics"][2].hex()
-        return address == to_checksum_address(topic_to[:2] + topic_to[26:])
+        return log["topics"][2][-40:].lower() == suffix
 
     return foo
 
 
-@timeit
-def populate_providers(infos: List[ExchangeInfo]) -> List[ExchangeInfo]:
-    for info in infos:
-        exchange = web3.eth.contract(
-            abi=UNISWAP_EXCHANGE_ABI, address=info.exchange_address
+def resume_point(info: ExchangeInfo) -> Optional[Resume]:
+    processed_block = info.processed_block
+    if processed_block is None:
+        return None
+    last = info.roi[-1] if info.roi else RoiInfo(1.0, 0, 0, 0)
+    return Resume(
+        processed_block,
+        info.providers,
+        len(info.roi),
+        last.eth_balance,
+        last.token_balance,
+        len(info.trade_volume),
+        info.total_trade_volume,
+    )
+
+
+def apply_results(info: ExchangeInfo, result: Dict):
+    if PROVIDERS in result:
+        info.providers = result[PROVIDERS]
+        info.processed_block = CURRENT_BLOCK
+    if ROI in result:
+        start, series = result[ROI]
+        dm_change, eth_balance, token_balance, trade_volume, failed_chunk = series
+        info.roi = info.roi[:start] + RoiSeries.from_columns(
+            dm_change=dm_change,
+            eth_balance=eth_balance,
+            token_balance=token_balance,
+            trade_volume=trade_volume,
         )
-        info.providers = defaultdict(int)
-        for log in info.logs:
-            if (
-                log["topics"][0].hex() != EVENT_TRANSFER
-                or log["address"] != info.exchange_address
-            ):
-                continue
-            event = get_event_data(
-                web3.codec, exchange.events.Transfer._get_event_abi(), log
+        if failed_chunk is not None:
+            logging.error(
+                "FUCKED UP {} {}: trade against an empty reserve at chunk {}".format(
+                    info.token_symbol, info.token_address, start + failed_chunk
+                )
             )
-            if event["args"]["from"] == "0x0000000000000000000000000000000000000000":
-                info.providers[event["args"]["to"]] += event["args"]["value"]
-            elif event["args"]["to"] == "0x0000000000000000000000000000000000000000":
-                info.providers[event["args"]["from"]] -= event["args"]["value"]
-            else:
-                info.providers[event["args"]["from"]] -= event["args"]["value"]
-                info.providers[event["args"]["to"]] += event["args"]["value"]
-    logging.info("Loaded info about providers of {} exchanges".format(len(infos)))
-    return infos
+    if VOLUME in result:
+        start, (volumes, total_trade_volume) = result[VOLUME]
+        info.trade_volume = info.trade_volume[:start] + VolumeMatrix.from_dicts(volumes)
+        info.total_trade_volume = total_trade_volume
+        valuable = valuable_traders(total_trade_volume)
+        if start > 0 and valuable == set(info.valuable_traders):
+            info.volume = info.volume[:start] + VolumeMatrix.from_dicts(
+                filter_volume(volumes, valuable)
+            )
+        else:
+            info.volume = VolumeMatrix.from_dicts(
+                filter_volume(info.trade_volume, valuable)
+            )
+            info.valuable_traders = list(valuable)
 
 
-def skip_transfer(info: ExchangeInfo, log: dict, i: int) -> bool:
-    if i == len(info.logs):
-        # last log is legit
-        return False
+def token_transfer_topics(infos: List[ExchangeInfo]) -> List:
+    # token transfers to the exchanges only
+    return [
+        [EVENT_TRANSFER],
+        [],
+        ["0x000000000000000000000000" + info.exchange_address[2:] for info in infos],
+    ]
 
-    next_log = info.logs[i]
-    if next_log["blockNumber"] > log["blockNumber"]:
-        # if next log from another block this log is legit
-        return False
 
-    if next_log["topics"][0].hex() in {EVENT_ETH_PURCHASE, EVENT_ADD_LIQUIDITY}:
-        # if next log is ETH_PURCHASE or ADD_LIQUIDITY then this log is its part
-        return True
+class UniswapAdapter(Adapter):
+    name = "uniswap"
+    events_dir = EVENTS_DIR
+    columns = COLUMNS
+    sources = [
+        LogSource(
+            "exchanges", lambda info: info.exchange_address, lambda _: [ALL_EVENTS]
+        ),
+        LogSource(
+            "tokens",
+            lambda info: info.token_address,
+            token_transfer_topics,
+            lambda info: transfers_to_address_only(info.exchange_address),
+        ),
+    ]
+    stages = STAGES
+    reduce = staticmethod(process_exchange)
 
-    if i + 1 == len(info.logs):
-        # if only two logs left, it is legit
-        return False
+    def discover(self, infos: List[ExchangeInfo]) -> List[ExchangeInfo]:
+        infos = sorted(
+            load_exchange_infos(infos), key=lambda x: x.eth_balance, reverse=True
+        )
+        return remove_bad_exchanges(infos)
 
-    next_next_log = info.logs[i + 1]
-    if next_next_log["blockNumber"] > log["blockNumber"]:
-        # if next next log is from another block then this log is legit
-        return False
+    def key(self, info: ExchangeInfo) -> str:
+        return info.exchange_address
 
-    if (
-        next_log["topics"][0].hex() == EVENT_TRANSFER
-        and next_log["address"] == info.exchange_address
-        and next_next_log["topics"][0].hex() == EVENT_ETH_PURCHASE
-    ):
-        return True
+    def decode(self, info: ExchangeInfo, logs: List[dict]) -> Dict:
+        return event_decoder.decode(logs, info.exchange_address)
 
-    return False
+    def task(self, info: ExchangeInfo) -> tuple:
+        # exchanges populated by an earlier run only process the new events
+        # and chart chunks, starting from the state saved with them
+        return info.exchange_address, resume_point(info)
+
+    def apply(self, info: ExchangeInfo, result: Dict):
+        apply_results(info, result)
+
+
+adapter = UniswapAdapter()
+
+
+def run_stages(
+    infos: List[ExchangeInfo], stages: Sequence[str], workers: Optional[int] = WORKERS
+) -> List[ExchangeInfo]:
+    ingestion.reduce([(adapter, infos)], get_chart_range(), workers, stages)
+    return infos
 
 
 @timeit
-def populate_roi(infos: List[ExchangeInfo]) -> List[ExchangeInfo]:
-    for info in infos:
-        try:
-            info.roi = list()
-            info.history = list()
-            exchange = web3.eth.contract(
-                abi=UNISWAP_EXCHANGE_ABI, address=info.exchange_address
-            )
-            i = 0
-            eth_balance, token_balance = 0, 0
-            for block_number in get_chart_range():
-                dm_numerator, dm_denominator, trade_volume = 1, 1, 0
-                while (
-                    i < len(info.logs) and info.logs[i]["blockNumber"] <= block_number
-                ):
-                    log = info.logs[i]
-                    topic = log["topics"][0].hex()
-                    i += 1
-                    if topic == EVENT_TRANSFER:
-                        if log["address"] == info.exchange_address:
-                            # skip liquidity token transfers
-                            continue
-                        elif skip_transfer(info, log, i):
-                            continue
-                        else:
-                            event = get_event_data(
-                                web3.codec,
-                                exchange.events.Transfer._get_event_abi(),
-                                log,
-                            )
-                            if event["args"]["to"] != info.exchange_address:
-                                continue
-                            if token_balance > 0:
-                                dm_numerator *= token_balance + event["args"]["value"]
-                                dm_denominator *= token_balance
-                            token_balance += event["args"]["value"]
-                    elif topic == EVENT_ADD_LIQUIDITY:
-                        event = get_event_data(
-                            web3.codec,
-                            exchange.events.AddLiquidity._get_event_abi(),
-                            log,
-                        )
-                        eth_balance += event["args"]["eth_amount"]
-                        token_balance += event["args"]["token_amount"]
-                    elif topic == EVENT_REMOVE_LIQUIDITY:
-                        event = get_event_data(
-                            web3.codec,
-                            exchange.events.RemoveLiquidity._get_event_abi(),
-                            log,
-                        )
-                        eth_balance -= event["args"]["eth_amount"]
-                        token_balance -= event["args"]["token_amount"]
-                    elif topic == EVENT_ETH_PURCHASE:
-                        event = get_event_data(
-                            web3.codec,
-                            exchange.events.EthPurchase._get_event_abi(),
-                            log,
-                        )
-                        eth_new_balance = eth_balance - event["args"]["eth_bought"]
-                        token_new_balance = token_balance + event["args"]["tokens_sold"]
-                        dm_numerator *= eth_new_balance * token_new_balance
-                        dm_denominator *= eth_balance * token_balance
-                        trade_volume += event["args"]["eth_bought"] / 0.997
-                        eth_balance = eth_new_balance
-                        token_balance = token_new_balance
-                    else:
-                        event = get_event_data(
-                            web3.codec,
-                            exchange.events.TokenPurchase._get_event_abi(),
-                            log,
-                        )
-                        eth_new_balance = eth_balance + event["args"]["eth_sold"]
-                        token_new_balance = (
-                            token_balance - event["args"]["tokens_bought"]
-                        )
-                        dm_numerator *= eth_new_balance * token_new_balance
-                        dm_denominator *= eth_balance * token_balance
-                        trade_volume += event["args"]["eth_sold"]
-                        eth_balance = eth_new_balance
-                        token_balance = token_new_balance
-
-                info.roi.append(
-                    RoiInfo(
-                        sqrt(dm_numerator / dm_denominator),
-                        eth_balance,
-                        token_balance,
-                        trade_volume,
-                    )
-                )
-                info.history.append(eth_balance)
-        except Exception:
-            logging.exception(
-                "FUCKED UP {} {}".format(info.token_symbol, info.token_address)
-            )
+def populate_providers(infos: List[ExchangeInfo]) -> List[ExchangeInfo]:
+    run_stages(infos, [PROVIDERS])
+    logging.info("Loaded info about providers of {} exchanges".format(len(infos)))
+    return infos
+
 
+@timeit
+def populate_roi(infos: List[ExchangeInfo]) -> List[ExchangeInfo]:
+    run_stages(infos, [ROI])
     logging.info("Loaded info about roi of {} exchanges".format(len(infos)))
     return infos
 
 
 @timeit
 def populate_volume(infos: List[ExchangeInfo]) -> List[ExchangeInfo]:
-    for info in infos:
-        volume = list()
-        info.volume = list()
-        exchange = web3.eth.contract(
-            abi=UNISWAP_EXCHANGE_ABI, address=info.exchange_address
-        )
-        i = 0
-        total_trade_volume = defaultdict(int)
-        for block_number in get_chart_range():
-            trade_volume = defaultdict(int)
-            while i < len(info.logs) and info.logs[i]["blockNumber"] < block_number:
-                log = info.logs[i]
-                i += 1
-                topic = log["topics"][0].hex()
-                if topic == EVENT_ETH_PURCHASE:
-                    event = get_event_data(
-                        web3.codec, exchange.events.EthPurchase._get_event_abi(), log
-                    )
-                    trade_volume[event["args"]["buyer"]] += (
-                        event["args"]["eth_bought"] / 0.997
-                    )
-                    total_trade_volume[event["args"]["buyer"]] += (
-                        event["args"]["eth_bought"] / 0.997
-                    )
-                elif topic == EVENT_TOKEN_PURCHASE:
-                    event = get_event_data(
-                        web3.codec, exchange.events.TokenPurchase._get_event_abi(), log
-                    )
-                    trade_volume[event["args"]["buyer"]] += event["args"]["eth_sold"]
-                    total_trade_volume[event["args"]["buyer"]] += event["args"][
-                        "eth_sold"
-                    ]
-
-            volume.append(trade_volume)
-
-        total_volume = sum(total_trade_volume.values())
-        valuable_traders = {
-            t for (t, v) in total_trade_volume.items() if v > total_volume / 1000
-        }
-        info.valuable_traders = list(valuable_traders)
-        for vol in volume:
-            filtered_vol = defaultdict(int)
-            for (t, v) in vol.items():
-                if t in valuable_traders:
-                    filtered_vol[t] = v
-                else:
-                    filtered_vol["Other"] += v
-            info.volume.append(filtered_vol)
-
+    run_stages(infos, [VOLUME])
     logging.info("Volumes of {} exchanges populated".format(len(infos)))
     return infos
 
 
+@timeit
+def populate(infos: List[ExchangeInfo]) -> List[ExchangeInfo]:
+    # all stages in one pass, so every exchange is read once
+    run_stages(infos, STAGES)
+    logging.info("Populated {} exchanges".format(len(infos)))
+    return infos
+
+
 def is_valuable(info: ExchangeInfo) -> bool:
     return info.eth_balance >= 100 * ETH
 
@@ -475,22 +398,6 @@ def is_empty(info: ExchangeInfo) -> bool:
     return info.eth_balance <= ETH
 
 
-def save_tokens(infos: List[ExchangeInfo], path: str):
-    with open(path, "w") as out_f:
-        json.dump(
-            {
-                "results": [
-                    {
-                        "id": re.sub("[\\s/]", "", info.token_symbol.lower()),
-                        "text": info.token_symbol,
-                    }
-                    for info in infos
-                ]
-            },
-            out_f,
-        )
-
-
 def save_liquidity_data(infos: List[ExchangeInfo], timestamps: List[int]):
     if not timestamps:
         timestamps = load_timestamps()
@@ -498,103 +405,58 @@ def save_liquidity_data(infos: List[ExchangeInfo], timestamps: List[int]):
     valuable_infos = [info for info in infos if is_valuable(info)]
     other_infos = [info for info in infos if not is_valuable(info)]
 
-    with open(LIQUIDITY_DATA, "w") as out_f:
-        out_f.write(
-            ",".join(
-                ["timestamp"] + [i.token_symbol for i in valuable_infos] + ["Other\n"]
-            )
-        )
-        for j in range(len(timestamps)):
-            out_f.write(
-                ",".join(
-                    [str(timestamps[j] * 1000)]
-                    + ["{:.2f}".format(i.history[j] / ETH) for i in valuable_infos]
-                    + ["{:.2f}".format(sum(i.history[j] for i in other_infos) / ETH)]
-                )
-                + "\n"
-            )
+    write_if_changed(
+        LIQUIDITY_DATA,
+        summary_csv(
+            timestamps,
+            [i.token_symbol for i in valuable_infos],
+            [i.history for i in valuable_infos],
+            [i.history for i in other_infos],
+        ),
+    )
 
 
-def save_providers_data(infos: List[ExchangeInfo]):
-    for info in infos:
-        ticker_name = re.sub("[\\s/]", "", info.token_symbol.lower())
-        with open(PROVIDERS_DATA.format(ticker_name), "w") as out_f:
-            out_f.write("provider,eth\n")
-            total_supply = sum(info.providers.values())
-            remaining_supply = total_supply
-            for p, v in sorted(
-                info.providers.items(), key=lambda x: x[1], reverse=True
-            ):
-                s = v / total_supply
-                if s >= 0.01:
-                    out_f.write(
-                        "\u200b{},{:.2f}\n".format(p, info.eth_balance * s / ETH)
-                    )
-                    remaining_supply -= v
-            if remaining_supply > 0:
-                out_f.write(
-                    "Other,{:.2f}\n".format(
-                        info.eth_balance * remaining_supply / total_supply / ETH
-                    )
-                )
+def save_providers_data(
+    infos: List[ExchangeInfo], workers: Optional[int] = OUTPUT_WORKERS
+):
+    save_files(
+        [PROVIDERS_DATA.format(ticker(info)) for info in infos],
+        providers_csv,
+        [(info.providers, info.eth_balance) for info in infos],
+        workers,
+    )
 
 
-def save_roi_data(infos: List[ExchangeInfo], timestamps: List[int]):
+def save_roi_data(
+    infos: List[ExchangeInfo],
+    timestamps: List[int],
+    workers: Optional[int] = OUTPUT_WORKERS,
+):
     if not timestamps:
         timestamps = load_timestamps()
 
-    for info in infos:
-        ticker_name = re.sub("[\\s/]", "", info.token_symbol.lower())
-        with open(ROI_DATA.format(ticker_name), "w") as out_f:
-            out_f.write("timestamp,ROI,Token Price,Trade Volume\n")
-            for j in range(len(timestamps)):
-                if info.roi[j].eth_balance == 0:
-                    continue
-                out_f.write(
-                    ",".join(
-                        [
-                            str(timestamps[j] * 1000),
-                            "{}".format(info.roi[j].dm_change),
-                            "{}".format(
-                                info.roi[j].token_balance / info.roi[j].eth_balance
-                            ),
-                            "{:.2f}".format(info.roi[j].trade_volume / ETH),
-                        ]
-                    )
-                    + "\n"
-                )
+    save_files(
+        [ROI_DATA.format(ticker(info)) for info in infos],
+        roi_csv,
+        [(timestamps, info.roi) for info in infos],
+        workers,
+    )
 
 
-def save_volume_data(infos: List[ExchangeInfo], timestamps: List[int]):
+def save_volume_data(
+    infos: List[ExchangeInfo],
+    timestamps: List[int],
+    workers: Optional[int] = OUTPUT_WORKERS,
+):
     if not timestamps:
         timestamps = load_timestamps()
 
-    for info in infos:
-        ticker_name = re.sub("[\\s/]", "", info.token_symbol.lower())
-        with open(VOLUME_DATA.format(ticker_name), "w") as out_f:
-            out_f.write(
-                ",".join(
-                    ["timestamp"]
-                    + ["\u200b{}".format(t) for t in info.valuable_traders]
-                    + ["Other"]
-                )
-                + "\n"
-            )
-            for j in range(len(timestamps)):
-                if sum(info.volume[j].values()) == 0:
-                    continue
-                out_f.write(
-                    ",".join(
-                        [str(timestamps[j] * 1000)]
-                        + [
-                            "{:.2f}".format(info.volume[j][t] / ETH)
-                            if info.volume[j][t]
-                            else ""
-                            for t in info.valuable_traders + ["Other"]
-                        ]
-                    )
-                    + "\n"
-                )
+    save_files(
+        [VOLUME_DATA.format(ticker(info)) for info in infos],
+        volume_csv,
+        [(timestamps, info.valuable_traders, info.volume) for info in infos],
+        workers,
+    )
 
 
 def save_total_volume_data(infos: List[ExchangeInfo], timestamps: List[int]):
@@ -604,33 +466,15 @@ def save_total_volume_data(infos: List[ExchangeInfo], timestamps: List[int]):
     valuable_infos = [info for info in infos if is_valuable(info)]
     other_infos = [info for info in infos if not is_valuable(info)]
 
-    with open(TOTAL_VOLUME_DATA, "w") as out_f:
-        out_f.write(
-            ",".join(
-                ["timestamp"] + [i.token_symbol for i in valuable_infos] + ["Other\n"]
-            )
-        )
-        for j in range(len(timestamps)):
-            out_f.write(
-                ",".join(
-                    [str(timestamps[j] * 1000)]
-                    + [
-                        "{:.2f}".format(sum(i.volume[j].values()) / ETH)
-                        for i in valuable_infos
-                    ]
-                    + [
-                        "{:.2f}".format(
-                            sum(sum(i.volume[j].values()) for i in other_infos) / ETH
-                        )
-                    ]
-                )
-                + "\n"
-            )
-
-
-def save_raw_data(infos: List[ExchangeInfo]):
-    with open(INFOS_DUMP, "wb") as out_f:
-        pickle.dump(infos, out_f)
+    write_if_changed(
+        TOTAL_VOLUME_DATA,
+        summary_csv(
+            timestamps,
+            [i.token_symbol for i in valuable_infos],
+            [volume_totals(i.volume) for i in valuable_infos],
+            [volume_totals(i.volume) for i in other_infos],
+        ),
+    )
 
 
 def load_raw_data() -> List[ExchangeInfo]:
@@ -638,60 +482,53 @@ def load_raw_data() -> List[ExchangeInfo]:
         return pickle.load(in_f)
 
 
-def save_last_block(block_number: int):
-    with open(LAST_BLOCK_DUMP, "wb") as out_f:
-        pickle.dump(block_number, out_f)
-
-
 def load_last_block() -> int:
     with open(LAST_BLOCK_DUMP, "rb") as in_f:
         return pickle.load(in_f)
 
 
-def update_is_required(last_processed_block: int) -> bool:
-    return (
-        (CURRENT_BLOCK - HISTORY_BEGIN_BLOCK) // HISTORY_CHUNK_SIZE * HISTORY_CHUNK_SIZE
-        + HISTORY_BEGIN_BLOCK
-        > last_processed_block
-    )
+def migrate_pickles():
+    # state saved by versions that pickled it is moved into the state store
+    if state_store.last_block() is None and os.path.exists(LAST_BLOCK_DUMP):
+        saved_block = load_last_block()
+        infos = load_raw_data()
+        migrate_logs(infos, saved_block)
+        state_store.save(infos, saved_block)
 
 
 def main():
     logging.basicConfig(level=logging.INFO, format="%(message)s")
 
-    if os.path.exists(LAST_BLOCK_DUMP):
-        saved_block = load_last_block()
-        infos = load_raw_data()
-        if update_is_required(saved_block):
+    migrate_pickles()
+    saved_block = state_store.last_block()
+    if saved_block is not None:
+        if update_is_required(
+            saved_block, HISTORY_BEGIN_BLOCK, CURRENT_BLOCK, HISTORY_CHUNK_SIZE
+        ):
             logging.info(
                 "Last seen block: {}, current block: {}, loading data for {} blocks...".format(
                     saved_block, CURRENT_BLOCK, CURRENT_BLOCK - saved_block
                 )
             )
-            infos = sorted(
-                load_exchange_infos(infos), key=lambda x: x.eth_balance, reverse=True
-            )
-            remove_bad_exchanges(infos)
-            load_logs(saved_block + 1, infos)
-            populate_providers(infos)
-            populate_roi(infos)
-            populate_volume(infos)
-            save_last_block(CURRENT_BLOCK)
-            save_raw_data(infos)
+            infos = adapter.discover(state_store.load())
+            jobs = [Job(adapter, infos, saved_block + 1)]
+            ingestion.ingest(jobs, CURRENT_BLOCK)
+            populate(infos)
+            state_store.save(infos, CURRENT_BLOCK)
+            ingestion.clear(jobs)
+            ingestion.compact(jobs, CURRENT_BLOCK)
         else:
             logging.info("Loaded data is up to date")
+            infos = state_store.load(resume=False)
     else:
         logging.info("Starting from scratch...")
-        infos = sorted(
-            load_exchange_infos([]), key=lambda x: x.eth_balance, reverse=True
-        )
-        remove_bad_exchanges(infos)
-        load_logs(HISTORY_BEGIN_BLOCK, infos)
-        populate_providers(infos)
-        populate_roi(infos)
-        populate_volume(infos)
-        save_last_block(CURRENT_BLOCK)
-        save_raw_data(infos)
+        infos = adapter.discover([])
+        jobs = [Job(adapter, infos, HISTORY_BEGIN_BLOCK)]
+        ingestion.ingest(jobs, CURRENT_BLOCK)
+        populate(infos)
+        state_store.save(infos, CURRENT_BLOCK)
+        ingestion.clear(jobs)
+        ingestion.compact(jobs, CURRENT_BLOCK)
 
     not_empty_infos = [info for info in infos if not is_empty(info)]
     timestamps = load_timestamps()
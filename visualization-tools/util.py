@@ -1,14 +1,19 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 """Utility methods for plot generations."""
+
 import sys
 import logging
 import json
 from typing import List, Dict, Tuple, Union
 from collections import OrderedDict
 from decimal import Decimal, ROUND_UP
+from functools import cmp_to_key
+
+import numpy as np
 
 from TokenInfo import TOKENS
+from order_table import OrderTable, as_table, group, int_column, to_int
 
 EDGE_TYPE = Tuple[str, str]
 NODE_TYPE = str
@@ -58,114 +63,170 @@ def decimal_to_str(v: Decimal, prec=FLOAT_PREC):
     return str(v.quantize(FLOAT_PREC))
 
 
-def _order_data_to_decimal(orders: List[Dict]) -> List[Dict]:
-    """Convert order data from string to Decimal."""
-    for i in range(len(orders)):
-        for key in ["sellAmount", "buyAmount", "execSellAmount", "execBuyAmount"]:
-            orders[i][key] = Decimal(orders[i].get(key, "0"))
+def _compare_xrates(a: Tuple[int, int], b: Tuple[int, int]) -> int:
+    """Compare the limit prices sell/buy of two orders exactly."""
+    (sell_a, buy_a), (sell_b, buy_b) = a, b
+    if buy_a == 0 or buy_b == 0:
+        # A buy amount of zero is an infinite limit price.
+        return (buy_a == 0) - (buy_b == 0)
+    return (sell_a * buy_b > sell_b * buy_a) - (sell_a * buy_b < sell_b * buy_a)
+
+
+def _sort_by_xrate(sell_amounts: np.ndarray, buy_amounts: np.ndarray) -> np.ndarray:
+    """Order indices sorted by limit price [best-to-worst], stable.
+
+    Orders are sorted by their float limit price first. Runs of prices too
+    close to be told apart as floats are then sorted by their exact prices.
+    """
+    sell_floats = sell_amounts.astype(np.float64)
+    buy_floats = buy_amounts.astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        xrates = np.where(buy_floats > 0, sell_floats / buy_floats, np.inf)
+        ordered = np.argsort(-xrates, kind="stable")
+
+        # Float prices are a few ulps off at most.
+        xrates = xrates[ordered]
+        close = (xrates[:-1] == xrates[1:]) | (
+            xrates[:-1] - xrates[1:] <= 1e-12 * xrates[:-1]
+        )
+    close = close.astype(np.int8)
+    run_starts = np.flatnonzero(np.diff(close, prepend=0) == 1)
+    run_ends = np.flatnonzero(np.diff(close, append=0) == -1) + 2
+
+    def _better_first(i, j):
+        return _compare_xrates(
+            (sell_amounts[j], buy_amounts[j]), (sell_amounts[i], buy_amounts[i])
+        )
+
+    for lo, hi in zip(run_starts.tolist(), run_ends.tolist()):
+        run = sorted(ordered[lo:hi].tolist())
+        ordered[lo:hi] = sorted(run, key=cmp_to_key(_better_first))
+    return ordered
+
 
-    return orders
+def _update_buy_amount_from_new_sell_amount(
+    buy_amount_old: int, sell_amount_new: int, sell_amount_old: int
+) -> int:
+    """Reduce buy amount to correspond to new sell amount."""
+    buy_amount_new = (
+        Decimal(buy_amount_old) * Decimal(sell_amount_new) / Decimal(sell_amount_old)
+    )
+    return int(buy_amount_new.to_integral_value(rounding=ROUND_UP))
+
+
+def _log_capping(
+    orders: OrderTable, sell_amounts_new: np.ndarray, buy_amounts_new: np.ndarray
+):
+    """Log the capping of every order, in the order orders were capped."""
+    order_ids = orders.ids("orderID") if "orderID" in orders.columns else None
+    for i, (aID, tS, tB, sell_old, buy_old, sell_new, buy_new) in enumerate(
+        zip(
+            orders.ids("accountID"),
+            orders.ids("sellToken"),
+            orders.ids("buyToken"),
+            orders.ids("sellAmount"),
+            orders.ids("buyAmount"),
+            sell_amounts_new.tolist(),
+            buy_amounts_new.tolist(),
+        )
+    ):
+        oID = "%s|%s" % (aID, order_ids[i] if order_ids else None)
+        logging.debug(
+            "Capping sell amount of <%s> by account balance [%s] : %40d --> %25d"
+            % (oID, tS, sell_old, sell_new)
+        )
+        if sell_new == 0:
+            logging.debug(
+                "Removing order <%s> : zero sell amount or available balance!" % oID
+            )
+        else:
+            logging.debug(
+                "Updated buy amount of <%s> : %40d --> %25d  [%s]"
+                % (oID, buy_old, buy_new, tB)
+            )
 
 
 def restrict_order_sell_amounts_by_balances(
-    orders: List[Dict], accounts: Dict[str, Dict[str, int]]
-) -> List[Dict]:
+    orders: Union[OrderTable, List[Dict]], accounts: Dict[str, Dict[str, int]]
+) -> OrderTable:
     """Restrict order sell amounts to available account balances.
 
     This method also filters out orders that end up with a sell amount of zero.
 
     Args:
-        orders: List of orders.
+        orders: Table or list of orders.
         accounts: Dict of accounts and their token balances.
 
     Returns:
-        The capped orders.
+        The capped orders, as a new table.
 
     """
+    orders = as_table(orders)
+    if len(orders) == 0:
+        return orders
 
-    def _xrate(sell_amount, buy_amount):
-        return (
-            Decimal(sell_amount) / Decimal(buy_amount)
-            if Decimal(buy_amount) > 0
-            else Decimal("infinity")
-        )
-
-    def _cap_sell_amount_by_balance(sell_amount_old, balance):
-        """Cap sell amount by account balance."""
-        return min(sell_amount_old, remaining_balances[aID, tS, tB])
-
-    def _update_buy_amount_from_new_sell_amount(
-        buy_amount_old, sell_amount_new, sell_amount_old
-    ):
-        """Reduce buy amount to correspond to new sell amount."""
-        buy_amount_new = buy_amount_old * sell_amount_new / sell_amount_old
-        return buy_amount_new.to_integral_value(rounding=ROUND_UP)
-
-    orders_capped = []
-
-    # Init dict for remaining balance per account and token pair.
-    remaining_balances = {}
-
-    # Iterate over orders sorted by their limit price [best-to-worst].
+    # Sort orders by their limit price [best-to-worst].
     # Potential side-effect:
     # This may in certain cases interfere with the max-nr-exec-orders or the
     # min-avg-fee-per-order (economic viability) constraint, where a larger order
     # with a worse price might be preferred over a smaller order with a better price.
-    for o in sorted(
-        orders, key=lambda o: _xrate(o["sellAmount"], o["buyAmount"]), reverse=True
-    ):
-        tS, tB = o["sellToken"], o["buyToken"]
-
-        # Get sell amount (capped by available account balance).
-        sell_amount_old = Decimal(o["sellAmount"])
-
-        # Init remaining balance for new token pair on some account.
-        aID = o["accountID"]
-        oID = "%s|%s" % (aID, o.get("orderID"))
-        if (aID, tS, tB) not in remaining_balances:
-            sell_token_balance = Decimal(accounts.get(aID, {}).get(tS, 0))
-            remaining_balances[(aID, tS, tB)] = sell_token_balance
-
-        sell_amount_new = _cap_sell_amount_by_balance(
-            sell_amount_old, remaining_balances[aID, tS, tB]
-        )
-
-        # Update remaining balance.
-        remaining_balances[aID, tS, tB] -= sell_amount_new
-        assert remaining_balances[aID, tS, tB] >= 0
-
-        logging.debug(
-            "Capping sell amount of <%s> by account balance [%s] : %40d --> %25d"
-            % (oID, tS, sell_amount_old, sell_amount_new)
-        )
-
-        # Skip orders with zero sell amount.
-        if sell_amount_new == 0:
-            logging.debug(
-                "Removing order <%s> : zero sell amount or available balance!" % oID
+    orders = orders[
+        _sort_by_xrate(orders.column("sellAmount"), orders.column("buyAmount"))
+    ]
+    sell_amounts_old = orders.column("sellAmount")
+
+    # Group orders by account and token pair, keeping them sorted by price.
+    keys = [orders.column(name) for name in ["accountID", "sellToken", "buyToken"]]
+    key = np.ravel_multi_index(keys, [int(k.max()) + 1 for k in keys])
+    rows = np.argsort(key, kind="stable")
+    starts = np.flatnonzero(np.diff(key[rows], prepend=-1))
+    sizes = np.diff(np.append(starts, len(rows)))
+
+    # Available balance of every group's sell token.
+    balances = int_column(
+        [
+            to_int(accounts.get(orders.accounts[aID], {}).get(orders.tokens[tS], 0))
+            for aID, tS in zip(
+                keys[0][rows[starts]].tolist(), keys[1][rows[starts]].tolist()
             )
-            continue
-        else:
-            assert sell_amount_old > 0
-
-        # Update buy amount according to capped sell amount.
-        buy_amount_old = Decimal(o["buyAmount"])
-        buy_amount_new = _update_buy_amount_from_new_sell_amount(
-            buy_amount_old, sell_amount_new, sell_amount_old
-        )
-
-        logging.debug(
-            "Updated buy amount of <%s> : %40d --> %25d  [%s]"
-            % (oID, buy_amount_old, buy_amount_new, tB)
-        )
+        ]
+    )
 
-        o["sellAmount"] = str(sell_amount_new)
-        o["buyAmount"] = str(buy_amount_new)
+    # Orders of a group take their sell amount from the remaining balance in
+    # turn, so the amount sold up to an order is the sum of the sell amounts
+    # up to it, capped by the balance.
+    sold = np.cumsum(sell_amounts_old[rows])
+    sold -= np.repeat(np.append(0, sold[starts[1:] - 1]), sizes)
+    sold = np.minimum(sold, np.repeat(balances, sizes))
+    sold_before = np.append(0, sold[:-1])
+    sold_before[starts] = 0
+    sell_amounts_new = int_column([0] * len(orders))
+    sell_amounts_new[rows] = sold - sold_before
+
+    # Update buy amounts according to capped sell amounts.
+    buy_amounts_new = int_column(
+        [
+            (
+                _update_buy_amount_from_new_sell_amount(buy, sell_new, sell_old)
+                if sell_new != 0
+                else 0
+            )
+            for buy, sell_new, sell_old in zip(
+                orders.ids("buyAmount"),
+                sell_amounts_new.tolist(),
+                sell_amounts_old.tolist(),
+            )
+        ]
+    )
 
-        # Append capped order.
-        orders_capped.append(o)
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        _log_capping(orders, sell_amounts_new, buy_amounts_new)
 
-    return orders_capped
+    # Skip orders with zero sell amount.
+    capped = sell_amounts_new != 0
+    return orders[capped].replace(
+        sellAmount=sell_amounts_new[capped], buyAmount=buy_amounts_new[capped]
+    )
 
 
 def read_instance_from_file(instance_file: str) -> Dict:
@@ -187,9 +248,6 @@ def read_instance_from_file(instance_file: str) -> Dict:
             inst["orders"], inst["accounts"]
         )
 
-        # Read order data as decimal by default.
-        inst["orders"] = _order_data_to_decimal(inst["orders"])
-
         return inst
 
     except ValueError:
@@ -230,9 +288,8 @@ def read_instance_from_blockchain(contract_reader) -> Dict:
     }
 
     with open("./instance-%s.json" % batch_id, "w") as f:
-        json.dump(inst, f, indent=4)
+        json.dump(dict(inst, orders=orders.to_dicts()), f, indent=4)
 
-    inst["orders"] = _order_data_to_decimal(inst["orders"])
     return inst
 
 
@@ -310,7 +367,7 @@ def get_token_prices(prices: Dict[str, str]) -> Dict[str, Decimal]:
 
 
 def get_tokens(
-    tokens: Union[Dict[NODE_TYPE, Dict], List[NODE_TYPE]]
+    tokens: Union[Dict[NODE_TYPE, Dict], List[NODE_TYPE]],
 ) -> List[NODE_TYPE]:
     """Get list of tokens by their names.
 
@@ -332,29 +389,62 @@ def get_order_amount_scaled(amount: Decimal, token_ID: str):
     return amount / Decimal(10 ** get_token_decimals(token_ID))
 
 
-def get_nr_orders_tokenpair(orders: List[Dict]) -> Dict[EDGE_TYPE, int]:
+def _token_name_codes(orders: OrderTable) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Names of the orders' tokens and the name index of every sell and buy
+    token. Tokens sharing an alias share a name."""
+    names, name_codes = np.unique(
+        [get_token_name(t) for t in orders.tokens], return_inverse=True
+    )
+    name_codes = name_codes.reshape(-1).astype(np.intp)
+    return (
+        names.tolist(),
+        name_codes[orders.column("sellToken")],
+        name_codes[orders.column("buyToken")],
+    )
+
+
+def _count_tokenpairs(
+    names: List[str], sell_tokens: np.ndarray, buy_tokens: np.ndarray
+) -> Dict[EDGE_TYPE, int]:
+    """Number of orders on every token pair, in either direction. A pair is
+    keyed in the direction of its first order."""
+    rows, starts = group(
+        np.minimum(sell_tokens, buy_tokens), np.maximum(sell_tokens, buy_tokens)
+    )
+    counts = np.diff(np.append(starts, len(rows)))
+    return {
+        (names[sell_tokens[i]], names[buy_tokens[i]]): n
+        for i, n in zip(rows[starts].tolist(), counts.tolist())
+    }
+
+
+def _sum_by(values: np.ndarray, names: List[str], *keys: np.ndarray) -> Dict:
+    """Sums of Decimal values per token, or token pair for two keys."""
+    rows, starts = group(*keys)
+    sums = dict()
+    for lo, hi in zip(starts.tolist(), np.append(starts[1:], len(rows)).tolist()):
+        key = tuple(names[k[rows[lo]]] for k in keys)
+        # Summed in order of the orders, like the amounts were accumulated.
+        sums[key if len(keys) > 1 else key[0]] = sum(
+            values[rows[lo:hi]].tolist(), Decimal("0")
+        )
+    return sums
+
+
+def get_nr_orders_tokenpair(
+    orders: Union[OrderTable, List[Dict]],
+) -> Dict[EDGE_TYPE, int]:
     """Get the total number of orders on every token pair.
 
     Args:
-        orders: List of orders.
+        orders: Table or list of orders.
 
     Returns:
         A dict of {(t1, t2): nr_orders} containing the total number of a
         token t1 that can be traded against another token t2.
 
     """
-    nr_orders_tokenpair = dict()
-
-    for o in orders:
-        tS, tB = get_token_name(o["sellToken"]), get_token_name(o["buyToken"])
-
-        # Update number of orders on tokenpair.
-        if (tS, tB) in nr_orders_tokenpair:
-            nr_orders_tokenpair[tS, tB] += 1
-        elif (tB, tS) in nr_orders_tokenpair:
-            nr_orders_tokenpair[tB, tS] += 1
-        else:
-            nr_orders_tokenpair[tS, tB] = 1
+    nr_orders_tokenpair = _count_tokenpairs(*_token_name_codes(as_table(orders)))
 
     for (t1, t2), n in sorted(
         nr_orders_tokenpair.items(), key=lambda i: i[1], reverse=True
@@ -364,70 +454,45 @@ def get_nr_orders_tokenpair(orders: List[Dict]) -> Dict[EDGE_TYPE, int]:
     return nr_orders_tokenpair
 
 
-def get_total_traded_amounts(orders: List) -> Tuple[Dict]:
+def get_total_traded_amounts(orders: Union[OrderTable, List[Dict]]) -> Tuple[Dict]:
     """Get total traded amounts of all tokens and token pairs.
 
     Args:
-        orders: List of orders.
+        orders: Table or list of orders.
 
     Returns:
         Dictionaries with all total traded amounts.
 
     """
-    token_amounts_sold = dict()
-    token_amounts_bought = dict()
-
-    tokenpair_amounts_sold = dict()
-    tokenpair_amounts_bought = dict()
-
-    nr_exec_orders_tokenpair = dict()
-
-    for o in orders:
-        tS, tB = get_token_name(o["sellToken"]), get_token_name(o["buyToken"])
-
-        # Get executed amounts, scaled by the number of token decimals,
-        # so that they are 'real-world'numbers.
-        assert all(attr in o for attr in ["execSellAmount", "execBuyAmount"])
-        xS_exec = get_order_amount_scaled(o["execSellAmount"], o["sellToken"])
-        xB_exec = get_order_amount_scaled(o["execBuyAmount"], o["buyToken"])
-
-        if xS_exec == 0:
-            assert xB_exec == 0
-            continue
-
-        # Add tokens/token pairs to dicts, if necessary.
-        if tS not in token_amounts_sold:
-            token_amounts_sold[tS] = Decimal("0")
-
-        if tB not in token_amounts_bought:
-            token_amounts_bought[tB] = Decimal("0")
-
-        if (tS, tB) not in tokenpair_amounts_sold:
-            tokenpair_amounts_sold[(tS, tB)] = Decimal("0")
-
-        if (tB, tS) not in tokenpair_amounts_bought:
-            tokenpair_amounts_bought[(tB, tS)] = Decimal("0")
-
-        # Update traded amounts.
-        token_amounts_sold[tS] += xS_exec
-        token_amounts_bought[tB] += xB_exec
-        tokenpair_amounts_sold[tS, tB] += xS_exec
-        tokenpair_amounts_bought[tB, tS] += xB_exec
-
-        # Update number of orders on tokenpair.
-        if (tS, tB) in nr_exec_orders_tokenpair:
-            nr_exec_orders_tokenpair[tS, tB] += 1
-        elif (tB, tS) in nr_exec_orders_tokenpair:
-            nr_exec_orders_tokenpair[tB, tS] += 1
-        else:
-            nr_exec_orders_tokenpair[tS, tB] = 1
+    orders = as_table(orders)
+
+    # Skip orders that were not executed.
+    executed = orders.column("execSellAmount") != 0
+    assert not np.any(orders.column("execBuyAmount")[~executed] != 0)
+    orders = orders[executed]
+
+    # Get executed amounts, scaled by the number of token decimals,
+    # so that they are 'real-world'numbers.
+    xS_exec = int_column(
+        [
+            get_order_amount_scaled(Decimal(x), t)
+            for x, t in zip(orders.ids("execSellAmount"), orders.ids("sellToken"))
+        ]
+    )
+    xB_exec = int_column(
+        [
+            get_order_amount_scaled(Decimal(x), t)
+            for x, t in zip(orders.ids("execBuyAmount"), orders.ids("buyToken"))
+        ]
+    )
 
+    names, tS, tB = _token_name_codes(orders)
     return (
-        token_amounts_sold,
-        token_amounts_bought,
-        tokenpair_amounts_sold,
-        tokenpair_amounts_bought,
-        nr_exec_orders_tokenpair,
+        _sum_by(xS_exec, names, tS),
+        _sum_by(xB_exec, names, tB),
+        _sum_by(xS_exec, names, tS, tB),
+        _sum_by(xB_exec, names, tB, tS),
+        _count_tokenpairs(names, tS, tB),
     )
 
 